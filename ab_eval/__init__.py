@@ -2,8 +2,35 @@
 
 from __future__ import absolute_import
 
-import logging.config
+import importlib
+import logging
 
-from ab_eval.core import *
 __all__ = ["core"]
-logging.basicConfig(level=logging.DEBUG)
+
+# the library does not configure logging, that is up to the application
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+# the public classes and functions are imported on first access, so that `import ab_eval` stays cheap
+_LAZY_ATTRIBUTES = {
+    'experiment': 'ab_eval.core.experiment',
+    'experiment_state': 'ab_eval.core.experiment_state',
+    'summary_cube': 'ab_eval.core.summary_cube',
+}
+
+
+def __getattr__(name):
+    if name == 'core':
+        return importlib.import_module('ab_eval.core')
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    else:
+        core = importlib.import_module('ab_eval.core')
+        if name not in core.__all__:
+            raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+        value = getattr(core, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | {'core'})
@@ -0,0 +1,34 @@
+import importlib
+
+# the public functions of the core modules are imported on first access, so that importing the package is cheap.
+# the experiment, experiment_state and summary_cube classes share the names of their modules and are exposed by ab_eval
+_LAZY_ATTRIBUTES = {
+    'analyze_many': 'ab_eval.core.batch',
+    'result_cache': 'ab_eval.core.cache',
+    'evaluation_metrics': 'ab_eval.core.experiment_components',
+    'variations': 'ab_eval.core.experiment_components',
+    'profiler': 'ab_eval.core.instrumentation',
+    'power_grid': 'ab_eval.core.planner',
+    'sample_size_grid': 'ab_eval.core.planner',
+    'simulate_power': 'ab_eval.core.planner',
+    'simulate_experiments': 'ab_eval.core.simulation',
+    'read_experiment_export': 'ab_eval.core.loader',
+    'proportions_test': 'ab_eval.core.statistics',
+    'generate_random_cvr_data': 'ab_eval.core.utils',
+    'get_test_summary': 'ab_eval.core.utils',
+    'get_min_sample_size': 'ab_eval.core.utils',
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,186 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from ab_eval.core.experiment import experiment
+from ab_eval.core.experiment_components import variations, evaluation_metrics
+from ab_eval.core.statistics import proportions_test
+from ab_eval.core.summary_cube import summary_cube, aggregate
+
+logger = logging.getLogger(__name__)
+
+
+def analyze_many(
+        df,
+        experiment_column='experiments',
+        kpis=evaluation_metrics(kpis=["CVR"]),
+        variations=variations(),
+        segments=None,
+        alternative='two-sided',
+        significance_level=0.05,
+        date_column='date',
+        segment_column='segment',
+        analyze_segments=False,
+        historically=False,
+        date=None,
+        start_date=None,
+        window=None,
+        backend='serial',
+        n_workers=None,
+        chunk_size=100):
+    """
+    Analyzes many experiments that are stacked in one long-format dataframe. The data of all experiments are
+    aggregated with a single pass and the statistics of every chunk of chunk_size experiments are computed together.
+    It yields one result per experiment, in the sorted order of the experiment labels, as soon as the chunk of the
+    experiment is analyzed. The arguments are checked when analyze_many is called, before the iteration starts.
+
+    :param   df: the dataframe with the data of all experiments
+    :type    df: dataframe
+    :param   experiment_column: the column name that contains the experiment information
+    :type    experiment_column: string
+    :param   kpis: evaluation_metrics object that holds information about the kpis that gonna be used for the evaluation
+    :type    kpis: evaluation_metrics
+    :param   variations: variations object that holds information about the variations of the tests
+    :type    variations: variations
+    :param   segments: list of segments that will be used for a specific segment evaluation
+    :type    segments: list of strings
+    :param   alternative: the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: string
+    :param   significance_level: the significance level that should be used in the experiments
+    :type    significance_level: float
+    :param   date_column: name of the column that hold the date
+    :type    date_column: string
+    :param   segment_column: name of the column that holds the segments
+    :type    segment_column: string
+    :param   analyze_segments: True to analyze also each segment
+    :type    analyze_segments: bool
+    :param   historically: True to return the results of analyze_historically instead of analyze
+    :type    historically: bool
+    :param   date: if date is given then the analysis will happen up to that date (the end of the history if historically is True)
+    :type    date: string
+    :param   start_date: if start_date is given then the analysis will happen from that date
+    :type    start_date: string
+    :param   window: if window is given then the analysis will happen on the rolling window of that many days up to date
+    :type    window: int
+    :param   backend: 'serial' or 'process' to spread the experiments over a process pool
+    :type    backend: string
+    :param   n_workers: (optional) the number of worker processes of the 'process' backend, by default the number of cpus
+    :type    n_workers: int
+    :param   chunk_size: (optional) the number of experiments that are analyzed together, one task of the process pool
+    :type    chunk_size: int
+    :return: generator of (experiment label, results as json) tuples
+    :rtype:  generator
+    """
+    if backend not in ('serial', 'process'):
+        raise ValueError("backend should be one of 'serial' or 'process' : {}".format(backend))
+    if int(chunk_size) < 1:
+        raise ValueError("chunk_size should be a positive integer : {}".format(chunk_size))
+
+    parameters = {
+        'kpis': kpis,
+        'variations': variations,
+        'segments': segments,
+        'alternative': alternative,
+        'significance_level': significance_level,
+        'date_column': date_column,
+        'analyze_segments': analyze_segments,
+        'historically': historically,
+        'date': date,
+        'start_date': start_date,
+        'window': window
+    }
+    return _analyze_chunks(df, experiment_column, segment_column, parameters, backend, n_workers or os.cpu_count() or 1, int(chunk_size))
+
+
+def _analyze_chunks(df, experiment_column, segment_column, parameters, backend, n_workers, chunk_size):
+    kpis = parameters['kpis']
+    cubes = _split_cubes(df, experiment_column, kpis.get_kpis(), parameters['variations'].get_column_name(), segment_column,
+                         parameters['date_column'], continuous_kpis=kpis.get_continuous_kpis())
+    chunks = _chunks(cubes, chunk_size)
+    logger.debug('Analyzing experiments in chunks of {} with the {} backend.'.format(chunk_size, backend))
+
+    if backend == 'serial':
+        for chunk in chunks:
+            for result in _analyze_cubes(chunk, parameters):
+                yield result
+        return
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        # the results of every chunk are yielded in order, as soon as the chunk and the ones before it are done
+        futures = [executor.submit(_analyze_cubes, chunk, parameters) for chunk in chunks]
+        for future in futures:
+            for result in future.result():
+                yield result
+
+
+def _chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _split_cubes(df, experiment_column, kpis, variations_column, segment_column, date_column, continuous_kpis=None):
+    """
+    Aggregates all experiments with one pass and yields an (experiment label, summary cube) tuple per experiment.
+    The date axis of every cube holds only the dates of its experiment, in the order that they appear in the data.
+    """
+    converted, sample_size, sum_sq, labels, codes, kpis = aggregate(
+        df, kpis, [experiment_column, variations_column, segment_column, date_column], date_column=date_column,
+        continuous_kpis=continuous_kpis)
+    experiments, groups, segments, dates = labels
+    experiment_codes, date_codes = codes[0], codes[3]
+
+    # the dates of every experiment and the position where each one first appears in the data
+    valid = (experiment_codes >= 0) & (date_codes >= 0)
+    pairs, first_seen = np.unique(experiment_codes[valid].astype(np.intp) * len(dates) + date_codes[valid], return_index=True)
+    pair_experiments, pair_dates = np.divmod(pairs, len(dates))
+    bounds = np.searchsorted(pair_experiments, np.arange(len(experiments) + 1))
+
+    dates = np.asarray(dates, dtype=object)
+    for e, label in enumerate(experiments):
+        experiment_dates = pair_dates[bounds[e]:bounds[e + 1]]
+        date_order = np.argsort(first_seen[bounds[e]:bounds[e + 1]], kind='mergesort')
+        yield label, summary_cube(converted[e][:, :, experiment_dates], sample_size[e][:, :, experiment_dates],
+                                  groups=groups, segments=segments, dates=dates[experiment_dates], kpis=kpis,
+                                  date_order=date_order, segment_column=segment_column,
+                                  sum_sq=None if sum_sq is None else sum_sq[e][:, :, experiment_dates], continuous_kpis=continuous_kpis)
+
+
+def _analyze_cubes(cubes, parameters):
+    parameters = dict(parameters)
+    analyze_segments = parameters.pop('analyze_segments')
+    historically = parameters.pop('historically')
+    date = parameters.pop('date')
+    start_date = parameters.pop('start_date')
+    window = parameters.pop('window')
+
+    experiments = [(label, experiment.from_cube(cube, **parameters)) for label, cube in cubes]
+    if not experiments:
+        return []
+    if historically:
+        return [(label, exp.analyze_historically(analyze_segments=analyze_segments, start_date=start_date, end_date=date, window=window))
+                for label, exp in experiments]
+    if parameters['kpis'].get_continuous_kpis():
+        # continuous kpis are evaluated by their own kernel, experiment by experiment
+        return [(label, exp.analyze(analyze_segments=analyze_segments, date=date, start_date=start_date, window=window))
+                for label, exp in experiments]
+
+    # the statistics of all experiments are computed with one call of the kernel
+    units = [exp._get_units(None, analyze_segments) for _, exp in experiments]
+    counts = [exp._get_units_counts(exp_units, date, start_date=start_date, window=window) for exp_units, (_, exp) in zip(units, experiments)]
+    batch = tuple(np.concatenate(column) for column in zip(*counts))
+    stats = proportions_test(*batch, alternative=parameters['alternative'], significance_level=parameters['significance_level'])
+
+    results = []
+    offset = 0
+    for exp_units, exp_counts, (label, exp) in zip(units, counts, experiments):
+        selection = slice(offset, offset + len(exp_units))
+        summaries = exp._report(exp_counts, {key: values[selection] for key, values in stats.items()})
+        results.append((label, exp._analysis_results(exp_units, summaries)))
+        offset += len(exp_units)
+    return results
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from ab_eval.core.summary_cube import as_columns
+
+logger = logging.getLogger(__name__)
+
+
+class result_cache(object):
+    """
+    Class that caches the results of analyses in a bounded in-memory LRU and, optionally, in a directory on disk that is
+    shared between processes and runs. The keys are tuples that start with the fingerprint of the data (see fingerprint),
+    so results of changed data are never returned.
+    :param max_entries: the maximum number of results kept in memory, the least recently used are dropped first
+    :type  max_entries: int
+    :param path: (optional) the directory of the on-disk store. Results are kept in memory only if it is not set
+    :type  path: string
+    """
+    def __init__(
+            self,
+            max_entries=1024,
+            path=None,
+            *args, **kwargs):
+        super(result_cache, self).__init__(*args, **kwargs)
+        if max_entries < 1:
+            raise ValueError("max_entries should be a positive number : {}".format(max_entries))
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def get(self, key, default=None):
+        """
+        Returns the cached result of a key, from memory or else from the disk
+        :param   key: the key of the result
+        :type    key: tuple
+        :param   default: the value to return if the key is not cached
+        :type    default: object
+        :return: the result
+        :rtype:  object
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        value = self._load(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        if self.path is not None:
+            self._dump(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or (self.path is not None and os.path.exists(self._file(key)))
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _file(self, key):
+        return os.path.join(self.path, '{}.pkl'.format(hashlib.sha1(repr(key).encode('utf-8')).hexdigest()))
+
+    def _load(self, key):
+        if self.path is None:
+            return None
+        try:
+            with open(self._file(key), 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # the file name is a digest of the key, the stored key guards against collisions
+        return value if stored_key == key else None
+
+    def _dump(self, key, value):
+        # write to a temporary file first, so that concurrent readers never see a partial result
+        handle, temporary = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._file(key))
+        except OSError:
+            logger.warning('Could not store a result in the cache directory {}.'.format(self.path))
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+
+def fingerprint(data):
+    """
+    Returns a digest of the content of a dataframe or of a summary cube. Numeric columns and the codes of categorical
+    columns are hashed as raw bytes, object columns with pandas' vectorized hashing, and cubes by their (small) arrays
+    and labels, so any change of the data changes the fingerprint.
+    :param   data: the data
+    :type    data: dataframe, dict of arrays, numpy structured array or summary_cube
+    :return: the hex digest
+    :rtype:  string
+    """
+    digest = hashlib.sha1()
+    if hasattr(data, 'sample_size') and hasattr(data, 'groups'):
+        # a summary cube
+        for array in (data.converted, data.sample_size, data.sum_sq):
+            if array is not None:
+                digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(repr((data.groups, data.segments, list(data.dates), data.kpis, list(data.date_order),
+                            data.segment_column, data.continuous_kpis)).encode('utf-8'))
+        return digest.hexdigest()
+
+    columns, n_rows = as_columns(data)
+    names = list(columns.columns if isinstance(columns, pd.DataFrame) else columns)
+    digest.update(repr((names, [str(columns[name].dtype) for name in names], (n_rows, len(names)))).encode('utf-8'))
+    for column in names:
+        series = columns[column]
+        if isinstance(series, pd.Categorical):
+            series = pd.Series(series)
+        if hasattr(series, 'cat'):
+            digest.update(np.ascontiguousarray(series.cat.codes.values).tobytes())
+            digest.update(pd.util.hash_array(np.asarray(series.cat.categories, dtype=object)).tobytes())
+            continue
+        values = np.asarray(series)
+        if values.dtype == object:
+            digest.update(pd.util.hash_array(values).tobytes())
+        else:
+            digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
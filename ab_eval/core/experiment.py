@@ -1,19 +1,60 @@
 import simplejson
+import copy
+import functools
+import inspect
 import json
 import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from ab_eval.core.cache import fingerprint
+from ab_eval.core.instrumentation import profiler as analysis_profiler, NULL_SPAN
+from ab_eval.core.loader import read_experiment_cube
 from ab_eval.core.experiment_components import variations, evaluation_metrics
-from ab_eval.core.utils import get_test_summary, get_standard_error, get_z_val, get_standard_deviation
-import statsmodels.api as sm
+from ab_eval.core.summary_cube import summary_cube, as_columns
+from ab_eval.core.statistics import (adjust_p_values, beta_binomial_test, bootstrap_days, bootstrap_proportions, proportions_test,
+                                     sample_ratio_test, welch_test)
 import numpy as np
+import pandas as pd
 
 logger = logging.getLogger(__name__)
 
 
+def _cached(method):
+    """Decorator that reads the results of a method from the cache of the experiment, if it has one"""
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def cached_method(self, *args, **kwargs):
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+        arguments = signature.bind(self, *args, **kwargs)
+        arguments.apply_defaults()
+        key = self._cache_key(method.__name__, {name: value for name, value in arguments.arguments.items() if name != 'self'})
+        result = self.cache.get(key, _MISSING)
+        if result is _MISSING:
+            result = method(self, *args, **kwargs)
+            self.cache.set(key, result)
+        # the getters return dicts, the callers get their own copy
+        return copy.deepcopy(result)
+    return cached_method
+
+
+_MISSING = object()
+
+
+def _hashable(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
 class experiment(object):
     """
     Class that defines an experiment and all its characteristics
-    :param data: the dataframe with data.
-    :type  data: dataframe.
+    :param data: the dataframe with data. A dict of arrays or a numpy structured array with the same columns is used
+                 directly, without building a dataframe. The data are neither copied nor modified.
+    :type  data: dataframe, dict of arrays or numpy structured array
     :param kpis: evaluation_metrics object that holds information about the kpis that gonna be used for the evaluation.
     :type  kpis: evaluation_metrics
     :param variations: variations object that holds information about the variations of the test.
@@ -24,6 +65,29 @@ class experiment(object):
     :type  significance_level: float
     :param   date_column: name of the column that hold the date
     :type    date_column: string
+    :param   segment_column: name of the column that holds the segments analyzed by analyze and analyze_historically, or a
+                             list of columns whose crossings are the segments, with a tuple of values per segment
+    :type    segment_column: string or list of strings
+    :param   profiler: (optional) profiler that records the timings of the analysis stages, see instrument
+    :type    profiler: ab_eval.core.instrumentation.profiler
+    :param   sessions: True if data has one row per session with '<kpi>_converted' columns and no sample sizes
+    :type    sessions: bool
+    :param   backend: how analyze and analyze_historically run their (kpi, segment) units: 'serial', 'thread' for a thread
+                      pool, 'process' for a process pool, or an existing concurrent.futures executor. The results are
+                      merged in the order of the units, so the output is identical to the serial one
+    :type    backend: string or concurrent.futures.Executor
+    :param   n_workers: (optional) the number of workers of the 'thread' and 'process' backends, by default the number of cpus
+    :type    n_workers: int
+    :param   cache: (optional) cache of the results of analyze, analyze_historically and the getters. The results are keyed
+                    by the fingerprint of the data and all the arguments and settings that they depend on. The data are
+                    fingerprinted once, so like the summary cube they should not be modified after the experiment is built
+    :type    cache: ab_eval.core.cache.result_cache
+    :param   bayesian: (optional) True to add to the summaries of the conversion kpis a 'bayesian' entry with the probability
+                       of the variation to beat the control and the expected losses of choosing each group, computed from
+                       their Beta-Binomial posteriors, see statistics.beta_binomial_test
+    :type    bayesian: bool
+    :param   prior: (optional) the alpha and beta parameters of the Beta prior of the conversion rates of both groups
+    :type    prior: tuple
     """
     def __init__(
             self,
@@ -34,26 +98,185 @@ class experiment(object):
             alternative='two-sided',
             significance_level=0.05,
             date_column='date',
+            segment_column='segment',
+            profiler=None,
+            sessions=False,
+            backend='serial',
+            n_workers=None,
+            cache=None,
+            bayesian=False,
+            prior=(1, 1),
             *args, **kwargs):
         super(experiment, self).__init__(*args, **kwargs)
-        self.data = experiment.transform_date_column(data, date_column)
+        if backend not in ('serial', 'thread', 'process') and not isinstance(backend, Executor):
+            raise ValueError("backend should be one of 'serial', 'thread', 'process' or an executor : {}".format(backend))
+        # the data are not copied nor modified, the dates are encoded when the summary cube is built
+        self.data = data
         self.kpis = kpis
         self.variations = variations
-        self.segments = segments
+        # json has no tuples, the labels of crossed segments are restored from lists
+        self.segments = segments if segments is None else [tuple(segment) if isinstance(segment, list) else segment for segment in segments]
         self.alternative = alternative
         self.date_column = date_column
+        # a list of columns segments by their crossing, see summary_cube
+        self.segment_column = tuple(segment_column) if isinstance(segment_column, list) else segment_column
         if significance_level > 1:
             raise ValueError("significance_level should be >0 and <1 : {}")
         self.significance_level = significance_level
+        self.profiler = profiler
+        self.sessions = sessions
+        self.backend = backend
+        self.n_workers = n_workers
+        self.cache = cache
+        self.bayesian = bayesian
+        self.prior = tuple(prior)
+        self._fingerprint = None
+        self._cubes = {}
+
+    @classmethod
+    def from_cube(cls, cube, *args, **kwargs):
+        """
+        Builds an experiment directly from an aggregated summary cube, without the raw data
+        :param   cube: the summary cube of the experiment
+        :type    cube: summary_cube
+        :return: the experiment
+        :rtype:  experiment
+        """
+        kwargs.setdefault('segment_column', cube.segment_column)
+        exp = cls(None, *args, **kwargs)
+        exp._cubes[cube.segment_column] = cube
+        return exp
+
+    @classmethod
+    def from_store(cls, path, *args, **kwargs):
+        """
+        Builds an experiment from a summary cube store (see summary_cube.save). The store is memory mapped, so the
+        workers that analyze the same experiment share a single copy of its aggregates
+        :param   path: the directory of the store
+        :type    path: string
+        :return: the experiment
+        :rtype:  experiment
+        """
+        return cls.from_cube(summary_cube.load(path), *args, **kwargs)
+
+    @classmethod
+    def from_export(cls, path_or_buf, chunksize=100000, format='json', filters=None, **kwargs):
+        """
+        Builds an experiment from an export that can be larger than the memory, see loader.read_experiment_cube.
+        The export is folded chunk by chunk into the summary cube of the experiment and the rows are not kept.
+        :param   path_or_buf: the path or the buffer of the export
+        :type    path_or_buf: string or file
+        :param   chunksize: (optional) the number of lines of every chunk
+        :type    chunksize: int
+        :param   format: (optional) 'json' for newline-delimited JSON or 'csv'
+        :type    format: string
+        :param   filters: (optional) the rows to keep as {column: value}, e.g. the experiment of a multi-experiment export
+        :type    filters: dict
+        :param   kwargs: the arguments of the experiment
+        :type    kwargs: dict
+        :return: the experiment
+        :rtype:  experiment
+        """
+        exp = cls(None, **kwargs)
+        with exp._span('aggregation', segment_column=exp.segment_column):
+            exp._cubes[exp.segment_column] = read_experiment_cube(
+                path_or_buf, kpis=exp.get_expirement_kpis(), variations_column=exp.variations.get_column_name(),
+                segment_column=exp.segment_column, date_column=exp.date_column, sessions=exp.sessions,
+                continuous_kpis=exp.kpis.get_continuous_kpis(), filters=filters, chunksize=chunksize, format=format)
+        return exp
 
     @staticmethod
     def transform_date_column(df, date_column):
-        df[date_column] = df[date_column].astype(str)
-        return df
+        return df.assign(**{date_column: df[date_column].astype(str)})
 
     def get_data(self):
         return self.data
 
+    @contextmanager
+    def instrument(self, profiler=None):
+        """
+        Context manager that records the wall time and the call count of every analysis stage (filtering,
+        aggregation, statistics, report and serialization) while it is active.
+
+            with exp.instrument() as prof:
+                exp.analyze_historically()
+            prof.to_dict()
+
+        :param   profiler: (optional) the profiler to record to. A new one is created if it is not set
+        :type    profiler: ab_eval.core.instrumentation.profiler
+        :return: the profiler
+        :rtype:  ab_eval.core.instrumentation.profiler
+        """
+        previous = self.profiler
+        self.profiler = analysis_profiler() if profiler is None else profiler
+        try:
+            yield self.profiler
+        finally:
+            self.profiler = previous
+
+    def _span(self, stage, **tags):
+        # the instrumentation costs a single attribute check when it is disabled
+        if self.profiler is None:
+            return NULL_SPAN
+        return self.profiler.span(stage, **tags)
+
+    def get_cube(self, segment_column='segment'):
+        """
+        Returns the group x segment x date x KPI summary cube of the experiment. The cube is built on first use
+        and every metric of the experiment is read from it, so the data are aggregated only once.
+        :param   segment_column: the column name that contains the segment information
+        :type    segment_column: str
+        :return: the summary cube
+        :rtype:  summary_cube
+        """
+        cube = self._cubes.get(segment_column)
+        if cube is None:
+            if self.data is None:
+                raise ValueError("The experiment has no data to aggregate on segment column: {}".format(segment_column))
+            with self._span('aggregation', segment_column=segment_column):
+                cube = summary_cube.from_dataframe(self.data, kpis=self.get_expirement_kpis(),
+                                                   variations_column=self.variations.get_column_name(),
+                                                   segment_column=segment_column, date_column=self.date_column,
+                                                   sessions=self.sessions, continuous_kpis=self.kpis.get_continuous_kpis())
+            self._cubes[segment_column] = cube
+        return cube
+
+    def get_fingerprint(self):
+        """
+        Returns the fingerprint of the data of the experiment (or of its summary cube if it has no data), computed once
+        :return: the hex digest
+        :rtype:  string
+        """
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.data if self.data is not None else self._cubes[self.segment_column])
+        return self._fingerprint
+
+    def _cache_key(self, method, arguments):
+        settings = (self.kpis.get_kpis(), self.kpis.get_continuous_kpis(), self.variations.get_column_name(),
+                    self.variations.get_control_label(), self.variations.get_variation_labels(), self.segments, self.alternative,
+                    self.significance_level, self.date_column, self.segment_column, self.sessions, self.bayesian, self.prior)
+        return (self.get_fingerprint(), method) + _hashable(settings) + _hashable(sorted(arguments.items()))
+
+    def memory_usage(self, deep=False):
+        """
+        Returns the memory footprint of the experiment. The data are referenced and not copied, so their bytes are
+        shared with the caller, and the internal state of the experiment is its summary cubes, whose size depends
+        on the number of cells and not on the number of rows
+        :param   deep: (optional) True to count the strings of the object columns of the data too
+        :type    deep: bool
+        :return: the bytes of the data, of the cubes and their total
+        :rtype:  dict
+        """
+        if self.data is None:
+            data = 0
+        elif isinstance(self.data, pd.DataFrame):
+            data = int(self.data.memory_usage(index=True, deep=deep).sum())
+        else:
+            columns, _ = as_columns(self.data)
+            data = int(sum(pd.Series(columns[name]).memory_usage(index=False, deep=deep) for name in columns))
+        cubes = sum(cube.memory_usage() for cube in self._cubes.values())
+        return {'data': data, 'cubes': cubes, 'total': data + cubes}
+
     def get_expirement_kpis(self):
         return self.kpis.get_kpis()
 
@@ -66,7 +289,121 @@ class experiment(object):
     def get_experiment_variations(self):
         return json.dumps({'control_label': self.variations.get_control_label(), 'variation_label': self.variations.get_control_label()})
 
-    def get_p_val(self, kpi='CVR', segment=None, segment_column='segment', date=None):
+    def _check_kpi(self, kpi):
+        if kpi not in self.get_expirement_kpis():
+            raise ValueError("Please use a valid KPI. this can be one of the followings: {}"
+                             .format(self.get_expirement_kpis()))
+
+    def _get_test_counts(self, kpi, segment, segment_column, date, start_date=None, window=None):
+        # (conversions, sample size) of variation and control, or (sum, count, sum of squares) for continuous kpis
+        cube = self.get_cube(segment_column)
+        with self._span('filtering', kpi=kpi, segment=segment, date=date):
+            variation, control = cube.get_group_counts(
+                kpi, [self.variations.variation_label, self.variations.control_label], segment=segment, date=date,
+                start_date=start_date, window=window, sum_sq=self.kpis.is_continuous(kpi))
+        return variation + control
+
+    def _get_history_counts(self, kpi, segment, segment_column, positions, start_date=None, window=None, cumulative=True):
+        cube = self.get_cube(segment_column)
+        with self._span('filtering', kpi=kpi, segment=segment, date='history'):
+            variation, control = cube.get_group_history_counts(
+                kpi, [self.variations.variation_label, self.variations.control_label], positions, segment=segment,
+                start_date=start_date, window=window, cumulative=cumulative, sum_sq=self.kpis.is_continuous(kpi))
+        return variation + control
+
+    def _get_test_statistics(self, statistic, kpi, segment, segment_column, date, start_date=None, window=None):
+        counts = self._get_test_counts(kpi, segment, segment_column, date, start_date=start_date, window=window)
+        kernel = welch_test if self.kpis.is_continuous(kpi) else proportions_test
+        with self._span('statistics', statistic=statistic, kpi=kpi, segment=segment, date=date):
+            return kernel(*counts, alternative=self.alternative, significance_level=self.significance_level)
+
+    def _evaluate(self, counts, continuous=False):
+        """
+        Evaluates a batch of comparisons with one call of the statistics kernel
+        :param   counts: conversions and sample sizes of variation and control, one element per comparison. For continuous
+                         kpis the sums, counts and sums of squares of variation and control
+        :type    counts: tuple of 4 (6 for continuous kpis) numpy arrays
+        :param   continuous: True if the comparisons are of continuous kpis
+        :type    continuous: bool
+        :return: the summary of every comparison
+        :rtype:  list of dicts
+        """
+        kernel = welch_test if continuous else proportions_test
+        with self._span('statistics', statistic='all', cells=len(counts[0])):
+            stats = kernel(*counts, alternative=self.alternative, significance_level=self.significance_level)
+        posteriors = None
+        if self.bayesian and not continuous:
+            with self._span('bayesian', cells=len(counts[0])):
+                posteriors = beta_binomial_test(*counts, prior=self.prior)
+        with self._span('report', cells=len(counts[0])):
+            return self._report_continuous(counts, stats) if continuous else self._report(counts, stats, posteriors)
+
+    def _report(self, counts, stats, posteriors=None):
+        conv_variation, n_variation, conv_control, n_control = counts
+        summaries = [{
+            "test": {"z-score": stats['z-score'][i], 'p-value': stats['p-value'][i]},
+            "relative_conversion_uplift": stats['relative_conversion_uplift'][i],
+            # the standard errors are reported under the keys that get_standard_errors_of_test has always used
+            "standard_errors": {"control_standard_error": stats['variation_standard_error'][i],
+                                "variation_standard_error": stats['control_standard_error'][i]},
+            "confidence_interval": {"lower_limit": stats['lower_limit'][i], "upper_limit": stats['upper_limit'][i]},
+            "volumes": self._volumes(conv_variation[i], n_variation[i], conv_control[i], n_control[i])
+        } for i in range(len(stats['z-score']))]
+        if posteriors is not None:
+            for i, summary in enumerate(summaries):
+                summary["bayesian"] = {
+                    "probability_to_beat_control": posteriors['probability_to_beat_control'][i],
+                    "expected_loss": {"variation": posteriors['expected_loss_variation'][i],
+                                      "control": posteriors['expected_loss_control'][i]},
+                    "posterior_mean": {"variation": posteriors['variation_posterior_mean'][i],
+                                       "control": posteriors['control_posterior_mean'][i]}
+                }
+        return summaries
+
+    def _report_continuous(self, counts, stats):
+        return [{
+            "test": {"t-score": stats['t-score'][i], 'degrees_of_freedom': stats['degrees_of_freedom'][i], 'p-value': stats['p-value'][i]},
+            "relative_uplift": stats['relative_uplift'][i],
+            "standard_errors": {"variation_standard_error": stats['variation_standard_error'][i],
+                                "control_standard_error": stats['control_standard_error'][i]},
+            "confidence_interval": {"lower_limit": stats['lower_limit'][i], "upper_limit": stats['upper_limit'][i]},
+            "volumes": self._continuous_volumes(*[column[i] for column in counts])
+        } for i in range(len(stats['t-score']))]
+
+    def _volumes(self, conv_variation, n_variation, conv_control, n_control):
+        return {
+            'variation':
+                {
+                    "label":
+                        self.variations.variation_label,
+                    "sessions":
+                        float(n_variation),
+                    'conversions':
+                        float(conv_variation)
+                },
+            'control':
+                {
+                    "label":
+                        self.variations.control_label,
+                    "sessions":
+                        float(n_control),
+                    'conversions':
+                        float(conv_control)
+                }
+        }
+
+    def _continuous_volumes(self, sum_variation, n_variation, sum_sq_variation, sum_control, n_control, sum_sq_control):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'variation': {"label": self.variations.variation_label, "count": float(n_variation), 'sum': float(sum_variation),
+                              'mean': float(np.float64(sum_variation) / n_variation)},
+                'control': {"label": self.variations.control_label, "count": float(n_control), 'sum': float(sum_control),
+                            'mean': float(np.float64(sum_control) / n_control)}
+            }
+
+    @_cached
+    def get_p_val(self, kpi='CVR', segment=None, segment_column='segment', date=None, start_date=None, end_date=None,
+                  window=None):
         """Method that calculates the p-value for a given dataset and KPI
 
 
@@ -80,30 +417,27 @@ class experiment(object):
         :type    variation_column
         :param   date: if date is given (format '%Y%m%d') then the check will happen up to that date
         :type    date: string ('%Y%m%d')
+        :param   start_date: if start_date is given then the check will happen from that date
+        :type    start_date: string
+        :param   end_date: same as date, the last date of the check
+        :type    end_date: string
+        :param   window: if window is given then the check will happen on the rolling window of that many days up to date
+        :type    window: int
         :return: the p value
         :rtype:  dict
 
         """
 
-        if kpi not in self.get_expirement_kpis():
-            raise ValueError("Please use a valid KPI. this can be one of the followings: {}"
-                             .format_map(self.get_expirement_kpis()))
-
-        if date is None:
-            df_summary = get_test_summary(self.data, kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
-        else:
-            df_summary = get_test_summary(self.data[self.data[self.date_column] <= date], kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
-
-        zscore, pval = sm.stats.proportions_ztest([df_summary[kpi][self.variations.variation_label], df_summary[kpi][self.variations.control_label]],
-                                                  [df_summary['total'][self.variations.variation_label],
-                                                  df_summary['total'][self.variations.control_label]],
-                                                  alternative=self.alternative)
+        self._check_kpi(kpi)
 
-        return {"z-score": zscore, 'p-value': pval}
+        stats = self._get_test_statistics('p-value', kpi, segment, segment_column, _end_date(date, end_date), start_date, window)
+        if self.kpis.is_continuous(kpi):
+            return {"t-score": stats['t-score'][()], 'p-value': stats['p-value'][()]}
+        return {"z-score": stats['z-score'][()], 'p-value': stats['p-value'][()]}
 
-    def get_relative_conversion_uplift(self, kpi='CVR', segment=None, segment_column='segment', date=None):
+    @_cached
+    def get_relative_conversion_uplift(self, kpi='CVR', segment=None, segment_column='segment', date=None, start_date=None, end_date=None,
+                                       window=None):
         """Method that calculates the relative conversion_uplift
 
         :param   kpi: the KPI that should be used
@@ -116,24 +450,24 @@ class experiment(object):
         :type    variation_column
         :param   date: if date is given (format '%Y%m%d') then the check will happen up to that date
         :type    date: string ('%Y%m%d')
+        :param   start_date: if start_date is given then the check will happen from that date
+        :type    start_date: string
+        :param   end_date: same as date, the last date of the check
+        :type    end_date: string
+        :param   window: if window is given then the check will happen on the rolling window of that many days up to date
+        :type    window: int
         :return: the relative conversion uplift
         :rtype:  float
         """
-        if kpi not in self.get_expirement_kpis():
-            raise ValueError("Please use a valid KPI. this can be one of the followings: {}"
-                             .format_map(self.get_expirement_kpis()))
-
-        if date is None:
-            df_summary = get_test_summary(self.data, kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
-        else:
-            df_summary = get_test_summary(self.data[self.data[self.date_column] <= date], kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
+        self._check_kpi(kpi)
 
-        return (df_summary['rate'][self.variations.variation_label] - df_summary['rate'][self.variations.control_label]) / \
-                df_summary['rate'][self.variations.control_label]
+        stats = self._get_test_statistics('relative_conversion_uplift', kpi, segment, segment_column, _end_date(date, end_date),
+                                          start_date, window)
+        return stats['relative_uplift' if self.kpis.is_continuous(kpi) else 'relative_conversion_uplift'][()]
 
-    def get_standard_errors_of_test(self, kpi='CVR', segment=None, segment_column='segment', date=None):
+    @_cached
+    def get_standard_errors_of_test(self, kpi='CVR', segment=None, segment_column='segment', date=None, start_date=None, end_date=None,
+                                    window=None):
         """
         This method is calculating the standard error for variation and control and returns a dict where the first
         element as the standard error of control and the second as the standard error of variation
@@ -148,26 +482,28 @@ class experiment(object):
         :type    variation_column
         :param   date: if date is given (format '%Y%m%d') then the check will happen up to that date
         :type    date: string ('%Y%m%d')
+        :param   start_date: if start_date is given then the check will happen from that date
+        :type    start_date: string
+        :param   end_date: same as date, the last date of the check
+        :type    end_date: string
+        :param   window: if window is given then the check will happen on the rolling window of that many days up to date
+        :type    window: int
         :return: standard error for variation and control
         :rtype:  dict
         """
-        if kpi not in self.get_expirement_kpis():
-            raise ValueError("Please use a valid KPI. this can be one of the followings: {}"
-                             .format_map(self.get_expirement_kpis()))
+        self._check_kpi(kpi)
 
-        if date is None:
-            df_summary = get_test_summary(self.data, kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
-        else:
-            df_summary = get_test_summary(self.data[self.data[self.date_column] <= date], kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
-
-        return {"control_standard_error": get_standard_error(df_summary['rate'][self.variations.variation_label],
-                                                             df_summary['total'][self.variations.variation_label]),
-                "variation_standard_error": get_standard_error(df_summary['rate'][self.variations.control_label],
-                                                               df_summary['total'][self.variations.control_label])}
+        stats = self._get_test_statistics('standard_errors', kpi, segment, segment_column, _end_date(date, end_date), start_date,
+                                          window)
+        if self.kpis.is_continuous(kpi):
+            return {"control_standard_error": stats['control_standard_error'][()],
+                    "variation_standard_error": stats['variation_standard_error'][()]}
+        return {"control_standard_error": stats['variation_standard_error'][()],
+                "variation_standard_error": stats['control_standard_error'][()]}
 
-    def get_summary(self, kpi='CVR', segment=None, segment_column='segment', date=None):
+    @_cached
+    def get_summary(self, kpi='CVR', segment=None, segment_column='segment', date=None, start_date=None, end_date=None,
+                    window=None):
         """Method that calculates the p-value for a given dataset and KPI
 
 
@@ -181,46 +517,29 @@ class experiment(object):
         :type    variation_column
         :param   date: if date is given (format '%Y%m%d') then the check will happen up to that date
         :type    date: string ('%Y%m%d')
+        :param   start_date: if start_date is given then the check will happen from that date
+        :type    start_date: string
+        :param   end_date: same as date, the last date of the check
+        :type    end_date: string
+        :param   window: if window is given then the check will happen on the rolling window of that many days up to date
+        :type    window: int
         :return: the p value
         :rtype:  dict
 
         """
 
-        if kpi not in self.get_expirement_kpis():
-            raise ValueError("Please use a valid KPI. this can be one of the followings: {}"
-                             .format_map(self.get_expirement_kpis()))
-
-        if date is None:
-            df_summary = get_test_summary(self.data, kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
-        else:
-            df_summary = get_test_summary(self.data[self.data[self.date_column] <= date], kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
+        self._check_kpi(kpi)
 
-        return {
-            'variation':
-                {
-                    "label":
-                        self.variations.variation_label,
-                    "sessions":
-                        float(df_summary['total'][self.variations.variation_label]),
-                    'conversions':
-                        float(df_summary[kpi][self.variations.variation_label])
-                },
-            'control':
-                {
-                    "label":
-                        self.variations.control_label,
-                    "sessions":
-                        float(df_summary['total'][self.variations.control_label]),
-                    'conversions':
-                        float(df_summary[kpi][self.variations.control_label])
-                }
-        }
+        counts = self._get_test_counts(kpi, segment, segment_column, _end_date(date, end_date), start_date, window)
+        return self._continuous_volumes(*counts) if self.kpis.is_continuous(kpi) else self._volumes(*counts)
 
-    def get_confidence_interval_of_test(self, kpi='CVR', segment=None, segment_column='segment', date=None):
+    @_cached
+    def get_confidence_interval_of_test(self, kpi='CVR', segment=None, segment_column='segment', date=None, start_date=None, end_date=None,
+                                        window=None, method='normal', n_resamples=10000, seed=0):
         """
         This method returns the confidence_interval of test as dict. http://onlinestatbook.com/2/estimation/difference_means.html
+        With method 'sessions' or 'days' it is the bootstrap confidence interval of the relative uplift, see
+        bootstrap_confidence_intervals
         :param   kpi: the KPI that should be used
         :type    kpi: str
         :param   segment: the segment that should be used
@@ -231,158 +550,504 @@ class experiment(object):
         :type    variation_column
         :param   date: if date is given (format '%Y%m%d') then the check will happen up to that date
         :type    date: string ('%Y%m%d')
+        :param   start_date: if start_date is given then the check will happen from that date
+        :type    start_date: string
+        :param   end_date: same as date, the last date of the check
+        :type    end_date: string
+        :param   window: if window is given then the check will happen on the rolling window of that many days up to date
+        :type    window: int
+        :param   method: (optional) 'normal' for the normal approximation, 'sessions' or 'days' for the bootstrap
+        :type    method: str
+        :param   n_resamples: (optional) the number of bootstrap resamples
+        :type    n_resamples: int
+        :param   seed: (optional) the seed of the bootstrap resamples
+        :type    seed: int
         :return: confidence_interval of the test summary as a tuple
         :rtype:  json
         """
 
-        if kpi not in self.get_expirement_kpis():
-            raise ValueError("Please use a valid KPI. this can be one of the followings: {}"
-                             .format_map(self.get_expirement_kpis()))
+        self._check_kpi(kpi)
 
-        if date is None:
-            df_summary = get_test_summary(self.data, kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
-        else:
-            df_summary = get_test_summary(self.data[self.data[self.date_column] <= date], kpi=kpi, segment=segment, segment_column=segment_column,
-                                          variations_column=self.variations.get_column_name())
-
-        M1 = df_summary['rate'][self.variations.variation_label]
-        M2 = df_summary['rate'][self.variations.control_label]
-        N1 = df_summary['total'][self.variations.variation_label]
-        N2 = df_summary['total'][self.variations.control_label]
-        z = get_z_val(sig_level=self.significance_level, two_tailed=True if self.alternative == 'two-sided' else False)
-        std1 = get_standard_deviation(M1)
-        std2 = get_standard_deviation(M2)
-        Sm1_m2 = np.sqrt(((N1 - 1) * pow(std1, 2) + (N2 - 1) * pow(std2, 2)) / (N1 + N2 - 2))
-        SE1_2 = Sm1_m2 * (np.sqrt(1 / N1 + 1 / N2))
-        uplift = self.get_relative_conversion_uplift(kpi=kpi, segment=segment, segment_column=segment_column, date=date)
-        return {"lower_limit": uplift - (z * SE1_2), "upper_limit": uplift + (z * SE1_2)}
-
-    def analyze(self, kpis=None, analyze_segments=False, date=None):
+        if method != 'normal':
+            stats = self._bootstrap([(kpi, segment)], segment_column, _end_date(date, end_date), start_date, window, method,
+                                    n_resamples, seed)
+            return {"lower_limit": stats['lower_limit'][0], "upper_limit": stats['upper_limit'][0]}
+        stats = self._get_test_statistics('confidence_interval', kpi, segment, segment_column, _end_date(date, end_date),
+                                          start_date, window)
+        return {"lower_limit": stats['lower_limit'][()], "upper_limit": stats['upper_limit'][()]}
+
+    @_cached
+    def bootstrap_confidence_intervals(self, kpis=None, analyze_segments=False, date=None, start_date=None, end_date=None, window=None,
+                                       method='sessions', n_resamples=10000, seed=0):
+        """
+        Bootstrap confidence intervals of the relative uplift of every kpi (and segment), that unlike the normal
+        approximation of analyze follow the skew of small segments and of skewed metrics. The comparisons are resampled
+        at once, in chunks of resamples that run in a thread pool unless the backend is serial, and the intervals do not
+        depend on the backend.
+        :param   kpis: The kpis that needs to evaluate if null it evaluates all
+        :type    kpis: list
+        :param   analyze_segments: True to evaluate also each segment
+        :type    analyze_segments: bool
+        :param   date: if date is given then the evaluation will happen up to that date
+        :type    date: string
+        :param   start_date: if start_date is given then the evaluation will happen from that date
+        :type    start_date: string
+        :param   end_date: same as date, the last date of the evaluation
+        :type    end_date: string
+        :param   window: if window is given then the evaluation will happen on the rolling window of that many days up to date
+        :type    window: int
+        :param   method: (optional) 'sessions' to resample the sessions of every group (conversion kpis only) or 'days'
+                         to resample the days of the experiment, see statistics.bootstrap_proportions and bootstrap_days.
+                         The days method raises a ValueError when the data or the window have a single day
+        :type    method: str
+        :param   n_resamples: (optional) the number of bootstrap resamples
+        :type    n_resamples: int
+        :param   seed: (optional) the seed of the resamples
+        :type    seed: int
+        :return: results as json, with the relative uplift and the confidence interval of every (kpi, segment)
+        :rtype:  json
+        """
+        units = self._get_units(kpis, analyze_segments)
+        stats = self._bootstrap(units, self.segment_column, _end_date(date, end_date), start_date, window, method, n_resamples, seed)
+        results = []
+        for u, (kpi, segment) in enumerate(units):
+            results.append({
+                'kpi': kpi,
+                'segment': 'all' if segment is None else segment,
+                'relative_uplift': stats['relative_uplift'][u],
+                'confidence_interval': {'lower_limit': stats['lower_limit'][u], 'upper_limit': stats['upper_limit'][u]}
+            })
+        with self._span('serialization'):
+            return simplejson.dumps(results, ignore_nan=True)
+
+    def _bootstrap(self, units, segment_column, date, start_date, window, method, n_resamples, seed):
+        # the bootstrap statistics of the (kpi, segment) units, with one call of the bootstrap kernel
+        kwargs = {'n_resamples': n_resamples, 'alternative': self.alternative, 'significance_level': self.significance_level,
+                  'seed': seed, 'n_workers': 1 if self.backend == 'serial' else self.n_workers or os.cpu_count() or 1}
+        if method == 'sessions':
+            continuous = [kpi for kpi, _ in units if self.kpis.is_continuous(kpi)]
+            if continuous:
+                raise ValueError("The sessions of continuous kpis cannot be resampled, please use method='days' : {}".format(continuous))
+            counts = tuple(np.array(column, dtype=np.float64).reshape(len(units)) for column in zip(
+                *[self._get_test_counts(kpi, segment, segment_column, date, start_date=start_date, window=window) for kpi, segment in units]))
+            with self._span('bootstrap', method=method, cells=len(units)):
+                return bootstrap_proportions(*counts, **kwargs)
+        if method != 'days':
+            raise ValueError("method should be one of 'normal', 'sessions' or 'days' : {}".format(method))
+
+        cube = self.get_cube(segment_column)
+        dates = cube.date_slice(date, start_date=start_date, window=window)
+        positions = np.arange(dates.start, dates.stop)
+        labels = [self.variations.variation_label, self.variations.control_label]
+        # the daily conversions and sample sizes (sums and counts for continuous kpis) of variation and control
+        with self._span('filtering', kpis=len(units), date='days'):
+            daily = [sum(cube.get_group_history_counts(kpi, labels, positions, segment=segment, cumulative=False), ())
+                     for kpi, segment in units]
+        counts = tuple(np.array(column, dtype=np.float64).reshape(len(units), len(positions)) for column in zip(*daily))
+        with self._span('bootstrap', method=method, cells=len(units)):
+            return bootstrap_days(*counts, **kwargs)
+
+    def _get_units(self, kpis, analyze_segments):
+        # the (kpi, segment) pairs of a report, in report order. segment None stands for the whole population
+        units = []
+        for kpi in self.kpis.get_kpis() if kpis is None else kpis:
+            self._check_kpi(kpi)
+            units.append((kpi, None))
+            for segment in self.segments if analyze_segments else []:
+                units.append((kpi, segment))
+        return units
+
+    @_cached
+    def analyze(self, kpis=None, analyze_segments=False, date=None, start_date=None, end_date=None, window=None):
         """
         Method to analyze the experiment. It returns a json object with the results
         :param   kpis: The kpis that needs to evaluate if null it evaluates all
         :type    kpis: list
         :param   analyze_segments: True to analyze also each segment
         :type    analyze_segments: bool
+        :param   date: if date is given then the analysis will happen up to that date
+        :type    date: string
+        :param   start_date: if start_date is given then the analysis will happen from that date
+        :type    start_date: string
+        :param   end_date: same as date, the last date of the analysis
+        :type    end_date: string
+        :param   window: if window is given then the analysis will happen on the rolling window of that many days up to date
+        :type    window: int
         :return: results as json
         :rtype:  json
         """
 
-        results = []
-        for kpi in self.kpis.get_kpis() if kpis is None else kpis:
+        units = self._get_units(kpis, analyze_segments)
+        summaries = self._map_units('_summarize_units', units, date=_end_date(date, end_date), start_date=start_date, window=window)
+        return self._analysis_results(units, summaries)
+
+    def _summarize_units(self, units, date=None, start_date=None, window=None):
+        summaries = [None] * len(units)
+        for continuous, indices in self._split_units(units):
+            counts = self._get_units_counts([units[idx] for idx in indices], date, start_date=start_date, window=window)
+            for idx, summary in zip(indices, self._evaluate(counts, continuous)):
+                summaries[idx] = summary
+        return summaries
 
-            kpi_eval = {
+    def _map_units(self, method, units, **kwargs):
+        """
+        Runs a method of the experiment over the units with the backend of the experiment. The units are split in one
+        contiguous chunk per worker and the results of the chunks are concatenated in the order of the units
+        :param   method: the name of the method, that takes a list of units and returns a list with a result per unit
+        :type    method: string
+        :param   units: the (kpi, segment) units
+        :type    units: list of tuples
+        :param   kwargs: the keyword arguments of the method
+        :type    kwargs: dict
+        :return: the results of all units
+        :rtype:  list
+        """
+        n_workers = self.n_workers or os.cpu_count() or 1
+        if self.backend == 'serial' or n_workers == 1 or len(units) < 2:
+            return getattr(self, method)(units, **kwargs)
+
+        # the cube and its prefix sums are built once here, before the workers race for them. the process workers get a
+        # copy of the experiment without the raw data
+        cube = self.get_cube(self.segment_column)
+        cube.get_cumulative()
+        cube.get_day_codes()
+        worker = self if self.backend != 'process' else self._worker_copy()
+        chunks = [units[chunk[0]:chunk[-1] + 1] for chunk in np.array_split(np.arange(len(units)), min(n_workers, len(units)))]
+        if isinstance(self.backend, Executor):
+            return _gather(self.backend, worker, method, chunks, kwargs)
+        pool = ThreadPoolExecutor if self.backend == 'thread' else ProcessPoolExecutor
+        with pool(max_workers=len(chunks)) as executor:
+            return _gather(executor, worker, method, chunks, kwargs)
+
+    def _worker_copy(self):
+        cube = self.get_cube(self.segment_column)
+        return experiment.from_cube(cube, kpis=self.kpis, variations=self.variations, segments=self.segments,
+                                    alternative=self.alternative, significance_level=self.significance_level,
+                                    date_column=self.date_column, segment_column=self.segment_column, bayesian=self.bayesian,
+                                    prior=self.prior)
+
+    def _split_units(self, units):
+        # the positions of the units of conversion kpis and of continuous kpis, that are evaluated by different kernels
+        groups = []
+        for continuous in (False, True):
+            indices = [idx for idx, (kpi, _) in enumerate(units) if self.kpis.is_continuous(kpi) == continuous]
+            if indices:
+                groups.append((continuous, indices))
+        return groups
+
+    def _get_units_counts(self, units, date=None, start_date=None, window=None):
+        counts = [self._get_test_counts(kpi, segment, self.segment_column, date, start_date=start_date, window=window)
+                  for kpi, segment in units]
+        return tuple(np.array(column, dtype=np.float64).reshape(len(units)) for column in zip(*counts))
+
+    def _analysis_results(self, units, summaries):
+        results = []
+        for (kpi, segment), summary in zip(units, summaries):
+            results.append({
                 'kpi': kpi,
-                'segment': 'all',
-                'summary':
-                    {
-                        "test": self.get_p_val(kpi=kpi, date=date),
-                        "relative_conversion_uplift": self.get_relative_conversion_uplift(kpi=kpi, date=date),
-                        "standard_errors": self.get_standard_errors_of_test(kpi=kpi, date=date),
-                        "confidence_interval": self.get_confidence_interval_of_test(kpi=kpi, date=date),
-                        "volumes": self.get_summary(kpi=kpi, date=date)
-                    }
-            }
-            results.append(kpi_eval)
-            for segment in self.segments if analyze_segments else []:
-                kpi_eval = {
-                    'kpi': kpi,
-                    'segment': segment,
-                    'summary':
-                        {
-                            "test": self.get_p_val(kpi=kpi, segment=segment, date=date),
-                            "relative_conversion_uplift": self.get_relative_conversion_uplift(kpi=kpi, segment=segment, date=date),
-                            "standard_errors": self.get_standard_errors_of_test(kpi=kpi, segment=segment, date=date),
-                            "confidence_interval": self.get_confidence_interval_of_test(kpi=kpi, segment=segment, date=date),
-                            "volumes": self.get_summary(kpi=kpi, segment=segment, date=date)
-                        }
-                }
-                results.append(kpi_eval)
-        return simplejson.dumps(results, ignore_nan=True)
+                'segment': 'all' if segment is None else segment,
+                'summary': summary
+            })
+        with self._span('serialization'):
+            return simplejson.dumps(results, ignore_nan=True)
+
+    @_cached
+    def analyze_arms(self, kpis=None, analyze_segments=False, date=None, start_date=None, end_date=None, window=None,
+                     all_pairs=False, correction='holm'):
+        """
+        Method to analyze an A/B/n experiment with the variation_labels of its variations. Every variation is compared
+        with the control, or with all_pairs every arm with every later arm ([control] + variation_labels). The data are
+        aggregated once, the comparisons of all kpis and segments are evaluated with one call of the statistics kernel
+        and the p-values of the comparisons of every kpi and segment are adjusted for multiple testing together.
+        :param   kpis: The kpis that needs to evaluate if null it evaluates all
+        :type    kpis: list
+        :param   analyze_segments: True to analyze also each segment
+        :type    analyze_segments: bool
+        :param   date: if date is given then the analysis will happen up to that date
+        :type    date: string
+        :param   start_date: if start_date is given then the analysis will happen from that date
+        :type    start_date: string
+        :param   end_date: same as date, the last date of the analysis
+        :type    end_date: string
+        :param   window: if window is given then the analysis will happen on the rolling window of that many days up to date
+        :type    window: int
+        :param   all_pairs: True to compare all the pairs of arms instead of every variation with the control
+        :type    all_pairs: bool
+        :param   correction: the multiple testing correction, one of 'bonferroni', 'holm', 'fdr_bh' or None
+        :type    correction: string
+        :return: results as json, with a summary, the adjusted p-value and the significance of every comparison
+        :rtype:  json
+        """
+        units = self._get_units(kpis, analyze_segments)
+        labels = self.variations.get_labels()
+        pairs = [(i, j) for i in range(len(labels)) for j in range(i + 1, len(labels))] if all_pairs else \
+            [(0, j) for j in range(1, len(labels))]
+        control_arms, variation_arms = (np.array(index, dtype=np.intp) for index in zip(*pairs))
+        date = _end_date(date, end_date)
+
+        summaries = [None] * len(units)
+        p_values = np.full((len(units), len(pairs)), np.nan)
+        cube = self.get_cube(self.segment_column)
+        for continuous, indices in self._split_units(units):
+            with self._span('filtering', kpi='all', segment='all', date=date):
+                # the counts of every arm, shape (statistics, units, arms)
+                arms = np.array([[column for column in zip(*cube.get_group_counts(
+                    units[idx][0], labels, segment=units[idx][1], date=date, start_date=start_date, window=window,
+                    sum_sq=continuous))] for idx in indices], dtype=np.float64).transpose(1, 0, 2)
+            # the variation statistics and then the control statistics of every (unit, pair), as _evaluate expects
+            counts = tuple(statistic.ravel() for statistic in arms[:, :, variation_arms]) + \
+                tuple(statistic.ravel() for statistic in arms[:, :, control_arms])
+            evaluations = self._evaluate(counts, continuous)
+            for position, idx in enumerate(indices):
+                summaries[idx] = evaluations[position * len(pairs):(position + 1) * len(pairs)]
+                p_values[idx] = [summary['test']['p-value'] for summary in summaries[idx]]
+
+        with self._span('statistics', statistic='correction', cells=p_values.size):
+            adjusted = adjust_p_values(p_values, correction)
+        results = []
+        for u, (kpi, segment) in enumerate(units):
+            comparisons = []
+            for p, (control, variation) in enumerate(pairs):
+                summary = summaries[u][p]
+                summary['volumes']['variation']['label'] = labels[variation]
+                summary['volumes']['control']['label'] = labels[control]
+                comparisons.append({'variation': labels[variation], 'control': labels[control], 'summary': summary,
+                                    'adjusted_p-value': adjusted[u, p],
+                                    'significant': bool(adjusted[u, p] < self.significance_level)})
+            results.append({'kpi': kpi, 'segment': 'all' if segment is None else segment, 'correction': correction,
+                            'comparisons': comparisons})
+        with self._span('serialization'):
+            return simplejson.dumps(results, ignore_nan=True)
+
+    @_cached
+    def analyze_cells(self, segment_columns=None, kpis=None, date=None, start_date=None, end_date=None, window=None,
+                      min_sample_size=1, correction='fdr_bh'):
+        """
+        Method to analyze every cell of the crossing of several segment columns, e.g. platform x country x new/returning.
+        The data are aggregated once over the crossing, with a segment per combination that is in the data, and the cells
+        of every kind of kpi are evaluated with one call of the statistics kernel. The p-values of the cells of every kpi
+        are adjusted together for multiple testing, by default controlling the false discovery rate.
+        :param   segment_columns: (optional) the columns to cross, by default the segment column of the experiment
+        :type    segment_columns: list of strings
+        :param   kpis: The kpis that needs to evaluate if null it evaluates all
+        :type    kpis: list
+        :param   date: if date is given then the analysis will happen up to that date
+        :type    date: string
+        :param   start_date: if start_date is given then the analysis will happen from that date
+        :type    start_date: string
+        :param   end_date: same as date, the last date of the analysis
+        :type    end_date: string
+        :param   window: if window is given then the analysis will happen on the rolling window of that many days up to date
+        :type    window: int
+        :param   min_sample_size: (optional) cells with a smaller sample size in variation or control are not tested
+        :type    min_sample_size: int
+        :param   correction: the multiple testing correction, one of 'fdr_bh', 'holm', 'bonferroni' or None
+        :type    correction: string
+        :return: results as json, with the segment values, a summary, the adjusted p-value and the significance of every
+                 tested cell
+        :rtype:  json
+        """
+        segment_column = self.segment_column if segment_columns is None else segment_columns
+        if isinstance(segment_column, list):
+            segment_column = tuple(segment_column)
+        kpis = [kpi for kpi, _ in self._get_units(kpis, False)]
+        cube = self.get_cube(segment_column)
+        date = _end_date(date, end_date)
+        labels = [self.variations.variation_label, self.variations.control_label]
+
+        summaries = {}
+        p_values = np.full((len(kpis), len(cube.segments)), np.nan)
+        for continuous, indices in self._split_units([(kpi, None) for kpi in kpis]):
+            with self._span('filtering', kpi='all', segment='cells', date=date):
+                # the counts of every (kpi, cell), the variation statistics first, as _evaluate expects
+                counts = [cube.get_segment_counts(kpis[idx], labels, date=date, start_date=start_date, window=window,
+                                                  sum_sq=continuous) for idx in indices]
+                counts = tuple(np.concatenate([np.asarray(kpi_counts[g][c], dtype=np.float64) for kpi_counts in counts])
+                               for g in range(2) for c in range(len(counts[0][0])))
+                # the sample size (or the count of continuous values) is the second statistic of every group
+                minimum = max(min_sample_size, 1)
+                tested = np.flatnonzero((counts[1] >= minimum) & (counts[len(counts) // 2 + 1] >= minimum))
+            evaluations = self._evaluate(tuple(column[tested] for column in counts), continuous)
+            for flat, summary in zip(tested, evaluations):
+                cell = (indices[flat // len(cube.segments)], flat % len(cube.segments))
+                summaries[cell] = summary
+                p_values[cell] = summary['test']['p-value']
+
+        with self._span('statistics', statistic='correction', cells=p_values.size):
+            adjusted = adjust_p_values(p_values, correction)
+        results = []
+        for (k, s), summary in sorted(summaries.items()):
+            segment = cube.segments[s]
+            results.append({'kpi': kpis[k],
+                            'segment': dict(zip(segment_column, segment)) if isinstance(segment_column, tuple) else segment,
+                            'summary': summary, 'adjusted_p-value': adjusted[k, s],
+                            'significant': bool(adjusted[k, s] < self.significance_level)})
+        with self._span('serialization'):
+            return simplejson.dumps(results, ignore_nan=True)
 
-    def analyze_historically(self, kpis=None, analyze_segments=False):
+    @_cached
+    def analyze_historically(self, kpis=None, analyze_segments=False, start_date=None, end_date=None, window=None, cumulative=True):
         """
         Method to analyze the experiment. It returns a json object with the results
         :param   kpis: The kpis that needs to evaluate if null it evaluates all
         :type    kpis: list
         :param   analyze_segments: True to analyze also each segment
         :type    analyze_segments: bool
+        :param   start_date: if start_date is given then the history starts at that date
+        :type    start_date: string
+        :param   end_date: if end_date is given then the history ends at that date
+        :type    end_date: string
+        :param   window: if window is given then the summary and every date of the history are analyzed on the rolling window
+                         of that many days up to that date
+        :type    window: int
+        :param   cumulative: False to analyze every date of the history on its own data only
+        :type    cumulative: bool
         :return: results as json
         :rtype:  json
         """
 
-        unique_dates = self.data[self.date_column].unique()
+        units = self._get_units(kpis, analyze_segments)
+        cube = self.get_cube(self.segment_column)
+        positions = cube.get_history_positions(end_date, start_date=start_date)
+        dates = cube.get_dates()[positions]
+
+        unit_evaluations = self._map_units('_summarize_unit_histories', units, positions=positions, end_date=end_date,
+                                           start_date=start_date, window=window, cumulative=cumulative)
 
         results = []
-        for kpi in self.kpis.get_kpis() if kpis is None else kpis:
-            summary = {
-                "test": self.get_p_val(kpi=kpi),
-                "relative_conversion_uplift": self.get_relative_conversion_uplift(kpi=kpi),
-                "standard_errors": self.get_standard_errors_of_test(kpi=kpi),
-                "confidence_interval": self.get_confidence_interval_of_test(kpi=kpi),
-                "volumes": self.get_summary(kpi=kpi)
-            }
+        population_tests = {}
+        for (kpi, segment), (summary, daily_evaluations) in zip(units, unit_evaluations):
+            if segment is None:
+                population_tests[kpi] = summary["test"]
+            elif not self.kpis.is_continuous(kpi):
+                # the test of the segment summary of conversion kpis has always been computed on the whole population
+                summary["test"] = population_tests[kpi]
             history = []
-            for date in unique_dates:
-                daily_results = {
-                    "date": date,
-                    "test": self.get_p_val(kpi=kpi, date=date),
-                    "relative_conversion_uplift": self.get_relative_conversion_uplift(kpi=kpi, date=date),
-                    "standard_errors": self.get_standard_errors_of_test(kpi=kpi, date=date),
-                    "confidence_interval": self.get_confidence_interval_of_test(kpi=kpi, date=date),
-                    "volumes": self.get_summary(kpi=kpi, date=date)
-                }
+            for date, daily_evaluation in zip(dates, daily_evaluations):
+                daily_results = {"date": date}
+                daily_results.update(daily_evaluation)
                 history.append(daily_results)
-
             results.append({
                 'kpi': kpi,
-                'segment': 'all',
+                'segment': 'all' if segment is None else segment,
                 'summary': summary,
                 'history': history
             })
+        with self._span('serialization'):
+            return simplejson.dumps(results, ignore_nan=True)
 
-            for segment in self.segments if analyze_segments else []:
-                summary = {
-                    "test": self.get_p_val(kpi=kpi),
-                    "relative_conversion_uplift": self.get_relative_conversion_uplift(kpi=kpi, segment=segment),
-                    "standard_errors": self.get_standard_errors_of_test(kpi=kpi, segment=segment),
-                    "confidence_interval": self.get_confidence_interval_of_test(kpi=kpi, segment=segment),
-                    "volumes": self.get_summary(kpi=kpi, segment=segment)
-                }
-                history = []
-                for date in unique_dates:
-                    daily_results = {
-                        "date": date,
-                        "test": self.get_p_val(kpi=kpi, date=date, segment=segment),
-                        "relative_conversion_uplift": self.get_relative_conversion_uplift(kpi=kpi, date=date, segment=segment),
-                        "standard_errors": self.get_standard_errors_of_test(kpi=kpi, date=date, segment=segment),
-                        "confidence_interval": self.get_confidence_interval_of_test(kpi=kpi, date=date, segment=segment),
-                        "volumes": self.get_summary(kpi=kpi, date=date, segment=segment)
-                    }
-                    history.append(daily_results)
-
-                results.append({
-                    'kpi': kpi,
-                    'segment': segment,
-                    'summary': summary,
-                    'history': history
-                })
-        return simplejson.dumps(results, ignore_nan=True)
+    def _summarize_unit_histories(self, units, positions, end_date=None, start_date=None, window=None, cumulative=True):
+        # the summaries and the history of every unit of the same kind of kpi are evaluated together in one batch
+        results = [None] * len(units)
+        for continuous, indices in self._split_units(units):
+            summary_counts = [self._get_test_counts(units[idx][0], units[idx][1], self.segment_column, end_date, start_date=start_date,
+                                                    window=window) for idx in indices]
+            history_counts = [self._get_history_counts(units[idx][0], units[idx][1], self.segment_column, positions,
+                                                       start_date=start_date, window=window, cumulative=cumulative) for idx in indices]
+            batch = tuple(np.concatenate([np.array(column, dtype=np.float64)] + list(history_column))
+                          for column, history_column in zip(zip(*summary_counts), zip(*history_counts)))
+            evaluations = self._evaluate(batch, continuous)
+            for position, idx in enumerate(indices):
+                offset = len(indices) + position * len(positions)
+                results[idx] = (evaluations[position], evaluations[offset:offset + len(positions)])
+        return results
+
+    @_cached
+    def check_sample_ratio(self, kpi=None, analyze_segments=True, start_date=None, end_date=None, expected_split=0.5,
+                           threshold=0.001):
+        """
+        Checks the allocation of the sample to variation and control for sample ratio mismatches (SRM) with a
+        chi-square test, for the whole population and every segment, over the whole period, every single date and the
+        cumulative period up to every date. All the checks are computed from the summary cube with a single call of
+        the statistics kernel.
+        :param   kpi: (optional) the KPI whose sample sizes are checked, by default the primary KPI
+        :type    kpi: str
+        :param   analyze_segments: (optional) False to check only the whole population
+        :type    analyze_segments: bool
+        :param   start_date: (optional) the first date of the check
+        :type    start_date: string
+        :param   end_date: (optional) the last date of the check
+        :type    end_date: string
+        :param   expected_split: (optional) the expected share of the sample of the variation
+        :type    expected_split: float
+        :param   threshold: (optional) the p-value under which a mismatch is reported
+        :type    threshold: float
+        :return: a dict per segment with the 'summary' check and the 'history' of the daily and cumulative checks
+        :rtype:  list of dicts
+        """
+        cube = self.get_cube(self.segment_column)
+        if kpi is None:
+            kpi = self.kpis.get_primary_KPI() if self.kpis.get_primary_KPI() in cube.get_kpis() else cube.get_kpis()[0]
+        self._check_kpi(kpi)
+        segments = [None] + (list(self.segments) if analyze_segments and self.segments else [])
+        dates = cube.date_slice(end_date, start_date=start_date)
+        positions = cube.get_history_positions(end_date, start_date=start_date)
+
+        with self._span('filtering', kpi=kpi, segment='all', date='history'):
+            sizes = cube.get_group_sample_sizes(kpi, [self.variations.variation_label, self.variations.control_label], segments)
+            prefix = np.concatenate([np.zeros_like(sizes[..., :1]), sizes.cumsum(axis=-1)], axis=-1)
+            summary = prefix[..., dates.stop] - prefix[..., dates.start]
+            cumulative = prefix[..., positions + 1] - prefix[..., dates.start][..., None]
+            # one comparison per segment and summary, date or cumulative date, with the groups on the last axis
+            batch = np.moveaxis(np.concatenate([summary[..., None], sizes[..., positions], cumulative], axis=-1), 0, -1)
+        with self._span('statistics', statistic='sample_ratio', cells=batch.shape[0] * batch.shape[1]):
+            stats = sample_ratio_test(batch, expected_ratios=[expected_split, 1 - expected_split])
+
+        def check(s, d):
+            return {'chi-square': stats['chi-square'][s, d], 'p-value': stats['p-value'][s, d],
+                    'srm': bool(stats['p-value'][s, d] < threshold),
+                    'volumes': {'variation': float(batch[s, d, 0]), 'control': float(batch[s, d, 1])}}
+
+        results = []
+        for s, segment in enumerate(segments):
+            history = [{'date': date, 'daily': check(s, 1 + d), 'cumulative': check(s, 1 + len(positions) + d)}
+                       for d, date in enumerate(cube.get_dates()[positions])]
+            results.append({'kpi': kpi, 'segment': 'all' if segment is None else segment, 'summary': check(s, 0),
+                            'history': history})
+        return results
 
     def is_valid(self):
         """
-        Checks if the experiment is valid over time. A valid experiment over time should have for all days variation and control
+        Checks if the experiment is valid over time. A valid experiment over time should have for all days variation and control.
+        With segments, or without the raw data, the experiment is valid if both groups have a sample and there is no
+        sample ratio mismatch in the whole population and in any segment, see check_sample_ratio
         :return: true or false
         :rtype:  bool
         """
 
-        if self.segments is None:
+        if self.segments is None and self.sessions:
+            # session data have many rows per day, every day should have sessions of both variation and control
+            cube = self.get_cube(self.segment_column)
+            counts = cube.get_group_history_counts(cube.get_kpis()[0], [self.variations.variation_label, self.variations.control_label],
+                                                   cube.get_history_positions(), cumulative=False)
+            return set(cube.groups) == {self.variations.variation_label, self.variations.control_label} and \
+                all((sample_size > 0).all() for _, sample_size in counts)
+        if self.segments is None and self.data is not None:
 
-            if (set(self.data[self.variations.column_name]) == {self.variations.variation_label, self.variations.control_label})\
-                    and (self.data[self.variations.column_name].nunique() * self.data[self.date_column].nunique() == len(self.data.index)):
+            columns, n_rows = as_columns(self.data)
+            groups = pd.unique(pd.Series(columns[self.variations.column_name]).dropna())
+            dates = pd.unique(pd.Series(columns[self.date_column]).dropna())
+            if (set(groups) == {self.variations.variation_label, self.variations.control_label})\
+                    and (len(groups) * len(dates) == n_rows):
                 return True
         else:
-            logging.info("Be aware that the validity check is not working if you have segments in your data. It always returns True.")
-            return True
+            checks = self.check_sample_ratio()
+            volumes = checks[0]['summary']['volumes']
+            return volumes['variation'] > 0 and volumes['control'] > 0 and not any(check['summary']['srm'] for check in checks)
         return False
+
+
+def _end_date(date, end_date):
+    # date is the historical name of the end date of an analysis
+    if date is not None and end_date is not None and date != end_date:
+        raise ValueError("date and end_date should not differ : {} {}".format(date, end_date))
+    return end_date if end_date is not None else date
+
+
+def _gather(executor, worker, method, chunks, kwargs):
+    futures = [executor.submit(_run_units, worker, method, chunk, kwargs) for chunk in chunks]
+    return [result for future in futures for result in future.result()]
+
+
+def _run_units(worker, method, units, kwargs):
+    return getattr(worker, method)(units, **kwargs)
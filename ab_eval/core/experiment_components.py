@@ -10,22 +10,35 @@ class evaluation_metrics(object):
     :type  kpis: list of kpis
     :param primary_KPI: the primary KPI that will be used in every evaluation
     :type  primary_KPI: string
+    :param continuous_kpis: (optional) the kpis with continuous values (e.g. revenue) instead of conversions. Their data
+                            are the '<kpi>_count', '<kpi>_sum' and '<kpi>_sum_sq' columns and they are tested with Welch's t-test
+    :type  continuous_kpis: list of strings
     """
     def __init__(
             self,
             kpis,
             primary_KPI="CVR",
+            continuous_kpis=None,
             *args, **kwargs):
         super(evaluation_metrics, self).__init__(*args, **kwargs)
         # always append the business primary KPI
         self.primary_KPI = primary_KPI
         if primary_KPI not in kpis:
             kpis.append(primary_KPI)
+        self.continuous_kpis = list(continuous_kpis or [])
         self.kpis = kpis
+        if self.continuous_kpis:
+            self.kpis = list(kpis) + [kpi for kpi in self.continuous_kpis if kpi not in kpis]
 
     def get_kpis(self):
         return self.kpis
 
+    def get_continuous_kpis(self):
+        return self.continuous_kpis
+
+    def is_continuous(self, kpi):
+        return kpi in self.continuous_kpis
+
     def get_primary_KPI(self):
         return self.primary_KPI
 
@@ -39,17 +52,26 @@ class variations(object):
     :type  control_label: string
     :param variation_label: the name of the variation group that can be found inside the variations column
     :type  control_label: string
+    :param variation_labels: (optional) the names of all the variation groups of an A/B/n test, see experiment.analyze_arms.
+                             The first one is the variation_label of the A/B analyses
+    :type  variation_labels: list of strings
     """
     def __init__(
             self,
             column_name='group',
             control_label='A',
             variation_label='B',
+            variation_labels=None,
             *args, **kwargs):
         super(variations, self).__init__(*args, **kwargs)
         self.column_name = column_name
         self.control_label = control_label
+        if variation_labels:
+            if control_label in variation_labels or len(set(variation_labels)) != len(variation_labels):
+                raise ValueError("variation_labels should be distinct and differ from the control_label : {}".format(variation_labels))
+            variation_label = variation_labels[0]
         self.variation_label = variation_label
+        self.variation_labels = list(variation_labels) if variation_labels else [variation_label]
 
     def get_column_name(self):
         return self.column_name
@@ -59,3 +81,10 @@ class variations(object):
 
     def get_variation_label(self):
         return self.variation_label
+
+    def get_variation_labels(self):
+        return self.variation_labels
+
+    def get_labels(self):
+        # the labels of all the arms, the control first
+        return [self.control_label] + self.variation_labels
@@ -0,0 +1,167 @@
+import json
+import logging
+from ab_eval.core.experiment import experiment
+from ab_eval.core.experiment_components import variations, evaluation_metrics
+from ab_eval.core.summary_cube import summary_cube
+
+logger = logging.getLogger(__name__)
+
+
+class experiment_state(object):
+    """
+    Class that keeps the running sufficient statistics of an experiment (the daily sums of conversions and sample
+    sizes per group, segment and KPI) so that new data can be appended without rescanning the history.
+    The results of analyze and analyze_historically are identical to the ones of an experiment built from all the data.
+    :param kpis: evaluation_metrics object that holds information about the kpis that gonna be used for the evaluation.
+    :type  kpis: evaluation_metrics
+    :param variations: variations object that holds information about the variations of the test.
+    :type  variations: variations
+    :param segments: list of segments that will be used for a specific segment evaluation
+    :type  segments: list of strings
+    :param alternative: the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type  alternative: string
+    :param significance_level: the significance level that should be used in the experiment
+    :type  significance_level: float
+    :param date_column: name of the column that hold the date
+    :type  date_column: string
+    :param segment_column: name of the column that holds the segments, or a list of columns whose crossings are the segments
+    :type  segment_column: string or list of strings
+    :param cube: (optional) the summary cube with the statistics of the data appended so far
+    :type  cube: summary_cube
+    :param sessions: True if the appended data have one row per session, see summary_cube.from_sessions
+    :type  sessions: bool
+    :param cache: (optional) cache of the analysis results. They are keyed by the fingerprint of the cube, so every
+                  append invalidates them. The cache is not part of the saved state
+    :type  cache: ab_eval.core.cache.result_cache
+    :param bayesian: (optional) True to add the Bayesian comparison of the groups to the summaries, see experiment
+    :type  bayesian: bool
+    :param prior: (optional) the alpha and beta parameters of the Beta prior of the conversion rates
+    :type  prior: tuple
+    """
+    def __init__(
+            self,
+            kpis=evaluation_metrics(kpis=["CVR"]),
+            variations=variations(),
+            segments=None,
+            alternative='two-sided',
+            significance_level=0.05,
+            date_column='date',
+            segment_column='segment',
+            cube=None,
+            sessions=False,
+            cache=None,
+            bayesian=False,
+            prior=(1, 1),
+            *args, **kwargs):
+        super(experiment_state, self).__init__(*args, **kwargs)
+        self.kpis = kpis
+        self.variations = variations
+        # json has no tuples, the labels and the columns of crossed segments are restored from lists
+        self.segments = segments if segments is None else [tuple(segment) if isinstance(segment, list) else segment for segment in segments]
+        self.alternative = alternative
+        self.significance_level = significance_level
+        self.date_column = date_column
+        self.segment_column = tuple(segment_column) if isinstance(segment_column, list) else segment_column
+        self.cube = cube
+        self.sessions = sessions
+        self.cache = cache
+        self.bayesian = bayesian
+        self.prior = tuple(prior)
+
+    def append(self, day_df):
+        """
+        Appends new data (typically the aggregates of a new day) to the state. Only the new rows are aggregated
+        and their sums are added to the running statistics.
+        :param   day_df: the dataframe with the new data, in the same format as the data of an experiment
+        :type    day_df: dataframe
+        :return: the state itself
+        :rtype:  experiment_state
+        """
+        day_cube = summary_cube.from_dataframe(day_df, kpis=self.kpis.get_kpis(),
+                                               variations_column=self.variations.get_column_name(),
+                                               segment_column=self.segment_column, date_column=self.date_column,
+                                               sessions=self.sessions, continuous_kpis=self.kpis.get_continuous_kpis())
+        self.cube = day_cube if self.cube is None else self.cube.merge(day_cube)
+        logger.debug('Appended {} rows to the experiment state.'.format(len(day_df.index)))
+        return self
+
+    def get_cube(self):
+        return self.cube
+
+    def get_experiment(self):
+        """
+        Returns an experiment that reads its metrics from the statistics of the state
+        :return: the experiment
+        :rtype:  experiment
+        """
+        if self.cube is None:
+            raise ValueError("The experiment state is empty, please append some data first.")
+        return experiment.from_cube(self.cube, kpis=self.kpis, variations=self.variations, segments=self.segments,
+                                    alternative=self.alternative, significance_level=self.significance_level,
+                                    date_column=self.date_column, cache=self.cache, bayesian=self.bayesian, prior=self.prior)
+
+    def analyze(self, kpis=None, analyze_segments=False, date=None, start_date=None, end_date=None, window=None):
+        return self.get_experiment().analyze(kpis=kpis, analyze_segments=analyze_segments, date=date, start_date=start_date,
+                                             end_date=end_date, window=window)
+
+    def analyze_historically(self, kpis=None, analyze_segments=False, start_date=None, end_date=None, window=None, cumulative=True):
+        return self.get_experiment().analyze_historically(kpis=kpis, analyze_segments=analyze_segments, start_date=start_date,
+                                                          end_date=end_date, window=window, cumulative=cumulative)
+
+    def to_dict(self):
+        """
+        Returns a json serializable dict representation of the state
+        :return: the dict representation of the state
+        :rtype:  dict
+        """
+        return {
+            'kpis': self.kpis.get_kpis(),
+            'primary_KPI': self.kpis.get_primary_KPI(),
+            'continuous_kpis': self.kpis.get_continuous_kpis(),
+            'variations': {
+                'column_name': self.variations.get_column_name(),
+                'control_label': self.variations.get_control_label(),
+                'variation_label': self.variations.get_variation_label(),
+                'variation_labels': self.variations.get_variation_labels()
+            },
+            'segments': self.segments,
+            'alternative': self.alternative,
+            'significance_level': self.significance_level,
+            'date_column': self.date_column,
+            'segment_column': self.segment_column,
+            'sessions': self.sessions,
+            'bayesian': self.bayesian,
+            'prior': list(self.prior),
+            'cube': None if self.cube is None else self.cube.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, state_dict):
+        """
+        Builds the state from its dict representation (see to_dict)
+        :param   state_dict: the dict representation of the state
+        :type    state_dict: dict
+        :return: the experiment state
+        :rtype:  experiment_state
+        """
+        return cls(kpis=evaluation_metrics(kpis=list(state_dict['kpis']), primary_KPI=state_dict['primary_KPI'],
+                                           continuous_kpis=state_dict.get('continuous_kpis')),
+                   variations=variations(**state_dict['variations']),
+                   segments=state_dict['segments'],
+                   alternative=state_dict['alternative'],
+                   significance_level=state_dict['significance_level'],
+                   date_column=state_dict['date_column'],
+                   segment_column=state_dict['segment_column'],
+                   sessions=state_dict.get('sessions', False),
+                   bayesian=state_dict.get('bayesian', False),
+                   prior=state_dict.get('prior', (1, 1)),
+                   cube=None if state_dict['cube'] is None else summary_cube.from_dict(state_dict['cube']))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class profiler(object):
+    """
+    Class that records the wall time and the call count of the stages of an analysis (filtering, aggregation,
+    statistics, serialization, ...). Every recorded span carries its tags, e.g. the kpi, segment and date.
+    :param callback: (optional) function that is called with (stage, tags, duration in seconds) when a span ends
+    :type  callback: function
+    """
+    def __init__(
+            self,
+            callback=None,
+            *args, **kwargs):
+        super(profiler, self).__init__(*args, **kwargs)
+        self.callback = callback
+        self.events = []
+        self._origin = time.perf_counter()
+
+    def span(self, stage, **tags):
+        """
+        Returns a context manager that records the wall time of a stage
+        :param   stage: the name of the stage
+        :type    stage: str
+        :param   tags: the tags of the span, e.g. kpi, segment and date
+        :type    tags: dict
+        :return: the span
+        :rtype:  context manager
+        """
+        return _span(self, stage, tags)
+
+    def record(self, stage, tags, start, end):
+        self.events.append((stage, tags, start, end, threading.get_ident()))
+        if self.callback is not None:
+            self.callback(stage, tags, end - start)
+
+    def to_dict(self, by_tags=False):
+        """
+        Returns the call count and the total wall time of every stage
+        :param   by_tags: True to report every combination of stage and tags separately
+        :type    by_tags: bool
+        :return: dict with 'calls' and 'total_time' (seconds) per stage
+        :rtype:  dict
+        """
+        stages = {}
+        for stage, tags, start, end, _ in self.events:
+            if by_tags and tags:
+                stage = '{} {}'.format(stage, ' '.join('{}={}'.format(key, value) for key, value in sorted(tags.items())))
+            summary = stages.setdefault(stage, {'calls': 0, 'total_time': 0.0})
+            summary['calls'] += 1
+            summary['total_time'] += end - start
+        return stages
+
+    def to_chrome_trace(self):
+        """
+        Returns the recorded spans in the Chrome trace event format, to be opened with chrome://tracing or Perfetto
+        :return: the trace
+        :rtype:  dict
+        """
+        return {'traceEvents': [{
+            'name': stage,
+            'cat': 'ab_eval',
+            'ph': 'X',
+            'ts': (start - self._origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': thread,
+            'args': {key: str(value) for key, value in tags.items()}
+        } for stage, tags, start, end, thread in self.events]}
+
+    def save_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+class _span(object):
+    __slots__ = ('profiler', 'stage', 'tags', 'start')
+
+    def __init__(self, profiler, stage, tags):
+        self.profiler = profiler
+        self.stage = stage
+        self.tags = tags
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.stage, self.tags, self.start, time.perf_counter())
+        return False
+
+
+class _null_span(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+# shared span that is used when the instrumentation is disabled, so that nothing is allocated or timed
+NULL_SPAN = _null_span()
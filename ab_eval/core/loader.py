@@ -0,0 +1,167 @@
+import logging
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from ab_eval.core.summary_cube import summary_cube
+
+logger = logging.getLogger(__name__)
+
+COUNT_SUFFIXES = ('_converted', '_sample_size', '_count', '_sum', '_sum_sq')
+FORMATS = ('json', 'csv')
+
+
+def iter_experiment_export(path_or_buf, chunksize=100000, value_columns=None, format='json'):
+    """
+    Reads an export of experiments in chunks, newline-delimited JSON or CSV. In every chunk the count columns
+    ('<kpi>_converted' and '<kpi>_sample_size', and '<kpi>_count', '<kpi>_sum' and '<kpi>_sum_sq' of continuous kpis)
+    are coerced to compact integers, with nulls as zeros, and every other column (experiment, variation, date, ...)
+    is encoded as a categorical of strings.
+    :param   path_or_buf: the path or the buffer of the export
+    :type    path_or_buf: string or file
+    :param   chunksize: the number of lines of every chunk
+    :type    chunksize: int
+    :param   value_columns: (optional) other numeric columns, e.g. the values of the continuous kpis of sessions
+    :type    value_columns: list of strings
+    :param   format: (optional) 'json' for newline-delimited JSON or 'csv'
+    :type    format: string
+    :return: generator of coerced dataframes
+    :rtype:  generator
+    """
+    if format not in FORMATS:
+        raise ValueError("format should be one of {} : {}".format(FORMATS, format))
+    if format == 'csv':
+        reader = pd.read_csv(path_or_buf, chunksize=chunksize, dtype=str)
+    else:
+        reader = pd.read_json(path_or_buf, lines=True, chunksize=chunksize, dtype=False, convert_dates=False)
+    for chunk in reader:
+        yield coerce_experiment_export(chunk, value_columns=value_columns)
+
+
+def coerce_experiment_export(df, value_columns=None):
+    """
+    Coerces a raw chunk of an experiment export. Count columns become compact integers with nulls as zeros,
+    value columns become floats and all other columns become categoricals of strings.
+    :param   df: the raw dataframe
+    :type    df: dataframe
+    :param   value_columns: (optional) the numeric columns that are not counts, their missing values are kept
+    :type    value_columns: list of strings
+    :return: the coerced dataframe
+    :rtype:  dataframe
+    """
+    columns = {}
+    for column in df.columns:
+        if is_count_column(column):
+            columns[column] = _coerce_counts(df[column])
+        elif value_columns and column in value_columns:
+            columns[column] = pd.to_numeric(df[column], errors='coerce').astype(np.float64)
+        else:
+            columns[column] = df[column].where(df[column].isnull(), df[column].astype(str)).astype('category')
+    return pd.DataFrame(columns, index=df.index)
+
+
+def read_experiment_export(path_or_buf, chunksize=100000, aggregate=False, key_columns=None):
+    """
+    Reads a newline-delimited JSON export of experiments (see ab_eval/data/dummy_data.json) with bounded memory.
+    The export is read in chunks that are coerced with coerce_experiment_export. If aggregate is True, the counts
+    of every chunk are summed over the key columns while streaming, so only the aggregates are kept in memory.
+    :param   path_or_buf: the path or the buffer of the export
+    :type    path_or_buf: string or file
+    :param   chunksize: the number of lines of every chunk
+    :type    chunksize: int
+    :param   aggregate: True to sum the counts over the key columns while streaming
+    :type    aggregate: bool
+    :param   key_columns: (optional) the columns to aggregate over, by default all the columns that are not counts
+    :type    key_columns: list of strings
+    :return: dataframe with categorical keys and compact integer counts
+    :rtype:  dataframe
+    """
+    chunks = []
+    for chunk in iter_experiment_export(path_or_buf, chunksize=chunksize):
+        if aggregate:
+            chunk = _aggregate_chunk(chunk, key_columns)
+        chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame()
+
+    df = _concat_chunks(chunks)
+    if aggregate and len(chunks) > 1:
+        # the chunks are small partial aggregates, combine them into the final one
+        df = _aggregate_chunk(df, key_columns)
+    logger.debug('Experiment export read with {} rows in {} chunks.'.format(len(df.index), len(chunks)))
+    return df
+
+
+def read_experiment_cube(path_or_buf, kpis, variations_column='group', segment_column='segment', date_column='date',
+                         sessions=False, continuous_kpis=None, filters=None, chunksize=100000, format='json'):
+    """
+    Reads an export that can be larger than the memory into a summary cube. The export is read in chunks of chunksize
+    lines and every chunk is folded into the sums of the cube, so the memory depends on the number of cells of the cube
+    and on the chunk size, but not on the number of rows.
+    :param   path_or_buf: the path or the buffer of the export
+    :type    path_or_buf: string or file
+    :param   kpis: the kpis that should be aggregated
+    :type    kpis: list of strings
+    :param   variations_column: the column name that contains the variation information
+    :type    variations_column: string
+    :param   segment_column: (optional) the column name that contains the segment information
+    :type    segment_column: string
+    :param   date_column: (optional) the column name that contains the date information
+    :type    date_column: string
+    :param   sessions: (optional) True if the export has one row per session, see summary_cube.from_sessions
+    :type    sessions: bool
+    :param   continuous_kpis: (optional) the kpis with continuous values
+    :type    continuous_kpis: list of strings
+    :param   filters: (optional) the rows to keep as {column: value}, e.g. {'experiments': 'ios-search-by-last-address'}
+    :type    filters: dict
+    :param   chunksize: (optional) the number of lines of every chunk
+    :type    chunksize: int
+    :param   format: (optional) 'json' for newline-delimited JSON or 'csv'
+    :type    format: string
+    :return: the summary cube
+    :rtype:  summary_cube
+    """
+    value_columns = list(continuous_kpis or []) if sessions else None
+    chunks = iter_experiment_export(path_or_buf, chunksize=chunksize, value_columns=value_columns, format=format)
+    if filters:
+        chunks = (_filter_chunk(chunk, filters) for chunk in chunks)
+    return summary_cube.from_chunks(chunks, kpis, variations_column=variations_column, segment_column=segment_column,
+                                    date_column=date_column, sessions=sessions, continuous_kpis=continuous_kpis)
+
+
+def is_count_column(column):
+    return column.endswith(COUNT_SUFFIXES)
+
+
+def _coerce_counts(series):
+    values = pd.to_numeric(series, errors='coerce').fillna(0)
+    if (values % 1 == 0).all():
+        values = pd.to_numeric(values.astype(np.int64), downcast='integer')
+    return values
+
+
+def _filter_chunk(df, filters):
+    keep = np.ones(len(df.index), dtype=bool)
+    for column, value in filters.items():
+        keep &= (df[column] == str(value)).values
+    return df[keep]
+
+
+def _aggregate_chunk(df, key_columns):
+    if key_columns is None:
+        key_columns = [column for column in df.columns if not is_count_column(column)]
+    count_columns = [column for column in df.columns if is_count_column(column)]
+    aggregated = df.groupby(key_columns, observed=True, sort=False)[count_columns].sum().reset_index()
+    for column in count_columns:
+        aggregated[column] = _coerce_counts(aggregated[column])
+    return aggregated
+
+
+def _concat_chunks(chunks):
+    # pd.concat turns categoricals with different categories into objects, so union them per column
+    columns = {}
+    for column in chunks[0].columns:
+        if is_count_column(column):
+            columns[column] = np.concatenate([chunk[column].values for chunk in chunks])
+        else:
+            columns[column] = union_categoricals([chunk[column] for chunk in chunks], sort_categories=True)
+    return pd.DataFrame(columns)
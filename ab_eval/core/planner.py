@@ -0,0 +1,220 @@
+import logging
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+from ab_eval.core.statistics import proportions_test
+
+logger = logging.getLogger(__name__)
+
+ALTERNATIVES = ('two-sided', 'larger', 'smaller')
+
+
+def get_total_sample_size(baseline_cvr, expected_uplift, power=0.8, sig_level=0.05, split=0.5, alternative='two-sided'):
+    """
+    Returns the total sample size (control and variation) that a test of the proportions needs to detect an uplift.
+    Every argument but the alternative can be an array, they are broadcast against each other and the sample sizes
+    are computed in one vectorized call. With an equal split the sample size of every group is get_min_sample_size.
+    :param   baseline_cvr: the conversion rate of the control group
+    :type    baseline_cvr: float or numpy array
+    :param   expected_uplift: the expected uplift of the conversion rate (absolute value)
+    :type    expected_uplift: float or numpy array
+    :param   power: (optional) the probability of rejecting the null hypothesis when the uplift is real
+    :type    power: float or numpy array
+    :param   sig_level: (optional) the significance level
+    :type    sig_level: float or numpy array
+    :param   split: (optional) the share of the traffic that goes to the variation
+    :type    split: float or numpy array
+    :param   alternative: (optional) the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: string
+    :return: the total sample size, not rounded
+    :rtype:  numpy array
+    """
+    baseline_cvr, expected_uplift, split = _check_rates(baseline_cvr, expected_uplift, split)
+    z = _z_alpha(sig_level, alternative) + ndtri(np.asarray(power, dtype=np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _pooled_variance(baseline_cvr, expected_uplift, split) * z ** 2 / expected_uplift ** 2
+
+
+def get_power(baseline_cvr, expected_uplift, sample_size, sig_level=0.05, split=0.5, alternative='two-sided'):
+    """
+    Returns the analytic power of a test of the proportions, the inverse of get_total_sample_size. Every argument but
+    the alternative can be an array, they are broadcast against each other.
+    :param   baseline_cvr: the conversion rate of the control group
+    :type    baseline_cvr: float or numpy array
+    :param   expected_uplift: the uplift of the conversion rate (absolute value)
+    :type    expected_uplift: float or numpy array
+    :param   sample_size: the total sample size of control and variation
+    :type    sample_size: int or numpy array
+    :param   sig_level: (optional) the significance level
+    :type    sig_level: float or numpy array
+    :param   split: (optional) the share of the traffic that goes to the variation
+    :type    split: float or numpy array
+    :param   alternative: (optional) the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: string
+    :return: the power
+    :rtype:  numpy array
+    """
+    baseline_cvr, expected_uplift, split = _check_rates(baseline_cvr, expected_uplift, split)
+    z_alpha = _z_alpha(sig_level, alternative)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        effect = expected_uplift * np.sqrt(np.asarray(sample_size, dtype=np.float64) / _pooled_variance(baseline_cvr, expected_uplift, split))
+    if alternative == 'two-sided':
+        return ndtr(effect - z_alpha) + ndtr(-effect - z_alpha)
+    return ndtr(effect - z_alpha) if alternative == 'larger' else ndtr(-effect - z_alpha)
+
+
+def simulate_power(baseline_cvr, expected_uplift, sample_size, sig_level=0.05, split=0.5, alternative='two-sided',
+                   simulations=2000, seed=None, max_draws=2 ** 22):
+    """
+    Estimates the power of a test of the proportions with Monte Carlo. For every combination of the (broadcast)
+    arguments the conversions of control and variation are drawn from binomials and evaluated with the statistics
+    kernel of the experiment, all the combinations and simulations at once in chunks of at most max_draws draws.
+    :param   baseline_cvr: the conversion rate of the control group
+    :type    baseline_cvr: float or numpy array
+    :param   expected_uplift: the uplift of the conversion rate (absolute value)
+    :type    expected_uplift: float or numpy array
+    :param   sample_size: the total sample size of control and variation
+    :type    sample_size: int or numpy array
+    :param   sig_level: (optional) the significance level
+    :type    sig_level: float or numpy array
+    :param   split: (optional) the share of the traffic that goes to the variation
+    :type    split: float or numpy array
+    :param   alternative: (optional) the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: string
+    :param   simulations: (optional) the number of simulated tests per combination
+    :type    simulations: int
+    :param   seed: (optional) the seed or the numpy Generator of the random numbers
+    :type    seed: int or numpy.random.Generator
+    :param   max_draws: (optional) the maximum number of simulated tests that are held in memory at once
+    :type    max_draws: int
+    :return: the share of the simulated tests that are significant
+    :rtype:  numpy array
+    """
+    _z_alpha(sig_level, alternative)
+    baseline_cvr, expected_uplift, split = _check_rates(baseline_cvr, expected_uplift, split)
+    baseline_cvr, expected_uplift, sample_size, sig_level, split = np.broadcast_arrays(
+        baseline_cvr, expected_uplift, np.asarray(sample_size, dtype=np.int64), np.asarray(sig_level, dtype=np.float64), split)
+    shape = baseline_cvr.shape
+    n_variation = np.round(sample_size.ravel() * split.ravel()).astype(np.int64)[:, None]
+    n_control = sample_size.ravel()[:, None] - n_variation
+    p_control = baseline_cvr.ravel()[:, None]
+    p_variation = p_control + expected_uplift.ravel()[:, None]
+    sig_level = sig_level.ravel()[:, None]
+
+    rng = np.random.default_rng(seed)
+    significant = np.zeros(len(p_control), dtype=np.int64)
+    chunk = max(1, int(max_draws) // max(len(p_control), 1))
+    for start in range(0, simulations, chunk):
+        size = (len(p_control), min(chunk, simulations - start))
+        conv_variation = rng.binomial(n_variation, p_variation, size)
+        conv_control = rng.binomial(n_control, p_control, size)
+        p_value = proportions_test(conv_variation, n_variation, conv_control, n_control, alternative=alternative)['p-value']
+        significant += (p_value < sig_level).sum(axis=1)
+    logger.debug('Simulated {} tests for {} combinations.'.format(simulations, len(p_control)))
+    return (significant / float(simulations)).reshape(shape)
+
+
+def sample_size_grid(baseline_cvr, expected_uplift, power=0.8, sig_level=0.05, split=0.5, alternative='two-sided',
+                     simulations=None, seed=None):
+    """
+    Returns the sample sizes of every combination of baselines, uplifts, powers, significance levels and traffic
+    splits, e.g. sample_size_grid([0.1, 0.2], [0.01, 0.02], power=[0.8, 0.9]) has 8 rows.
+    With simulations, the power of the rounded sample sizes is also checked with simulate_power.
+    :param   baseline_cvr: the conversion rates of the control group
+    :type    baseline_cvr: float or list of floats
+    :param   expected_uplift: the expected uplifts of the conversion rate (absolute values)
+    :type    expected_uplift: float or list of floats
+    :param   power: (optional) the powers
+    :type    power: float or list of floats
+    :param   sig_level: (optional) the significance levels
+    :type    sig_level: float or list of floats
+    :param   split: (optional) the shares of the traffic that go to the variation
+    :type    split: float or list of floats
+    :param   alternative: (optional) the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: string
+    :param   simulations: (optional) the number of simulated tests per row, no simulation if it is not set
+    :type    simulations: int
+    :param   seed: (optional) the seed or the numpy Generator of the random numbers
+    :type    seed: int or numpy.random.Generator
+    :return: dataframe with a row per combination and the 'control_sample_size', 'variation_sample_size' and
+             'sample_size' (and 'simulated_power') columns
+    :rtype:  dataframe
+    """
+    grid = _grid(baseline_cvr=baseline_cvr, expected_uplift=expected_uplift, power=power, sig_level=sig_level, split=split)
+    total = get_total_sample_size(grid['baseline_cvr'].values, grid['expected_uplift'].values, power=grid['power'].values,
+                                  sig_level=grid['sig_level'].values, split=grid['split'].values, alternative=alternative)
+    grid['control_sample_size'] = np.ceil(total * (1 - grid['split'].values))
+    grid['variation_sample_size'] = np.ceil(total * grid['split'].values)
+    grid['sample_size'] = grid['control_sample_size'] + grid['variation_sample_size']
+    if simulations:
+        grid['simulated_power'] = simulate_power(grid['baseline_cvr'].values, grid['expected_uplift'].values,
+                                                 grid['sample_size'].values, sig_level=grid['sig_level'].values,
+                                                 split=grid['variation_sample_size'].values / grid['sample_size'].values,
+                                                 alternative=alternative, simulations=simulations, seed=seed)
+    return grid
+
+
+def power_grid(baseline_cvr, expected_uplift, sample_size, sig_level=0.05, split=0.5, alternative='two-sided',
+               simulations=None, seed=None):
+    """
+    Returns the analytic power of every combination of baselines, uplifts, sample sizes, significance levels and
+    traffic splits. With simulations, it is also estimated with simulate_power.
+    :param   baseline_cvr: the conversion rates of the control group
+    :type    baseline_cvr: float or list of floats
+    :param   expected_uplift: the uplifts of the conversion rate (absolute values)
+    :type    expected_uplift: float or list of floats
+    :param   sample_size: the total sample sizes of control and variation
+    :type    sample_size: int or list of ints
+    :param   sig_level: (optional) the significance levels
+    :type    sig_level: float or list of floats
+    :param   split: (optional) the shares of the traffic that go to the variation
+    :type    split: float or list of floats
+    :param   alternative: (optional) the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: string
+    :param   simulations: (optional) the number of simulated tests per row, no simulation if it is not set
+    :type    simulations: int
+    :param   seed: (optional) the seed or the numpy Generator of the random numbers
+    :type    seed: int or numpy.random.Generator
+    :return: dataframe with a row per combination and the 'power' (and 'simulated_power') columns
+    :rtype:  dataframe
+    """
+    grid = _grid(baseline_cvr=baseline_cvr, expected_uplift=expected_uplift, sample_size=sample_size, sig_level=sig_level,
+                 split=split)
+    arguments = dict(sig_level=grid['sig_level'].values, split=grid['split'].values, alternative=alternative)
+    rates = (grid['baseline_cvr'].values, grid['expected_uplift'].values, grid['sample_size'].values)
+    grid['power'] = get_power(*rates, **arguments)
+    if simulations:
+        grid['simulated_power'] = simulate_power(*rates, simulations=simulations, seed=seed, **arguments)
+    return grid
+
+
+def _grid(**parameters):
+    # the cartesian product of the values of the parameters, one column per parameter
+    values = [np.atleast_1d(np.asarray(value)) for value in parameters.values()]
+    mesh = np.meshgrid(*values, indexing='ij')
+    return pd.DataFrame({name: column.ravel() for name, column in zip(parameters, mesh)})
+
+
+def _check_rates(baseline_cvr, expected_uplift, split):
+    baseline_cvr = np.asarray(baseline_cvr, dtype=np.float64)
+    expected_uplift = np.asarray(expected_uplift, dtype=np.float64)
+    split = np.asarray(split, dtype=np.float64)
+    variation_cvr = baseline_cvr + expected_uplift
+    if ((baseline_cvr <= 0) | (baseline_cvr >= 1) | (variation_cvr <= 0) | (variation_cvr >= 1)).any():
+        raise ValueError("baseline_cvr and baseline_cvr + expected_uplift should be >0 and <1")
+    if ((split <= 0) | (split >= 1)).any():
+        raise ValueError("split should be >0 and <1 : {}".format(split))
+    return baseline_cvr, expected_uplift, split
+
+
+def _z_alpha(sig_level, alternative):
+    if alternative not in ALTERNATIVES:
+        raise ValueError("alternative should be one of {} : {}".format(ALTERNATIVES, alternative))
+    sig_level = np.asarray(sig_level, dtype=np.float64)
+    return ndtri(1 - sig_level / 2) if alternative == 'two-sided' else ndtri(1 - sig_level)
+
+
+def _pooled_variance(baseline_cvr, expected_uplift, split):
+    # the variance of the difference of the rates times the total sample size, with the pooled rate of the test
+    pooled_prob = baseline_cvr + split * expected_uplift
+    return pooled_prob * (1 - pooled_prob) * (1 / split + 1 / (1 - split))
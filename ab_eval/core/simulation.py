@@ -0,0 +1,86 @@
+import logging
+import numpy as np
+from ab_eval.core.statistics import proportions_test
+
+logger = logging.getLogger(__name__)
+
+
+def draw_experiments(n_experiments, sample_size, p_control, p_variation, split=0.5, seed=None):
+    """
+    Draws the counts of many synthetic experiments at once, as generate_random_cvr_data would aggregate them: every
+    session goes to the variation with probability split and converts with the probability of its group.
+    :param   n_experiments: the number of experiments
+    :type    n_experiments: int
+    :param   sample_size: the number of sessions of every experiment
+    :type    sample_size: int
+    :param   p_control: the conversion rate of the control group
+    :type    p_control: float
+    :param   p_variation: the conversion rate of the variation, equal to p_control for A/A tests
+    :type    p_variation: float
+    :param   split: (optional) the probability of a session to go to the variation
+    :type    split: float
+    :param   seed: (optional) the seed or the numpy Generator of the random numbers
+    :type    seed: int or numpy.random.Generator
+    :return: conversions and sample sizes of variation and control, one element per experiment
+    :rtype:  tuple of 4 numpy arrays
+    """
+    rng = np.random.default_rng(seed)
+    n_variation = rng.binomial(sample_size, split, n_experiments)
+    n_control = sample_size - n_variation
+    return rng.binomial(n_variation, p_variation), n_variation, rng.binomial(n_control, p_control), n_control
+
+
+def simulate_experiments(n_experiments, sample_size, p_control, p_variation, split=0.5, alternative='two-sided',
+                         significance_level=0.05, seed=None, chunk_size=100000):
+    """
+    Simulates many A/A (p_variation equal to p_control) or A/B experiments and evaluates them with the statistics
+    kernel of experiment, to check the calibration of the p-values and the confidence intervals. The experiments
+    are drawn and evaluated in chunks of chunk_size, so the memory stays bounded.
+
+        simulate_experiments(20000, 10000, 0.3, 0.3, seed=1)['false_positive_rate']  # close to 0.05
+
+    :param   n_experiments: the number of experiments
+    :type    n_experiments: int
+    :param   sample_size: the number of sessions of every experiment
+    :type    sample_size: int
+    :param   p_control: the conversion rate of the control group
+    :type    p_control: float
+    :param   p_variation: the conversion rate of the variation
+    :type    p_variation: float
+    :param   split: (optional) the probability of a session to go to the variation
+    :type    split: float
+    :param   alternative: (optional) the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: string
+    :param   significance_level: (optional) the significance level of the tests and the confidence intervals
+    :type    significance_level: float
+    :param   seed: (optional) the seed or the numpy Generator of the random numbers
+    :type    seed: int or numpy.random.Generator
+    :param   chunk_size: (optional) the number of experiments that are drawn and evaluated at once
+    :type    chunk_size: int
+    :return: the share of significant experiments ('false_positive_rate' for A/A tests, 'power' otherwise), the share
+             of confidence intervals that cover the true relative uplift ('coverage') and their mean width
+    :rtype:  dict
+    """
+    rng = np.random.default_rng(seed)
+    true_uplift = (p_variation - p_control) / float(p_control)
+    significant, covered, width, evaluated = 0, 0, 0., 0
+    for start in range(0, n_experiments, chunk_size):
+        counts = draw_experiments(min(chunk_size, n_experiments - start), sample_size, p_control, p_variation, split=split, seed=rng)
+        stats = proportions_test(*counts, alternative=alternative, significance_level=significance_level)
+        # experiments without conversions in a group have no p-value nor interval and count as not significant
+        valid = np.isfinite(stats['lower_limit']) & np.isfinite(stats['upper_limit'])
+        significant += int((stats['p-value'] < significance_level).sum())
+        covered += int(((stats['lower_limit'] <= true_uplift) & (true_uplift <= stats['upper_limit']))[valid].sum())
+        width += float((stats['upper_limit'] - stats['lower_limit'])[valid].sum())
+        evaluated += int(valid.sum())
+    logger.debug('Simulated {} experiments with sample_size={}.'.format(n_experiments, sample_size))
+
+    rejection_rate = significant / float(n_experiments)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'experiments': n_experiments,
+            'false_positive_rate' if p_variation == p_control else 'power': rejection_rate,
+            'coverage': float(np.float64(covered) / evaluated),
+            'mean_interval_width': float(np.float64(width) / evaluated),
+            'true_relative_uplift': true_uplift
+        }
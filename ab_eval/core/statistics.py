@@ -0,0 +1,576 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.special import betainc, betaincinv, betaln, chdtrc, ndtr, ndtri, stdtr, stdtrit
+
+logger = logging.getLogger(__name__)
+
+# the smallest Beta parameter that is sampled with the Wilson-Hilferty approximation of the Gamma distribution
+MIN_SAMPLED_SHAPE = 1000
+
+
+def proportions_test(conv_variation, n_variation, conv_control, n_control, alternative='two-sided', significance_level=0.05):
+    """
+    Batch kernel that evaluates many variation vs control comparisons of conversion rates at once.
+    Every argument is an array with one element per comparison (e.g. per kpi, segment and date).
+
+    :param   conv_variation: the conversions of the variation
+    :type    conv_variation: numpy array
+    :param   n_variation: the sample sizes of the variation
+    :type    n_variation: numpy array
+    :param   conv_control: the conversions of the control group
+    :type    conv_control: numpy array
+    :param   n_control: the sample sizes of the control group
+    :type    n_control: numpy array
+    :param   alternative: the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: str
+    :param   significance_level: the significance level of the confidence intervals
+    :type    significance_level: float
+    :return: dict with arrays of z-scores, p-values, relative uplifts, standard errors and confidence interval limits
+    :rtype:  dict
+    """
+    conv_variation = np.asarray(conv_variation, dtype=np.float64)
+    n_variation = np.asarray(n_variation, dtype=np.float64)
+    conv_control = np.asarray(conv_control, dtype=np.float64)
+    n_control = np.asarray(n_control, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_variation = conv_variation / n_variation
+        rate_control = conv_control / n_control
+
+        # pooled two sample z-test, same arithmetic as statsmodels proportions_ztest
+        p_pooled = (conv_variation + conv_control) / (n_variation + n_control)
+        std_diff = np.sqrt(p_pooled * (1 - p_pooled) * (1. / n_variation + 1. / n_control))
+        z_score = (rate_variation - rate_control) / std_diff
+        p_value = get_p_val_of_z_score(z_score, alternative)
+
+        uplift = (rate_variation - rate_control) / rate_control
+
+        std_variation = np.sqrt(rate_variation * (1 - rate_variation))
+        std_control = np.sqrt(rate_control * (1 - rate_control))
+        standard_error_variation = std_variation / np.sqrt(n_variation)
+        standard_error_control = std_control / np.sqrt(n_control)
+
+        # http://onlinestatbook.com/2/estimation/difference_means.html
+        pooled_variance = ((n_variation - 1) * std_variation ** 2 + (n_control - 1) * std_control ** 2) / (n_variation + n_control - 2)
+        pooled_std = np.sqrt(pooled_variance)
+        standard_error_difference = pooled_std * np.sqrt(1 / n_variation + 1 / n_control)
+    # same quantile as utils.get_z_val, without importing the data helpers of utils
+    z = ndtri(1 - significance_level / 2) if alternative == 'two-sided' else ndtri(1 - significance_level)
+
+    return {
+        'z-score': z_score,
+        'p-value': p_value,
+        'relative_conversion_uplift': uplift,
+        'variation_standard_error': standard_error_variation,
+        'control_standard_error': standard_error_control,
+        'lower_limit': uplift - z * standard_error_difference,
+        'upper_limit': uplift + z * standard_error_difference
+    }
+
+
+def welch_test(sum_variation, n_variation, sum_sq_variation, sum_control, n_control, sum_sq_control, alternative='two-sided',
+               significance_level=0.05):
+    """
+    Batch kernel that evaluates many variation vs control comparisons of the means of a continuous metric (e.g. revenue
+    or basket size) with Welch's t-test. Every argument is an array with one element per comparison, and the means and
+    variances are computed directly from the count, the sum and the sum of squares of the values of every group.
+
+    :param   sum_variation: the sum of the values of the variation
+    :type    sum_variation: numpy array
+    :param   n_variation: the number of values of the variation
+    :type    n_variation: numpy array
+    :param   sum_sq_variation: the sum of the squared values of the variation
+    :type    sum_sq_variation: numpy array
+    :param   sum_control: the sum of the values of the control group
+    :type    sum_control: numpy array
+    :param   n_control: the number of values of the control group
+    :type    n_control: numpy array
+    :param   sum_sq_control: the sum of the squared values of the control group
+    :type    sum_sq_control: numpy array
+    :param   alternative: the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: str
+    :param   significance_level: the significance level of the confidence intervals
+    :type    significance_level: float
+    :return: dict with arrays of t-scores, degrees of freedom, p-values, relative uplifts, standard errors and
+             confidence interval limits of the relative uplift
+    :rtype:  dict
+    """
+    sum_variation = np.asarray(sum_variation, dtype=np.float64)
+    n_variation = np.asarray(n_variation, dtype=np.float64)
+    sum_sq_variation = np.asarray(sum_sq_variation, dtype=np.float64)
+    sum_control = np.asarray(sum_control, dtype=np.float64)
+    n_control = np.asarray(n_control, dtype=np.float64)
+    sum_sq_control = np.asarray(sum_sq_control, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_variation = sum_variation / n_variation
+        mean_control = sum_control / n_control
+        # unbiased sample variances, clipped at zero against the rounding of sum_sq - sum ** 2 / n
+        variance_variation = np.maximum(sum_sq_variation - sum_variation * mean_variation, 0) / (n_variation - 1)
+        variance_control = np.maximum(sum_sq_control - sum_control * mean_control, 0) / (n_control - 1)
+
+        squared_error_variation = variance_variation / n_variation
+        squared_error_control = variance_control / n_control
+        standard_error_difference = np.sqrt(squared_error_variation + squared_error_control)
+        difference = mean_variation - mean_control
+        t_score = difference / standard_error_difference
+        # Welch-Satterthwaite degrees of freedom
+        degrees_of_freedom = (squared_error_variation + squared_error_control) ** 2 / (
+            squared_error_variation ** 2 / (n_variation - 1) + squared_error_control ** 2 / (n_control - 1))
+        p_value = get_p_val_of_t_score(t_score, degrees_of_freedom, alternative)
+
+        quantile = 1 - significance_level / 2 if alternative == 'two-sided' else 1 - significance_level
+        margin = stdtrit(degrees_of_freedom, quantile) * standard_error_difference
+        uplift = difference / mean_control
+
+        return {
+            't-score': t_score,
+            'degrees_of_freedom': degrees_of_freedom,
+            'p-value': p_value,
+            'relative_uplift': uplift,
+            'variation_standard_error': np.sqrt(squared_error_variation),
+            'control_standard_error': np.sqrt(squared_error_control),
+            'lower_limit': (difference - margin) / mean_control,
+            'upper_limit': (difference + margin) / mean_control
+        }
+
+
+def beta_binomial_test(conv_variation, n_variation, conv_control, n_control, prior=(1, 1), max_terms=100000, tolerance=1e-3,
+                       max_samples=200000, batch_size=10000, seed=0):
+    """
+    Batch kernel of the Bayesian comparison of conversion rates with Beta-Binomial posteriors. Every argument is an
+    array with one element per comparison. The probability that the variation beats the control and the expected
+    losses are exact (closed form) when the posteriors have integer parameters and one of them is at most max_terms.
+    When all the parameters are at least MIN_SAMPLED_SHAPE and larger than max_terms they are estimated with Monte
+    Carlo, in batches of batch_size draws until their standard error is under tolerance, and the other comparisons (e.g.
+    the ones of non-integer priors) are integrated numerically. The draws of a comparison depend only on its own counts
+    and on the seed, so the results do not depend on the other comparisons of the batch.
+
+    :param   conv_variation: the conversions of the variation
+    :type    conv_variation: numpy array
+    :param   n_variation: the sample sizes of the variation
+    :type    n_variation: numpy array
+    :param   conv_control: the conversions of the control group
+    :type    conv_control: numpy array
+    :param   n_control: the sample sizes of the control group
+    :type    n_control: numpy array
+    :param   prior: (optional) the alpha and beta parameters of the Beta prior of both groups
+    :type    prior: tuple
+    :param   max_terms: (optional) the maximum number of terms of the closed form of a comparison
+    :type    max_terms: int
+    :param   tolerance: (optional) the standard error at which the Monte Carlo estimates stop
+    :type    tolerance: float
+    :param   max_samples: (optional) the maximum number of Monte Carlo draws per comparison
+    :type    max_samples: int
+    :param   batch_size: (optional) the number of Monte Carlo draws per comparison of every batch
+    :type    batch_size: int
+    :param   seed: (optional) the seed of the Monte Carlo draws
+    :type    seed: int
+    :return: dict with arrays of the probability to beat the control, the expected losses of choosing the variation
+             and the control, the posterior means and whether the results are exact (closed form or numerical integration)
+    :rtype:  dict
+    """
+    alpha_variation = np.asarray(conv_variation, dtype=np.float64) + prior[0]
+    beta_variation = np.asarray(n_variation, dtype=np.float64) - conv_variation + prior[1]
+    alpha_control = np.asarray(conv_control, dtype=np.float64) + prior[0]
+    beta_control = np.asarray(n_control, dtype=np.float64) - conv_control + prior[1]
+    alpha_variation, beta_variation, alpha_control, beta_control = np.broadcast_arrays(
+        alpha_variation, beta_variation, alpha_control, beta_control)
+    parameters = np.stack([alpha_control, beta_control, alpha_variation, beta_variation])
+
+    valid = (parameters > 0).all(axis=0)
+    smallest = np.where(valid, parameters.min(axis=0), np.inf)
+    closed_form = valid & (smallest <= max_terms) & (parameters == np.round(parameters)).all(axis=0)
+    sampled = valid & ~closed_form & (smallest > max_terms) & (smallest >= MIN_SAMPLED_SHAPE)
+    integrated = valid & ~closed_form & ~sampled
+
+    results = {name: np.full(alpha_variation.shape, np.nan) for name in
+               ('probability_to_beat_control', 'expected_loss_variation', 'expected_loss_control')}
+    for kernel, cells in [(_beta_closed_form, closed_form), (_beta_quadrature, integrated)]:
+        if cells.any():
+            for name, values in zip(results, kernel(*parameters[:, cells])):
+                results[name][cells] = values
+    if sampled.any():
+        for name, values in zip(results, _beta_monte_carlo(parameters[:, sampled], tolerance, max_samples, batch_size, seed)):
+            results[name][sampled] = values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        results['variation_posterior_mean'] = alpha_variation / (alpha_variation + beta_variation)
+        results['control_posterior_mean'] = alpha_control / (alpha_control + beta_control)
+    results['exact'] = closed_form | integrated
+    return results
+
+
+def _beta_closed_form(alpha_control, beta_control, alpha_variation, beta_variation):
+    # the probability to beat the control and the expected losses, from three probabilities of the closed form
+    mean_variation = alpha_variation / (alpha_variation + beta_variation)
+    mean_control = alpha_control / (alpha_control + beta_control)
+    beats = _probability_greater(alpha_control, beta_control, alpha_variation, beta_variation)
+    beats_shifted_control = _probability_greater(alpha_control + 1, beta_control, alpha_variation, beta_variation)
+    beats_shifted_variation = _probability_greater(alpha_control, beta_control, alpha_variation + 1, beta_variation)
+    # E[max(control - variation, 0)] and E[max(variation - control, 0)]
+    loss_variation = mean_control * (1 - beats_shifted_control) - mean_variation * (1 - beats_shifted_variation)
+    loss_control = mean_variation * beats_shifted_variation - mean_control * beats_shifted_control
+    return beats, np.maximum(loss_variation, 0), np.maximum(loss_control, 0)
+
+
+def _beta_quadrature(alpha_control, beta_control, alpha_variation, beta_variation, n_nodes=512, max_cells=1 << 20):
+    """
+    The probability to beat the control and the expected losses by Gauss-Legendre integration over the quantiles of the
+    posterior with the smaller variance, X, where the integrands are smooth:
+    P(Y > X) = E[1 - F_Y(X)] and E[max(X - Y, 0)] = E[X F_Y(X) - E[Y] F'_Y(X)], with F'_Y the Beta(alpha_Y + 1, beta_Y) cdf
+    """
+    nodes, weights = np.polynomial.legendre.leggauss(n_nodes)
+    quantiles, weights = (nodes + 1) / 2, weights / 2
+    variance_control = alpha_control * beta_control / ((alpha_control + beta_control) ** 2 * (alpha_control + beta_control + 1))
+    variance_variation = alpha_variation * beta_variation / ((alpha_variation + beta_variation) ** 2 * (alpha_variation + beta_variation + 1))
+    over_variation = variance_variation < variance_control
+    alpha_x, beta_x = np.where(over_variation, alpha_variation, alpha_control), np.where(over_variation, beta_variation, beta_control)
+    alpha_y, beta_y = np.where(over_variation, alpha_control, alpha_variation), np.where(over_variation, beta_control, beta_variation)
+    mean_x, mean_y = alpha_x / (alpha_x + beta_x), alpha_y / (alpha_y + beta_y)
+
+    y_greater, x_loss = np.empty(len(alpha_x)), np.empty(len(alpha_x))
+    step = max(1, max_cells // n_nodes)
+    for start in range(0, len(alpha_x), step):
+        cells = slice(start, start + step)
+        x = betaincinv(alpha_x[cells, None], beta_x[cells, None], quantiles)
+        cdf_y = betainc(alpha_y[cells, None], beta_y[cells, None], x)
+        y_greater[cells] = (1 - cdf_y) @ weights
+        x_loss[cells] = (x * cdf_y - mean_y[cells, None] * betainc(alpha_y[cells, None] + 1, beta_y[cells, None], x)) @ weights
+    y_loss = x_loss + mean_y - mean_x
+    # x_loss is E[max(X - Y, 0)], the loss of choosing Y
+    beats = np.where(over_variation, 1 - y_greater, y_greater)
+    loss_variation = np.where(over_variation, y_loss, x_loss)
+    loss_control = np.where(over_variation, x_loss, y_loss)
+    return np.clip(beats, 0, 1), np.maximum(loss_variation, 0), np.maximum(loss_control, 0)
+
+
+def _probability_greater(alpha_1, beta_1, alpha_2, beta_2, max_cells=1 << 22):
+    """
+    P(X2 > X1) for X1 ~ Beta(alpha_1, beta_1) and X2 ~ Beta(alpha_2, beta_2) with integer parameters, with the
+    closed form that sums over alpha_2 (Evan Miller, https://www.evanmiller.org/bayesian-ab-testing.html). With the
+    symmetries of the Beta distributions the sum runs over the smallest of the four parameters. The sums of all the
+    comparisons are computed at once, in chunks of at most max_cells terms.
+    """
+    parameters = np.stack([alpha_1, beta_1, alpha_2, beta_2])
+    choice = parameters.argmin(axis=0)
+    # the (x1, y1, x2, y2) arguments of the sum over x2 when each of the four parameters is the smallest one, e.g.
+    # P(X2 > X1) = 1 - P(X1 > X2) sums over alpha_1 and P(X2 > X1) = P(1 - X1 > 1 - X2) sums over beta_1
+    arrangements = np.array([[2, 3, 0, 1], [3, 2, 1, 0], [0, 1, 2, 3], [1, 0, 3, 2]])
+    complement = np.array([True, False, False, True])[choice]
+    x1, y1, x2, y2 = np.take_along_axis(parameters, arrangements[choice].T, axis=0)
+
+    probability = np.empty(len(x1))
+    order = np.argsort(x2, kind='mergesort')
+    sorted_terms = x2[order]
+    start = 0
+    while start < len(order):
+        # the largest chunk of comparisons, sorted by their number of terms, with at most max_cells terms
+        sizes = sorted_terms[start:] * np.arange(1, len(order) - start + 1)
+        chunk = order[start:start + max(1, int(np.searchsorted(sizes, max_cells, side='right')))]
+        i = np.arange(int(x2[chunk].max()))[None, :]
+        a1, b1, b2 = x1[chunk, None], y1[chunk, None], y2[chunk, None]
+        # the first term with betaln and the next ones with the ratios of consecutive terms
+        log_first = betaln(a1, b1 + b2) - np.log(b2) - betaln(1, b2) - betaln(a1, b1)
+        log_ratios = np.log((a1 + i[:, :-1]) * (b2 + i[:, :-1]) / ((a1 + b1 + b2 + i[:, :-1]) * (1 + i[:, :-1])))
+        log_terms = log_first + np.concatenate([np.zeros_like(log_first), np.cumsum(log_ratios, axis=1)], axis=1)
+        probability[chunk] = np.where(i < x2[chunk, None], np.exp(log_terms), 0).sum(axis=1)
+        start += len(chunk)
+    probability = np.clip(probability, 0, 1)
+    return np.where(complement, 1 - probability, probability)
+
+
+def _beta_monte_carlo(parameters, tolerance, max_samples, batch_size, seed):
+    """
+    Monte Carlo estimates of the probability to beat the control and of the expected losses. All the comparisons share
+    the same standard normal draws, that are turned into Gamma draws with the Wilson-Hilferty transformation, which is
+    accurate only for large parameters (at least MIN_SAMPLED_SHAPE). Every comparison stops on its own once the
+    standard error of its probability is under the tolerance.
+    """
+    rng = np.random.default_rng(seed)
+    n_comparisons = parameters.shape[1]
+    sums = np.zeros((3, n_comparisons))
+    counts = np.zeros(n_comparisons)
+    active = np.arange(n_comparisons)
+    while len(active) and counts[active[0]] < max_samples:
+        normals = rng.standard_normal((4, batch_size))
+        gammas = [_wilson_hilferty(parameters[p, active, None], normals[p]) for p in range(4)]
+        control = gammas[0] / (gammas[0] + gammas[1])
+        variation = gammas[2] / (gammas[2] + gammas[3])
+        sums[:, active] += np.stack([(variation > control).sum(axis=1), np.maximum(control - variation, 0).sum(axis=1),
+                                     np.maximum(variation - control, 0).sum(axis=1)])
+        counts[active] += batch_size
+        probability = sums[0, active] / counts[active]
+        active = active[np.sqrt(probability * (1 - probability) / counts[active]) >= tolerance]
+    return sums / counts
+
+
+def _wilson_hilferty(shape, normals):
+    return shape * (1 - 1 / (9 * shape) + normals / (3 * np.sqrt(shape))) ** 3
+
+
+def bootstrap_proportions(conv_variation, n_variation, conv_control, n_control, n_resamples=10000, alternative='two-sided',
+                          significance_level=0.05, seed=0, chunk_size=1000, n_workers=1):
+    """
+    Batch kernel of the bootstrap confidence intervals of the relative conversion uplift. Every argument is an array with
+    one element per comparison. The sessions of every group are resampled with replacement, which for aggregated
+    counts means that the resampled conversions of a group are binomial with the sample size and the conversion rate
+    of the group. The limits are the percentiles of the resampled uplifts, see bootstrap_days for the chunks.
+
+    :param   conv_variation: the conversions of the variation
+    :type    conv_variation: numpy array
+    :param   n_variation: the sample sizes of the variation
+    :type    n_variation: numpy array
+    :param   conv_control: the conversions of the control group
+    :type    conv_control: numpy array
+    :param   n_control: the sample sizes of the control group
+    :type    n_control: numpy array
+    :param   n_resamples: (optional) the number of bootstrap resamples
+    :type    n_resamples: int
+    :param   alternative: (optional) the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: str
+    :param   significance_level: (optional) the significance level of the confidence intervals
+    :type    significance_level: float
+    :param   seed: (optional) the seed of the resamples
+    :type    seed: int
+    :param   chunk_size: (optional) the number of resamples that are drawn at once
+    :type    chunk_size: int
+    :param   n_workers: (optional) the number of threads that draw the chunks
+    :type    n_workers: int
+    :return: dict with arrays of the relative uplifts and the confidence interval limits
+    :rtype:  dict
+    """
+    n_variation = np.round(np.asarray(n_variation, dtype=np.float64)).astype(np.int64)
+    n_control = np.round(np.asarray(n_control, dtype=np.float64)).astype(np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_variation = np.nan_to_num(np.asarray(conv_variation, dtype=np.float64) / n_variation)
+        rate_control = np.nan_to_num(np.asarray(conv_control, dtype=np.float64) / n_control)
+
+    def draw(rng, size):
+        resampled_variation = rng.binomial(n_variation[:, None], rate_variation[:, None], (len(n_variation), size))
+        resampled_control = rng.binomial(n_control[:, None], rate_control[:, None], (len(n_control), size))
+        return (resampled_variation * n_control[:, None]) / (resampled_control * n_variation[:, None]) - 1.
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        uplift = rate_variation / rate_control - 1 if len(n_variation) else np.empty(0)
+        uplift = np.where((n_variation > 0) & (n_control > 0), uplift, np.nan)
+    return _bootstrap(draw, uplift, n_resamples, alternative, significance_level, seed, chunk_size, n_workers)
+
+
+def bootstrap_days(numerator_variation, denominator_variation, numerator_control, denominator_control, n_resamples=10000,
+                   alternative='two-sided', significance_level=0.05, seed=0, chunk_size=1000, n_workers=1):
+    """
+    Batch kernel of the bootstrap confidence intervals of the relative uplift of a ratio metric (conversions over sample
+    size, or sum over count for continuous kpis), that resamples the days of the experiment. Every argument has shape
+    (comparisons, days) and every resample draws the days with replacement. The resampled days are shared by both groups
+    and all the comparisons, so the day to day variation is part of the intervals and the resamples of a comparison
+    depend only on its own counts and on the seed.
+    The resamples are drawn in chunks of chunk_size, optionally by a pool of n_workers threads, and only the order
+    statistics that the percentiles need are kept, so the memory stays bounded. The limits are the same as the ones of
+    numpy.quantile over all the resamples, and they do not depend on n_workers. With a single day there is nothing to
+    resample and a ValueError is raised.
+
+    :param   numerator_variation: the daily conversions (or sums) of the variation
+    :type    numerator_variation: numpy array
+    :param   denominator_variation: the daily sample sizes (or counts) of the variation
+    :type    denominator_variation: numpy array
+    :param   numerator_control: the daily conversions (or sums) of the control group
+    :type    numerator_control: numpy array
+    :param   denominator_control: the daily sample sizes (or counts) of the control group
+    :type    denominator_control: numpy array
+    :param   n_resamples: (optional) the number of bootstrap resamples
+    :type    n_resamples: int
+    :param   alternative: (optional) the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: str
+    :param   significance_level: (optional) the significance level of the confidence intervals
+    :type    significance_level: float
+    :param   seed: (optional) the seed of the resamples
+    :type    seed: int
+    :param   chunk_size: (optional) the number of resamples that are drawn at once
+    :type    chunk_size: int
+    :param   n_workers: (optional) the number of threads that draw the chunks
+    :type    n_workers: int
+    :return: dict with arrays of the relative uplifts and the confidence interval limits
+    :rtype:  dict
+    """
+    counts = [np.atleast_2d(np.asarray(array, dtype=np.float64))
+              for array in (numerator_variation, denominator_variation, numerator_control, denominator_control)]
+    n_days = counts[0].shape[1]
+    if n_days < 2:
+        raise ValueError("The days bootstrap needs at least 2 days to resample : {}".format(n_days))
+
+    def draw(rng, size):
+        # C ordered weights, the gemm of some OpenBLAS builds gives wrong products with the transposed (F ordered) ones
+        weights = np.ascontiguousarray(rng.multinomial(n_days, np.full(n_days, 1. / n_days), size).T, dtype=np.float64)
+        num_variation, den_variation, num_control, den_control = [array @ weights for array in counts]
+        return (num_variation * den_control) / (num_control * den_variation) - 1.
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        totals = [array.sum(axis=1) for array in counts]
+        uplift = (totals[0] * totals[3]) / (totals[2] * totals[1]) - 1.
+    return _bootstrap(draw, uplift, n_resamples, alternative, significance_level, seed, chunk_size, n_workers)
+
+
+def _bootstrap(draw, uplift, n_resamples, alternative, significance_level, seed, chunk_size, n_workers):
+    """
+    Draws the resamples in chunks, each with its own generator spawned from the seed, and keeps the smallest and the
+    largest uplifts of every comparison that the linear interpolation of the percentiles needs. A comparison with a
+    NaN resample (e.g. no sessions in a group) gets NaN limits, like numpy.quantile.
+    """
+    tail = significance_level / 2 if alternative == 'two-sided' else significance_level
+    positions = (n_resamples - 1) * np.array([tail, 1 - tail])
+    indices = np.floor(positions).astype(np.int64)
+    n_smallest, n_largest = min(n_resamples, indices[0] + 2), n_resamples - indices[1]
+    sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    def tails(seed_sequence, size):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            uplifts = draw(np.random.default_rng(seed_sequence), size)
+        return _smallest(uplifts, n_smallest), -_smallest(-uplifts, n_largest), np.isnan(uplifts).any(axis=1)
+
+    smallest, largest, missing = np.empty((len(uplift), 0)), np.empty((len(uplift), 0)), np.zeros(len(uplift), dtype=bool)
+    executor = ThreadPoolExecutor(max_workers=n_workers) if n_workers > 1 and len(sizes) > 1 else None
+    try:
+        # the chunks are merged in order, so the limits do not depend on the number of workers
+        for chunk_smallest, chunk_largest, chunk_missing in (executor.map if executor else map)(tails, seeds, sizes):
+            smallest = _smallest(np.concatenate([smallest, chunk_smallest], axis=1), n_smallest)
+            largest = -_smallest(-np.concatenate([largest, chunk_largest], axis=1), n_largest)
+            missing |= chunk_missing
+    finally:
+        if executor:
+            executor.shutdown()
+    smallest, largest = np.sort(smallest, axis=1), np.sort(largest, axis=1)
+
+    limits = []
+    for values, index, position in [(smallest, indices[0], positions[0]), (largest, 0, positions[1] - indices[1])]:
+        low = values[:, index] if len(values) else np.empty(0)
+        fraction = position - np.floor(position)
+        if fraction > 0 and values.shape[1] > index + 1:
+            with np.errstate(invalid='ignore'):
+                low = low + fraction * (values[:, index + 1] - low)
+        limits.append(np.where(missing, np.nan, low))
+    logger.debug('Bootstrapped {} comparisons with {} resamples.'.format(len(uplift), n_resamples))
+    return {
+        'relative_uplift': uplift,
+        'lower_limit': limits[0],
+        'upper_limit': limits[1]
+    }
+
+
+def _smallest(values, k):
+    # the k smallest values of every row, in any order
+    if values.shape[1] <= k:
+        return values
+    return np.partition(values, k - 1, axis=1)[:, :k]
+
+
+def sample_ratio_test(sample_sizes, expected_ratios=None):
+    """
+    Batch kernel of the chi-square goodness of fit test of the allocation of the sample to the groups, that detects
+    sample ratio mismatches (SRM). The last axis of sample_sizes holds the groups and every other axis is a
+    comparison (e.g. a segment and a date), so all of them are tested at once. Comparisons without sample get nan.
+
+    :param   sample_sizes: the sample size of every group, shape (..., groups)
+    :type    sample_sizes: numpy array
+    :param   expected_ratios: (optional) the expected share of the sample of every group, by default equal shares
+    :type    expected_ratios: list of floats
+    :return: dict with arrays of chi-square statistics and p-values
+    :rtype:  dict
+    """
+    sample_sizes = np.asarray(sample_sizes, dtype=np.float64)
+    n_groups = sample_sizes.shape[-1]
+    if expected_ratios is None:
+        expected_ratios = np.full(n_groups, 1. / n_groups)
+    expected_ratios = np.asarray(expected_ratios, dtype=np.float64)
+    if expected_ratios.shape != (n_groups,) or (expected_ratios <= 0).any():
+        raise ValueError("expected_ratios should have a positive ratio per group : {}".format(expected_ratios))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = sample_sizes.sum(axis=-1, keepdims=True) * (expected_ratios / expected_ratios.sum())
+        chi_square = ((sample_sizes - expected) ** 2 / expected).sum(axis=-1)
+    return {
+        'chi-square': chi_square,
+        'p-value': chdtrc(n_groups - 1, chi_square)
+    }
+
+
+def adjust_p_values(p_values, method='holm'):
+    """
+    Adjusts the p-values of families of comparisons for multiple testing. The last axis of p_values holds the
+    comparisons of a family and every other axis is a separate family, so all the families are adjusted at once.
+    Missing (nan) p-values are not counted as comparisons and stay missing.
+
+    :param   p_values: the p-values, shape (..., comparisons)
+    :type    p_values: numpy array
+    :param   method: one of 'bonferroni', 'holm' (step-down, family-wise error rate) or 'fdr_bh' (Benjamini-Hochberg,
+                     false discovery rate), None to return the p-values unadjusted
+    :type    method: str
+    :return: the adjusted p-values
+    :rtype:  numpy array
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    if method is None:
+        return p_values.copy()
+    if method not in ('bonferroni', 'holm', 'fdr_bh'):
+        raise ValueError("method should be one of 'bonferroni', 'holm' or 'fdr_bh' : {}".format(method))
+    missing = np.isnan(p_values)
+    n_tests = (~missing).sum(axis=-1, keepdims=True)
+    if method == 'bonferroni':
+        return np.minimum(p_values * n_tests, 1)
+
+    # the missing p-values are sorted last, so the ranks of the others are 1..n_tests
+    order = np.argsort(np.where(missing, np.inf, p_values), axis=-1, kind='mergesort')
+    ordered = np.take_along_axis(p_values, order, axis=-1)
+    rank = np.arange(1, p_values.shape[-1] + 1)
+    if method == 'holm':
+        adjusted = np.maximum.accumulate(np.nan_to_num(ordered * (n_tests - rank + 1), nan=0.), axis=-1)
+    else:
+        scaled = np.nan_to_num(ordered * n_tests / rank, nan=np.inf)
+        adjusted = np.minimum.accumulate(scaled[..., ::-1], axis=-1)[..., ::-1]
+    result = np.empty_like(p_values)
+    np.put_along_axis(result, order, np.minimum(adjusted, 1), axis=-1)
+    result[missing] = np.nan
+    return result
+
+
+def get_p_val_of_t_score(t_score, degrees_of_freedom, alternative='two-sided'):
+    """
+    Returns the p-values of Student's t test statistics
+
+    :param   t_score: the test statistics
+    :type    t_score: numpy array
+    :param   degrees_of_freedom: the degrees of freedom of every statistic
+    :type    degrees_of_freedom: numpy array
+    :param   alternative: the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: str
+    :return: p-values
+    :rtype:  numpy array
+    """
+    if alternative == 'two-sided':
+        return stdtr(degrees_of_freedom, -np.abs(t_score)) * 2
+    if alternative == 'larger':
+        return stdtr(degrees_of_freedom, -t_score)
+    if alternative == 'smaller':
+        return stdtr(degrees_of_freedom, t_score)
+    raise ValueError("alternative should be one of 'two-sided', 'larger' or 'smaller' : {}".format(alternative))
+
+
+def get_p_val_of_z_score(z_score, alternative='two-sided'):
+    """
+    Returns the p-values of standard normal test statistics
+
+    :param   z_score: the test statistics
+    :type    z_score: numpy array
+    :param   alternative: the alternative hypothesis, one of 'two-sided', 'larger' or 'smaller'
+    :type    alternative: str
+    :return: p-values
+    :rtype:  numpy array
+    """
+    if alternative == 'two-sided':
+        return ndtr(-np.abs(z_score)) * 2
+    if alternative == 'larger':
+        return ndtr(-z_score)
+    if alternative == 'smaller':
+        return ndtr(z_score)
+    raise ValueError("alternative should be one of 'two-sided', 'larger' or 'smaller' : {}".format(alternative))
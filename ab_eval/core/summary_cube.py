@@ -0,0 +1,967 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT = 'ab_eval.summary_cube'
+STORE_VERSION = 2
+# the versions that load reads, the arrays of version 1 stores are next to their header
+STORE_VERSIONS = (1, 2)
+
+
+class summary_cube(object):
+    """
+    Class that holds the aggregated converted/sample_size sums of an experiment in a group x segment x date x KPI cube.
+    The cube is built with a single pass over the data and every metric of the experiment is read from it.
+    For continuous kpis (e.g. revenue) converted holds the sum of the values, sample_size their count and sum_sq the sum
+    of their squares. These sums are mergeable over dates, segments and cubes like the conversions.
+    :param converted: array with the sum of conversions, shape (groups, segments, dates, kpis)
+    :type  converted: numpy array
+    :param sample_size: array with the sum of sample sizes, shape (groups, segments, dates, kpis)
+    :type  sample_size: numpy array
+    :param groups: the labels of the groups (variations) axis
+    :type  groups: list
+    :param segments: the labels of the segment axis. [None] if the data have no segment information
+    :type  segments: list
+    :param dates: the chronologically sorted labels of the date axis. [None] if the data have no date information
+    :type  dates: list
+    :param kpis: the labels of the KPI axis
+    :type  kpis: list of strings
+    :param date_order: (optional) the positions of the dates in the order that they should be reported, by default sorted
+    :type  date_order: list of integers
+    :param segment_column: (optional) the column name that the segments come from, or a tuple of column names whose
+                           crossing the segments are. The labels of crossed segments are tuples with a value per column
+    :type  segment_column: string or tuple of strings
+    :param sum_sq: (optional) array with the sum of squared values, shape (groups, segments, dates, kpis). It is only
+                   needed for continuous kpis, the squares of conversions are the conversions themselves
+    :type  sum_sq: numpy array
+    :param continuous_kpis: (optional) the kpis of the KPI axis that have continuous values
+    :type  continuous_kpis: list of strings
+    """
+    def __init__(
+            self,
+            converted,
+            sample_size,
+            groups,
+            segments,
+            dates,
+            kpis,
+            date_order=None,
+            segment_column='segment',
+            sum_sq=None,
+            continuous_kpis=None,
+            *args, **kwargs):
+        super(summary_cube, self).__init__(*args, **kwargs)
+        self.converted = converted
+        self.sample_size = sample_size
+        self.sum_sq = sum_sq
+        self.continuous_kpis = list(continuous_kpis or [])
+        self.groups = list(groups)
+        # json has no tuples, the labels and the columns of crossed segments are restored from lists
+        self.segments = [tuple(segment) if isinstance(segment, list) else segment for segment in segments]
+        self.dates = np.asarray(dates, dtype=object)
+        self.kpis = list(kpis)
+        self.segment_column = tuple(segment_column) if isinstance(segment_column, list) else segment_column
+        self.date_order = np.arange(len(self.dates)) if date_order is None else np.asarray(date_order)
+        self._cumulative = None
+        self._day_codes = None
+        self._store = None
+        self._group_index = {label: idx for idx, label in enumerate(self.groups)}
+        self._segment_index = {label: idx for idx, label in enumerate(self.segments)}
+        self._kpi_index = {label: idx for idx, label in enumerate(self.kpis)}
+
+    @classmethod
+    def from_dataframe(cls, df, kpis, variations_column='group', segment_column='segment', date_column='date', sessions=False,
+                       continuous_kpis=None):
+        """
+        Builds the cube from a dataframe with '<kpi>_converted' and '<kpi>_sample_size' columns, and '<kpi>_count',
+        '<kpi>_sum' and '<kpi>_sum_sq' columns for the continuous kpis. A dict of arrays or a numpy structured array
+        with the same columns is aggregated directly, without building a dataframe
+        :param   df: the test data
+        :type    df: dataframe, dict of arrays or numpy structured array
+        :param   kpis: the kpis that should be aggregated. kpis without columns in the data are skipped
+        :type    kpis: list of strings
+        :param   variations_column: the column name that contains the variation information
+        :type    variations_column: string
+        :param   segment_column: (optional) the column name that contains the segment information, or a tuple of column
+                                 names to segment by their crossing. Only the crossings that are in the data get a segment
+        :type    segment_column: string or tuple of strings
+        :param   date_column: (optional) the column name that contains the date information
+        :type    date_column: string
+        :param   sessions: (optional) True if the data have one row per session, see from_sessions
+        :type    sessions: bool
+        :param   continuous_kpis: (optional) the kpis with continuous values
+        :type    continuous_kpis: list of strings
+        :return: the summary cube
+        :rtype:  summary_cube
+        """
+        if isinstance(segment_column, list):
+            segment_column = tuple(segment_column)
+        converted, sample_size, sum_sq, labels, codes, kpis = aggregate(
+            df, kpis, [variations_column, segment_column, date_column], date_column=date_column, sessions=sessions,
+            continuous_kpis=continuous_kpis)
+        groups, segments, dates = labels
+        date_codes = codes[2]
+        n_rows = len(date_codes)
+
+        # keep the order in which the dates appear in the data for reporting
+        codes, first_seen = np.unique(date_codes[date_codes >= 0], return_index=True)
+        date_order = codes[np.argsort(first_seen, kind='mergesort')]
+
+        logger.debug('Summary cube built with shape {} from {} rows.'.format(converted.shape, n_rows))
+        return cls(converted, sample_size, groups=groups, segments=segments, dates=dates, kpis=kpis, date_order=date_order,
+                   segment_column=segment_column, sum_sq=sum_sq, continuous_kpis=continuous_kpis)
+
+    @classmethod
+    def from_sessions(cls, df, kpis, variations_column='group', segment_column='segment', date_column='date', continuous_kpis=None):
+        """
+        Builds the cube from a dataframe with one row per session and a '<kpi>_converted' column per kpi, e.g. the
+        output of utils.generate_random_sessions. Every session counts once in the sample size of its cell.
+        Continuous kpis have a '<kpi>' column with the value of every session, missing values are not counted.
+        The keys are encoded with their (categorical) codes and summed with bincount, without any per row python work.
+        :param   df: the dataframe with the sessions
+        :type    df: dataframe
+        :param   kpis: the kpis that should be aggregated. kpis without columns in the data are skipped
+        :type    kpis: list of strings
+        :param   variations_column: the column name that contains the variation information
+        :type    variations_column: string
+        :param   segment_column: (optional) the column name that contains the segment information
+        :type    segment_column: string
+        :param   date_column: (optional) the column name that contains the date information
+        :type    date_column: string
+        :param   continuous_kpis: (optional) the kpis with continuous values
+        :type    continuous_kpis: list of strings
+        :return: the summary cube
+        :rtype:  summary_cube
+        """
+        return cls.from_dataframe(df, kpis, variations_column=variations_column, segment_column=segment_column,
+                                  date_column=date_column, sessions=True, continuous_kpis=continuous_kpis)
+
+    @classmethod
+    def from_chunks(cls, chunks, kpis, variations_column='group', segment_column='segment', date_column='date', sessions=False,
+                    continuous_kpis=None):
+        """
+        Builds the cube from an iterable of dataframes, e.g. the chunks of a file that does not fit in memory. Every
+        chunk is aggregated on its own and merged into the cube, so only one chunk and the cube are kept in memory.
+        The cube is the same as the one of the concatenated chunks.
+        :param   chunks: the dataframes, in the format of from_dataframe
+        :type    chunks: iterable of dataframes
+        :param   kpis: the kpis that should be aggregated
+        :type    kpis: list of strings
+        :param   variations_column: the column name that contains the variation information
+        :type    variations_column: string
+        :param   segment_column: (optional) the column name that contains the segment information
+        :type    segment_column: string
+        :param   date_column: (optional) the column name that contains the date information
+        :type    date_column: string
+        :param   sessions: (optional) True if the data have one row per session, see from_sessions
+        :type    sessions: bool
+        :param   continuous_kpis: (optional) the kpis with continuous values
+        :type    continuous_kpis: list of strings
+        :return: the summary cube
+        :rtype:  summary_cube
+        """
+        cube, n_chunks = None, 0
+        for chunk in chunks:
+            if not len(chunk.index):
+                continue
+            chunk_cube = cls.from_dataframe(chunk, kpis, variations_column=variations_column, segment_column=segment_column,
+                                            date_column=date_column, sessions=sessions, continuous_kpis=continuous_kpis)
+            cube = chunk_cube if cube is None else cube.merge(chunk_cube)
+            n_chunks += 1
+        if cube is None:
+            raise ValueError("There are no data to aggregate.")
+        logger.debug('Summary cube built with shape {} from {} chunks.'.format(cube.converted.shape, n_chunks))
+        return cube
+
+    @classmethod
+    def from_dict(cls, cube_dict):
+        """
+        Builds the cube from its dict representation (see to_dict)
+        :param   cube_dict: the dict representation of the cube
+        :type    cube_dict: dict
+        :return: the summary cube
+        :rtype:  summary_cube
+        """
+        shape = tuple(len(cube_dict[axis]) for axis in ('groups', 'segments', 'dates', 'kpis'))
+        return cls(np.array(cube_dict['converted'], dtype=np.float64).reshape(shape),
+                   np.array(cube_dict['sample_size'], dtype=np.float64).reshape(shape),
+                   groups=cube_dict['groups'], segments=cube_dict['segments'], dates=cube_dict['dates'],
+                   kpis=cube_dict['kpis'], date_order=cube_dict['date_order'], segment_column=cube_dict['segment_column'],
+                   sum_sq=None if cube_dict.get('sum_sq') is None else np.array(cube_dict['sum_sq'], dtype=np.float64).reshape(shape),
+                   continuous_kpis=cube_dict.get('continuous_kpis'))
+
+    def to_dict(self):
+        """
+        Returns a json serializable dict representation of the cube
+        :return: the dict representation of the cube
+        :rtype:  dict
+        """
+        return {
+            'groups': _to_python(self.groups),
+            'segments': _to_python(self.segments),
+            'dates': _to_python(self.dates),
+            'kpis': _to_python(self.kpis),
+            'date_order': _to_python(self.date_order),
+            'segment_column': self.segment_column,
+            'converted': self.converted.ravel().tolist(),
+            'sample_size': self.sample_size.ravel().tolist(),
+            'sum_sq': None if self.sum_sq is None else self.sum_sq.ravel().tolist(),
+            'continuous_kpis': self.continuous_kpis
+        }
+
+    def save(self, path):
+        """
+        Writes the cube to a directory in a columnar format that can be memory mapped, see load. Every array is a
+        .npy file, with fixed width integers when its sums are integral, the prefix sums over the dates and the day codes
+        are stored too, and the labels of the axes are stored once in a json header. The positions of the arrays are the
+        codes of the labels. Every save writes its arrays to a new directory of the store, that the header names, and
+        then replaces the header atomically, so a reader sees either the previous or the new version of the store and
+        never a mix of them. The arrays of the previous version are then removed: processes that have mapped them keep
+        reading that version, while a load that read the previous header just before the removal fails and can be retried.
+        :param   path: the directory of the store, it is created if it does not exist
+        :type    path: string
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        previous = _store_directory(path)
+        cumulative = self.get_cumulative(sum_sq=self.sum_sq is not None)
+        arrays = {'converted': self.converted, 'sample_size': self.sample_size, 'cumulative_converted': cumulative[0],
+                  'cumulative_sample_size': cumulative[1]}
+        if self.sum_sq is not None:
+            arrays.update({'sum_sq': self.sum_sq, 'cumulative_sum_sq': cumulative[2]})
+        day_codes = self.get_day_codes()
+        if day_codes is not None:
+            arrays['day_codes'] = day_codes
+        directory = 'arrays-' + uuid.uuid4().hex
+        os.makedirs(os.path.join(path, directory))
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(path, directory, name + '.npy'), _compact_counts(array))
+        except BaseException:
+            shutil.rmtree(os.path.join(path, directory), ignore_errors=True)
+            raise
+
+        header = {
+            'format': STORE_FORMAT,
+            'version': STORE_VERSION,
+            'groups': _to_python(self.groups),
+            'segments': _to_python(self.segments),
+            'dates': _to_python(self.dates),
+            'kpis': _to_python(self.kpis),
+            'date_order': _to_python(self.date_order),
+            'segment_column': self.segment_column,
+            'continuous_kpis': self.continuous_kpis,
+            'arrays': sorted(arrays),
+            'directory': directory
+        }
+        _write_atomically(path, 'header.json', lambda f: f.write(json.dumps(header).encode('utf-8')))
+        if previous:
+            shutil.rmtree(os.path.join(path, previous), ignore_errors=True)
+        logger.debug('Summary cube with shape {} saved to {}.'.format(self.converted.shape, path))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Opens a cube that was written with save. By default the arrays are memory mapped read-only: opening the
+        store reads only its header, the arrays are zero-copy views of the files and the pages are shared by all the
+        processes that open the same store. A memory mapped cube is pickled by its path, so the process workers of an
+        experiment map the store instead of receiving a copy of it.
+        :param   path: the directory of the store
+        :type    path: string
+        :param   mmap_mode: (optional) the numpy memory map mode, None to read the arrays into memory
+        :type    mmap_mode: string
+        :return: the summary cube
+        :rtype:  summary_cube
+        """
+        with open(os.path.join(path, 'header.json')) as f:
+            header = json.load(f)
+        if header.get('format') != STORE_FORMAT or header.get('version') not in STORE_VERSIONS:
+            raise ValueError("{} is not a summary cube store of version {}".format(path, STORE_VERSION))
+        directory = os.path.join(path, header.get('directory', ''))
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode) for name in header['arrays']}
+
+        cube = cls(arrays['converted'], arrays['sample_size'], groups=header['groups'], segments=header['segments'],
+                   dates=header['dates'], kpis=header['kpis'], date_order=header['date_order'],
+                   segment_column=header['segment_column'], sum_sq=arrays.get('sum_sq'),
+                   continuous_kpis=header['continuous_kpis'])
+        cube._cumulative = tuple(arrays[name] for name in ('cumulative_converted', 'cumulative_sample_size', 'cumulative_sum_sq')
+                                 if name in arrays)
+        cube._day_codes = arrays.get('day_codes', False)
+        if mmap_mode is not None:
+            cube._store = (os.path.abspath(path), mmap_mode)
+        return cube
+
+    def __reduce_ex__(self, protocol):
+        if self._store is None:
+            return super(summary_cube, self).__reduce_ex__(protocol)
+        return summary_cube.load, self._store
+
+    def to_dataframe(self, variations_column='group', date_column='date'):
+        """
+        Returns the sums of the cube in the format of the experiment data, with a row per (group, segment, date)
+        cell that has a sample size and '<kpi>_converted' and '<kpi>_sample_size' columns ('<kpi>_count', '<kpi>_sum' and
+        '<kpi>_sum_sq' for the continuous kpis)
+        :param   variations_column: (optional) the column name of the variation information
+        :type    variations_column: string
+        :param   date_column: (optional) the column name of the date information
+        :type    date_column: string
+        :return: the aggregated data
+        :rtype:  dataframe
+        """
+        groups, segments, dates = np.nonzero((self.sample_size > 0).any(axis=3))
+        data = {variations_column: np.asarray(self.groups, dtype=object)[groups]}
+        if self.segments[0] is not None and isinstance(self.segment_column, tuple):
+            for c, column in enumerate(self.segment_column):
+                data[column] = np.asarray([segment[c] for segment in self.segments], dtype=object)[segments]
+        elif self.segments[0] is not None:
+            data[self.segment_column] = np.asarray(self.segments, dtype=object)[segments]
+        if self.dates[0] is not None:
+            data[date_column] = self.dates[dates]
+        for k, kpi in enumerate(self.kpis):
+            if kpi not in self.continuous_kpis:
+                data['{}_converted'.format(kpi)] = self.converted[groups, segments, dates, k]
+        for k, kpi in enumerate(self.kpis):
+            if kpi not in self.continuous_kpis:
+                data['{}_sample_size'.format(kpi)] = self.sample_size[groups, segments, dates, k]
+        for k, kpi in enumerate(self.kpis):
+            if kpi in self.continuous_kpis:
+                data['{}_count'.format(kpi)] = self.sample_size[groups, segments, dates, k]
+                data['{}_sum'.format(kpi)] = self.converted[groups, segments, dates, k]
+                data['{}_sum_sq'.format(kpi)] = self.sum_sq[groups, segments, dates, k]
+        return pd.DataFrame(data)
+
+    def merge(self, other):
+        """
+        Returns a new cube with the sums of this cube and another one. The labels of the axes are united, and dates
+        of the other cube that are not in this one are reported after the dates of this cube. When the other cube
+        only adds later dates, the prefix sums are extended instead of recomputed.
+        :param   other: the cube to add
+        :type    other: summary_cube
+        :return: the merged cube
+        :rtype:  summary_cube
+        """
+        groups = _union_labels(self.groups, other.groups)
+        segments = _union_labels(self.segments, other.segments)
+        dates = _union_labels(list(self.dates), list(other.dates), dates=True)
+        kpis = self.kpis + [kpi for kpi in other.kpis if kpi not in self._kpi_index]
+
+        shape = (len(groups), len(segments), len(dates), len(kpis))
+        with_sum_sq = self.sum_sq is not None or other.sum_sq is not None
+        arrays = tuple(np.zeros(shape, dtype=np.float64) for _ in range(3 if with_sum_sq else 2))
+        positions = []
+        for cube in (self, other):
+            index = np.ix_(*[_positions(labels, axis) for labels, axis in
+                             ((cube.groups, groups), (cube.segments, segments), (list(cube.dates), dates), (cube.kpis, kpis))])
+            for array, cube_array in zip(arrays, cube._arrays(sum_sq=with_sum_sq)):
+                array[index] += cube_array
+            positions.append(_positions(list(cube.dates), dates))
+
+        # keep the report order of this cube and append the new dates of the other one
+        date_order = list(positions[0][self.date_order])
+        seen = set(date_order)
+        date_order += [position for position in positions[1][other.date_order] if position not in seen]
+        continuous_kpis = self.continuous_kpis + [kpi for kpi in other.continuous_kpis if kpi not in self.continuous_kpis]
+        merged = summary_cube(arrays[0], arrays[1], groups=groups, segments=segments, dates=dates, kpis=kpis,
+                              date_order=date_order, segment_column=self.segment_column,
+                              sum_sq=arrays[2] if with_sum_sq else None, continuous_kpis=continuous_kpis)
+
+        appends_dates = len(self.dates) and len(other.dates) and None not in dates and _sort_key(other)[0] > _sort_key(self)[-1]
+        same_axes = groups == self.groups and segments == self.segments and kpis == self.kpis
+        if self._cumulative is not None and len(self._cumulative) == len(arrays) and appends_dates and same_axes:
+            merged._cumulative = tuple(
+                np.concatenate([cumulative, cumulative[:, :, -1:] + array[:, :, len(self.dates):].cumsum(axis=2)], axis=2)
+                for cumulative, array in zip(self._cumulative, arrays))
+        return merged
+
+    def memory_usage(self):
+        """
+        Returns the number of bytes of the arrays of the cube, with its prefix sums and day codes once they are computed.
+        The arrays of a memory mapped cube are counted too, although their pages are shared and read on demand
+        :return: the number of bytes
+        :rtype:  int
+        """
+        arrays = list(self._arrays(sum_sq=self.sum_sq is not None)) + list(self._cumulative or [])
+        if self._day_codes is not None and self._day_codes is not False:
+            arrays.append(self._day_codes)
+        return int(sum(array.nbytes for array in arrays))
+
+    def get_kpis(self):
+        return self.kpis
+
+    def get_continuous_kpis(self):
+        return self.continuous_kpis
+
+    def _arrays(self, sum_sq=False):
+        # the summed statistics of the cube. the squares of conversions are the conversions themselves
+        if not sum_sq:
+            return self.converted, self.sample_size
+        return self.converted, self.sample_size, self.converted if self.sum_sq is None else self.sum_sq
+
+    def get_dates(self):
+        return self.dates
+
+    def get_day_codes(self):
+        """
+        Returns the dates of the cube as integer day codes (days since 1970-01-01), parsed once on first use
+        :return: the day code of every date, None if the cube has no date axis or a date cannot be parsed
+        :rtype:  numpy array
+        """
+        if self._day_codes is None:
+            codes = _day_codes(self.dates)
+            self._day_codes = False if codes is None else codes
+        return None if self._day_codes is False else self._day_codes
+
+    def get_date_order(self):
+        return self.date_order
+
+    def get_cumulative(self, sum_sq=False):
+        """
+        Returns the prefix sums of the cube over the date axis. Position d holds the counts up to (and including)
+        the d-th date. They are computed once and every "up to date" query becomes a lookup.
+        :param   sum_sq: (optional) True to return also the prefix sums of the squared values
+        :type    sum_sq: bool
+        :return: cumulative conversions and sample sizes (and squared values), shape (groups, segments, dates, kpis)
+        :rtype:  tuple of numpy arrays
+        """
+        if self._cumulative is None:
+            self._cumulative = tuple(np.cumsum(array, axis=2) for array in self._arrays(sum_sq=self.sum_sq is not None))
+        if not sum_sq:
+            return self._cumulative[:2]
+        return self._cumulative[:2] + (self._cumulative[-1] if self.sum_sq is not None else self._cumulative[0],)
+
+    def date_slice(self, date=None, start_date=None, window=None):
+        """
+        Returns the slice of the date axis with the dates from start_date up to (and including) date. The bounds are
+        found with a binary search over the integer day codes of the dates (or over the labels if they are not dates)
+        :param   date: (optional) the last date of the slice, by default the last date of the cube
+        :type    date: string
+        :param   start_date: (optional) the first date of the slice, by default the first date of the cube
+        :type    start_date: string
+        :param   window: (optional) the number of days of a rolling window that ends at date
+        :type    window: int
+        :return: slice of the date axis
+        :rtype:  slice
+        """
+        _check_window(window)
+        if self.dates[0] is None:
+            # the cube has no date axis when the data have no date column
+            return slice(0, len(self.dates))
+        keys = _sort_key(self)
+        stop = len(keys) if date is None else int(np.searchsorted(keys, _query_key(self, date), side='right'))
+        start = 0 if start_date is None else int(np.searchsorted(keys, _query_key(self, start_date), side='left'))
+        if window is not None:
+            start = max(start, self._window_start(stop, date, int(window)))
+        return slice(start, max(start, stop))
+
+    def _window_start(self, stop, date, window):
+        # the first position of the rolling window that ends at date, or at the last date before stop
+        day_codes = self.get_day_codes()
+        if day_codes is None:
+            return max(stop - window, 0)
+        last_day = day_codes[stop - 1] if date is None else _query_key(self, date)
+        return int(np.searchsorted(day_codes, last_day - window + 1, side='left'))
+
+    def get_counts(self, kpi, segment=None, date=None, start_date=None, window=None, sum_sq=False):
+        """
+        Returns the conversions and the sample size of every group for a given KPI, segment and date range
+        :param   kpi: the KPI that should be used
+        :type    kpi: str
+        :param   segment: (optional) the segment that should be used. If it is not set all segments are summed
+        :type    segment: str
+        :param   date: (optional) if date is given then the counts are summed up to that date
+        :type    date: string
+        :param   start_date: (optional) if start_date is given then the counts are summed from that date
+        :type    start_date: string
+        :param   window: (optional) the number of days of a rolling window that ends at date
+        :type    window: int
+        :param   sum_sq: (optional) True to return also the sums of the squared values
+        :type    sum_sq: bool
+        :return: conversions and sample sizes (and squared values), one element per group
+        :rtype:  tuple of numpy arrays
+        """
+        return self._select_segment(self._range_counts(date, start_date, window, sum_sq), kpi, segment)
+
+    def get_segment_counts(self, kpi, labels, date=None, start_date=None, window=None, sum_sq=False):
+        """
+        Returns the conversions and the sample size of the given groups in every segment of the cube at once
+        :param   kpi: the KPI that should be used
+        :type    kpi: str
+        :param   labels: the group labels, groups that are not in the data get zero counts
+        :type    labels: list
+        :param   date: (optional) if date is given then the counts are summed up to that date
+        :type    date: string
+        :param   start_date: (optional) if start_date is given then the counts are summed from that date
+        :type    start_date: string
+        :param   window: (optional) the number of days of a rolling window that ends at date
+        :type    window: int
+        :param   sum_sq: (optional) True to return also the sums of the squared values
+        :type    sum_sq: bool
+        :return: list with a (conversions, sample_size) or a (sum, count, sum_sq) tuple of arrays per label, one element
+                 per segment of the cube
+        :rtype:  list
+        """
+        k = self._kpi_index[kpi]
+        return self._select_groups(tuple(array[..., k] for array in self._range_counts(date, start_date, window, sum_sq)), labels)
+
+    def _range_counts(self, date, start_date, window, sum_sq):
+        # the counts of every group, segment and kpi in a date range, shape (groups, segments, kpis)
+        dates = self.date_slice(date, start_date=start_date, window=window)
+        if dates.start == 0 and dates.stop == len(self.dates):
+            return tuple(array.sum(axis=2) for array in self._arrays(sum_sq=sum_sq))
+        if dates.start == dates.stop:
+            return tuple(np.zeros_like(array[:, :, 0]) for array in self._arrays(sum_sq=sum_sq))
+        # the counts of a range are the difference of two prefix sums
+        return tuple(cumulative[:, :, dates.stop - 1] if dates.start == 0 else
+                     cumulative[:, :, dates.stop - 1] - cumulative[:, :, dates.start - 1]
+                     for cumulative in self.get_cumulative(sum_sq=sum_sq))
+
+    def get_history_positions(self, date=None, start_date=None):
+        """
+        Returns the positions of the dates from start_date up to date, in the order that they should be reported
+        :param   date: (optional) the last date of the history
+        :type    date: string
+        :param   start_date: (optional) the first date of the history
+        :type    start_date: string
+        :return: positions of the date axis
+        :rtype:  numpy array
+        """
+        dates = self.date_slice(date, start_date=start_date)
+        return self.date_order[(self.date_order >= dates.start) & (self.date_order < dates.stop)]
+
+    def get_history_counts(self, kpi, positions, segment=None, start_date=None, window=None, cumulative=True, sum_sq=False):
+        """
+        Returns the conversions and the sample size of every group at each of the given dates. By default the counts
+        are cumulative from start_date, with window they cover the rolling window that ends at each date and with
+        cumulative False they are the counts of each single day
+        :param   kpi: the KPI that should be used
+        :type    kpi: str
+        :param   positions: the positions of the dates, see get_history_positions
+        :type    positions: numpy array
+        :param   segment: (optional) the segment that should be used. If it is not set all segments are summed
+        :type    segment: str
+        :param   start_date: (optional) the first date that is counted
+        :type    start_date: string
+        :param   window: (optional) the number of days of a rolling window that ends at each date
+        :type    window: int
+        :param   cumulative: False to count each single day
+        :type    cumulative: bool
+        :param   sum_sq: (optional) True to return also the sums of the squared values
+        :type    sum_sq: bool
+        :return: conversions and sample sizes (and squared values), shape (groups, positions)
+        :rtype:  tuple of numpy arrays
+        """
+        positions = np.asarray(positions, dtype=np.intp)
+        if not cumulative:
+            starts = positions
+        else:
+            starts = np.full(len(positions), self.date_slice(start_date=start_date).start, dtype=np.intp)
+            if _check_window(window) is not None:
+                day_codes = self.get_day_codes()
+                if day_codes is None:
+                    window_starts = positions + 1 - int(window)
+                else:
+                    window_starts = np.searchsorted(day_codes, day_codes[positions] - int(window) + 1, side='left')
+                starts = np.maximum(starts, window_starts)
+        counts = []
+        for cumulative in self.get_cumulative_counts(kpi, segment=segment, sum_sq=sum_sq):
+            # prefix sums with a leading zero, the counts of [start, stop) are prefix[stop] - prefix[start]
+            prefix = np.concatenate([np.zeros_like(cumulative[:, :1]), cumulative], axis=1)
+            counts.append(prefix[:, positions + 1] - prefix[:, starts])
+        return tuple(counts)
+
+    def get_cumulative_counts(self, kpi, segment=None, sum_sq=False):
+        """
+        Returns the conversions and the sample size of every group up to each date of the cube
+        :param   kpi: the KPI that should be used
+        :type    kpi: str
+        :param   segment: (optional) the segment that should be used. If it is not set all segments are summed
+        :type    segment: str
+        :param   sum_sq: (optional) True to return also the sums of the squared values
+        :type    sum_sq: bool
+        :return: conversions and sample sizes (and squared values), shape (groups, dates)
+        :rtype:  tuple of numpy arrays
+        """
+        return self._select_segment(self.get_cumulative(sum_sq=sum_sq), kpi, segment)
+
+    def _select_segment(self, arrays, kpi, segment):
+        # the arrays have the segment axis in position 1 and the kpi axis last
+        k = self._kpi_index[kpi]
+        if segment:
+            if segment not in self._segment_index:
+                zeros = np.zeros((arrays[0].shape[0],) + arrays[0].shape[2:-1])
+                return tuple(zeros for _ in arrays)
+            s = self._segment_index[segment]
+            return tuple(array[:, s, ..., k] for array in arrays)
+        return tuple(array[..., k].sum(axis=1) for array in arrays)
+
+    def get_group_counts(self, kpi, labels, segment=None, date=None, start_date=None, window=None, sum_sq=False):
+        """
+        Returns the conversions and the sample size of the given groups. Groups that are not in the data get zero counts
+        :param   kpi: the KPI that should be used
+        :type    kpi: str
+        :param   labels: the group labels
+        :type    labels: list
+        :param   segment: (optional) the segment that should be used
+        :type    segment: str
+        :param   date: (optional) if date is given then the counts are summed up to that date
+        :type    date: string
+        :param   start_date: (optional) if start_date is given then the counts are summed from that date
+        :type    start_date: string
+        :param   window: (optional) the number of days of a rolling window that ends at date
+        :type    window: int
+        :param   sum_sq: (optional) True to return also the sums of the squared values
+        :type    sum_sq: bool
+        :return: list with a (conversions, sample_size) or a (sum, count, sum_sq) tuple per label
+        :rtype:  list
+        """
+        return self._select_groups(self.get_counts(kpi, segment=segment, date=date, start_date=start_date, window=window,
+                                                   sum_sq=sum_sq), labels)
+
+    def get_group_cumulative_counts(self, kpi, labels, segment=None):
+        """
+        Returns the conversions and the sample size of the given groups up to each date of the cube
+        :param   kpi: the KPI that should be used
+        :type    kpi: str
+        :param   labels: the group labels
+        :type    labels: list
+        :param   segment: (optional) the segment that should be used
+        :type    segment: str
+        :return: list with a (conversions, sample_size) tuple of arrays per label
+        :rtype:  list
+        """
+        return self._select_groups(self.get_cumulative_counts(kpi, segment=segment), labels)
+
+    def get_group_history_counts(self, kpi, labels, positions, segment=None, start_date=None, window=None, cumulative=True,
+                                 sum_sq=False):
+        """
+        Returns the conversions and the sample size of the given groups at each of the given dates, see get_history_counts
+        :return: list with a (conversions, sample_size) tuple of arrays per label
+        :rtype:  list
+        """
+        return self._select_groups(self.get_history_counts(kpi, positions, segment=segment, start_date=start_date, window=window,
+                                                           cumulative=cumulative, sum_sq=sum_sq), labels)
+
+    def get_group_sample_sizes(self, kpi, labels, segments):
+        """
+        Returns the sample size of the given groups in the given segments at every date of the cube
+        :param   kpi: the KPI that should be used
+        :type    kpi: str
+        :param   labels: the group labels, groups that are not in the data get zero sample sizes
+        :type    labels: list
+        :param   segments: the segments, None for the sum of all segments. Segments that are not in the data get zeros
+        :type    segments: list
+        :return: the sample sizes, shape (labels, segments, dates)
+        :rtype:  numpy array
+        """
+        sample_size = self.sample_size[..., self._kpi_index[kpi]]
+        sizes = np.zeros((len(labels), len(segments), len(self.dates)))
+        for g, label in enumerate(labels):
+            if label not in self._group_index:
+                continue
+            for s, segment in enumerate(segments):
+                if segment is None:
+                    sizes[g, s] = sample_size[self._group_index[label]].sum(axis=0)
+                elif segment in self._segment_index:
+                    sizes[g, s] = sample_size[self._group_index[label], self._segment_index[segment]]
+        return sizes
+
+    def _select_groups(self, counts, labels):
+        selected = []
+        for label in labels:
+            g = self._group_index.get(label)
+            if g is None:
+                selected.append(tuple(np.zeros_like(array[0]) for array in counts))
+            else:
+                selected.append(tuple(array[g] for array in counts))
+        return selected
+
+
+def aggregate(df, kpis, key_columns, date_column='date', sessions=False, continuous_kpis=None):
+    """
+    Sums the '<kpi>_converted' and '<kpi>_sample_size' columns over the crossing of the key columns,
+    with one bincount pass per column. Key columns that are not in the data get a single None label and
+    the labels of the date column are compared as strings.
+    With sessions True the data have one row per session and no sample size columns: the sample size of a cell
+    is its number of rows, counted with a single bincount that is shared by all the kpis.
+    Continuous kpis are summed from their '<kpi>_sum', '<kpi>_count' and '<kpi>_sum_sq' columns, or from the values
+    of their '<kpi>' column with sessions True.
+    :param   df: the test data, see as_columns
+    :type    df: dataframe, dict of arrays or numpy structured array
+    :param   kpis: the kpis that should be aggregated. kpis without columns in the data are skipped
+    :type    kpis: list of strings
+    :param   key_columns: the columns to aggregate over. The first one is mandatory
+    :type    key_columns: list of strings
+    :param   date_column: (optional) the column name that contains the date information
+    :type    date_column: string
+    :param   sessions: (optional) True if the data have one row per session
+    :type    sessions: bool
+    :param   continuous_kpis: (optional) the kpis with continuous values
+    :type    continuous_kpis: list of strings
+    :return: converted, sample_size and sum_sq (None without continuous kpis) arrays with one axis per key column
+             and a last kpi axis, the sorted labels and the row codes of every key column and the aggregated kpis
+    :rtype:  tuple
+    """
+    continuous_kpis = continuous_kpis or []
+    df, n_rows = as_columns(df)
+    kpis = [kpi for kpi in kpis if all(column in df for column in _kpi_columns(kpi, kpi in continuous_kpis, sessions))]
+
+    codes, labels = [], []
+    for idx, column in enumerate(key_columns):
+        if idx == 0 and column not in df:
+            raise KeyError(column)
+        column_codes, column_labels = _factorize_optional(df, n_rows, column, as_str=column == date_column)
+        codes.append(column_codes)
+        labels.append(column_labels)
+
+    # rows with a missing key are dropped as pivot_table does. the flat index of the cells is built in place
+    shape = tuple(len(column_labels) for column_labels in labels)
+    flat_index = np.zeros(n_rows, dtype=np.intp)
+    valid = np.ones(n_rows, dtype=bool)
+    for column_codes, size in zip(codes, shape):
+        flat_index *= size
+        flat_index += column_codes
+        valid &= column_codes >= 0
+    if valid.all():
+        valid = slice(None)
+    else:
+        flat_index = flat_index[valid]
+    n_cells = int(np.prod(shape))
+
+    converted = np.empty(shape + (len(kpis),), dtype=np.float64)
+    sample_size = np.empty(shape + (len(kpis),), dtype=np.float64)
+    sum_sq = np.zeros(shape + (len(kpis),), dtype=np.float64) if any(kpi in continuous_kpis for kpi in kpis) else None
+    if sessions:
+        sample_size[...] = np.bincount(flat_index, minlength=n_cells).reshape(shape + (1,))
+    for k, kpi in enumerate(kpis):
+        columns = [_values(df[column])[valid] for column in _kpi_columns(kpi, kpi in continuous_kpis, sessions)]
+        if kpi in continuous_kpis and sessions:
+            values = columns[0].astype(np.float64)
+            converted[..., k] = _bincount_sum(flat_index, values, n_cells).reshape(shape)
+            sample_size[..., k] = _bincount_sum(flat_index, ~np.isnan(values), n_cells).reshape(shape)
+            sum_sq[..., k] = _bincount_sum(flat_index, values ** 2, n_cells).reshape(shape)
+            continue
+        converted[..., k] = _bincount_sum(flat_index, columns[0], n_cells).reshape(shape)
+        if not sessions:
+            sample_size[..., k] = _bincount_sum(flat_index, columns[1], n_cells).reshape(shape)
+        if kpi in continuous_kpis:
+            sum_sq[..., k] = _bincount_sum(flat_index, columns[2], n_cells).reshape(shape)
+        elif sum_sq is not None:
+            sum_sq[..., k] = converted[..., k]
+    return converted, sample_size, sum_sq, labels, codes, kpis
+
+
+def _kpi_columns(kpi, continuous, sessions):
+    # the columns with the sums of a kpi, in the order of the cube arrays (converted, sample_size, sum_sq)
+    if continuous:
+        return [kpi] if sessions else ['{}_sum'.format(kpi), '{}_count'.format(kpi), '{}_sum_sq'.format(kpi)]
+    return ['{}_converted'.format(kpi)] if sessions else ['{}_converted'.format(kpi), '{}_sample_size'.format(kpi)]
+
+
+def as_columns(data):
+    """
+    Returns the columns of the data of an experiment without copying them. Dataframes are returned as they are, the
+    fields of a numpy structured array are views of the array and the values of a dict are used as arrays, with
+    categoricals kept as categoricals.
+    :param   data: the data
+    :type    data: dataframe, dict of arrays or numpy structured array
+    :return: the columns, that support `column in columns` and `columns[column]`, and the number of rows
+    :rtype:  tuple
+    """
+    if isinstance(data, pd.DataFrame):
+        return data, len(data.index)
+    if isinstance(data, np.ndarray):
+        if data.dtype.names is None:
+            raise ValueError("Arrays of experiment data should be structured arrays with named fields : {}".format(data.dtype))
+        return {name: data[name] for name in data.dtype.names}, len(data)
+    columns = {name: values if isinstance(values, (pd.Series, pd.Categorical)) else np.asarray(values)
+               for name, values in data.items()}
+    lengths = set(len(values) for values in columns.values())
+    if len(lengths) > 1:
+        raise ValueError("The columns of the experiment data should have the same length : {}".format(sorted(lengths)))
+    return columns, lengths.pop() if lengths else 0
+
+
+def _values(column):
+    return column.values if isinstance(column, pd.Series) else np.asarray(column)
+
+
+def _categorical(column):
+    # the codes and the categories of a categorical column, None for the other columns
+    if hasattr(column, 'cat'):
+        return column.cat.codes.values, column.cat.categories
+    if isinstance(column, pd.Categorical):
+        return column.codes, column.categories
+    return None
+
+
+def _factorize_crossing(df, n_rows, columns):
+    # the compact codes and the sorted tuple labels of the crossings of the columns that are in the data
+    flat = np.zeros(n_rows, dtype=np.int64)
+    valid = np.ones(n_rows, dtype=bool)
+    column_labels = []
+    for column in columns:
+        codes, labels = _factorize_optional(df, n_rows, column)
+        flat *= len(labels)
+        flat += codes
+        valid &= codes >= 0
+        column_labels.append(labels)
+    n_crossings = int(np.prod([len(labels) for labels in column_labels]))
+    if n_crossings <= max(n_rows, 1 << 16):
+        # the crossings that are in the data are counted without sorting the rows, and the table maps them to codes
+        crossings = np.flatnonzero(np.bincount(flat[valid], minlength=n_crossings))
+        table = np.full(n_crossings + 1, -1, dtype=_code_dtype(len(crossings)))
+        table[crossings] = np.arange(len(crossings))
+        codes = table[np.where(valid, flat, n_crossings)]
+    else:
+        crossings, inverse = np.unique(flat[valid], return_inverse=True)
+        codes = np.full(n_rows, -1, dtype=_code_dtype(len(crossings)))
+        codes[valid] = inverse.ravel()
+    positions = np.unravel_index(crossings, tuple(len(labels) for labels in column_labels))
+    labels = list(zip(*[[labels[position] for position in column_positions]
+                        for labels, column_positions in zip(column_labels, positions)]))
+    return codes, labels or [None]
+
+
+def _factorize_optional(df, n_rows, column, as_str=False):
+    # returns compact integer codes (-1 for missing values) and the sorted labels of a column
+    if isinstance(column, tuple):
+        return _factorize_crossing(df, n_rows, column)
+    if column not in df:
+        return np.zeros(n_rows, dtype=np.int8), [None]
+    series = df[column]
+    categorical = _categorical(series)
+    if not as_str and categorical is None:
+        codes, labels = pd.factorize(series, sort=True)
+        return codes.astype(_code_dtype(len(labels)), copy=False), list(labels)
+    if categorical is not None:
+        # categoricals are already encoded, only their (few) categories that appear in the data are sorted
+        codes, uniques = categorical
+        present = np.bincount(codes[codes >= 0], minlength=len(uniques)) > 0
+        uniques, positions = uniques[present], np.flatnonzero(present)
+    else:
+        codes, uniques = pd.factorize(series)
+        positions = np.arange(len(uniques))
+    labels = np.asarray(pd.Index(uniques).astype(str) if as_str else uniques, dtype=object)
+    order = _date_order(labels) if as_str else np.argsort(labels, kind='mergesort')
+
+    # lookup table from the raw codes to the positions of the sorted labels. its last entry maps missing values (-1)
+    table = np.full(len(positions) and positions[-1] + 2, -1, dtype=_code_dtype(len(labels)))
+    table[positions[order]] = np.arange(len(order))
+    return table[codes] if len(table) else codes, list(labels[order])
+
+
+def _code_dtype(n_labels):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_labels < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _date_order(labels):
+    # the order of the date labels by day and then as strings, or only as strings if they are not dates
+    labels = np.asarray(labels, dtype=object)
+    day_codes = _day_codes(labels)
+    if day_codes is None:
+        return np.argsort(labels, kind='mergesort')
+    return np.lexsort((labels, day_codes))
+
+
+def _day_codes(dates):
+    if not len(dates) or any(date is None for date in dates):
+        return None
+    parsed = pd.to_datetime(pd.Index(dates, dtype=object), errors='coerce')
+    if parsed.isnull().any():
+        return None
+    return parsed.values.astype('datetime64[D]').astype(np.int64)
+
+
+def _check_window(window):
+    if window is not None and (int(window) != window or window < 1):
+        raise ValueError("window should be a positive number of days : {}".format(window))
+    return window
+
+
+def _sort_key(cube):
+    # the values that the date axis is sorted by
+    day_codes = cube.get_day_codes()
+    return cube.dates if day_codes is None else day_codes
+
+
+def _query_key(cube, date):
+    if cube.get_day_codes() is None:
+        return str(date)
+    try:
+        timestamp = pd.Timestamp(date)
+    except (TypeError, ValueError):
+        timestamp = pd.NaT
+    if pd.isnull(timestamp):
+        raise ValueError("The dates of the cube are dates and {!r} is not a date".format(date))
+    return np.datetime64(timestamp.to_datetime64(), 'D').astype(np.int64)
+
+
+def _union_labels(labels, other_labels, dates=False):
+    known = set(labels)
+    united = list(labels) + [label for label in other_labels if label not in known]
+    if None in united:
+        if len(united) > 1:
+            raise ValueError("Cannot merge cubes with and without an axis: {}".format(united))
+        return united
+    if dates:
+        return [united[idx] for idx in _date_order(united)]
+    return sorted(united)
+
+
+def _positions(labels, united_labels):
+    index = {label: idx for idx, label in enumerate(united_labels)}
+    return np.array([index[label] for label in labels], dtype=np.intp)
+
+
+def _to_python(values):
+    return [value.item() if isinstance(value, np.generic) else value for value in values]
+
+
+def _compact_counts(array):
+    # sums of counts are stored as fixed width integers, sums of continuous values keep their floats
+    array = np.asarray(array)
+    if array.dtype.kind == 'f' and np.isfinite(array).all() and (array == np.round(array)).all() \
+            and np.abs(array).max(initial=0) < 2 ** 53:
+        return array.astype(np.int64)
+    return array
+
+
+def _store_directory(path):
+    # the directory of the arrays of the current version of a store, None if there is no versioned store at path
+    try:
+        with open(os.path.join(path, 'header.json')) as f:
+            header = json.load(f)
+    except (IOError, ValueError):
+        return None
+    return header.get('directory') if header.get('format') == STORE_FORMAT else None
+
+
+def _write_atomically(path, name, write):
+    handle, temporary = tempfile.mkstemp(dir=path, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            write(f)
+        os.replace(temporary, os.path.join(path, name))
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def _bincount_sum(flat_index, values, n_cells):
+    values = np.asarray(values)
+    if values.dtype.kind in 'biu':
+        # integer and boolean counts have no missing values to skip
+        return np.bincount(flat_index, weights=values, minlength=n_cells)
+    values = values.astype(np.float64)
+    mask = ~np.isnan(values)
+    return np.bincount(flat_index[mask], weights=values[mask], minlength=n_cells)
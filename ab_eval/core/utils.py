@@ -1,18 +1,19 @@
-import random
-import string
 import logging
-import scipy.stats as scs
 import pandas as pd
 from datetime import datetime, timedelta
 import numpy as np
+from scipy.special import ndtri
+from ab_eval.core.summary_cube import summary_cube
 
 logger = logging.getLogger(__name__)
 
-# import numpy as np
+
+KPIS = ['CVR', 'mCVR1', 'mCVR2', 'mCVR3', 'mCVR4']
+SEGMENTS = ['new', 'returning']
 
 
 def generate_random_cvr_data(sample_size, p_control, p_variation, days=None, control_label='A',
-                             variation_label='B'):
+                             variation_label='B', mode='raw', seed=None):
     """This function generates fake dataset for an ab test
     :param:   sample_size: sample size of the experament
     :type:    s_size_control: int
@@ -27,68 +28,110 @@ def generate_random_cvr_data(sample_size, p_control, p_variation, days=None, con
     :type:    control_label: str
     :param:   (optional) variation_label: The label of the variation
     :type:    variation_label: str
+    :param:   (optional) mode: 'raw' to simulate every session and aggregate them, or 'aggregated' to draw
+              the binomial counts of every (group, segment, date) cell directly
+    :type:    mode: str
+    :param:   (optional) seed: the seed or the numpy Generator of the random numbers
+    :type:    seed: int or numpy.random.Generator
     :returns: df :dataframe with the generated test data
     :rtype: dataframe
     """
     logging.info('Fake test is generating with sample_size={}.'.format(sample_size))
-    data = []
-    # total amount of rows in the data
-    group_bern = scs.bernoulli(0.5)  # used to generate equal sample sizes
-    # initiate bernoulli distributions to randomly sample from
-    A_bern = scs.bernoulli(p_control)
-    B_bern = scs.bernoulli(p_variation)
-    d1 = datetime.strptime('2018-01-01', '%Y-%m-%d')
-    for idx in range(sample_size):
-        row = {}
-        row['segment'] = random.choice(['new', 'returning'])
-        row['fullvisitorid'] = ''.join(random.choices(string.digits, k=20))
-        row['visitid'] = random.randint(1400000000, 1500000000)  # randint is inclusive at both ends
-        if days is not None:
-            if type(days) == int:
-                row['date'] = (d1 + timedelta(days=idx // (sample_size // days))).strftime('%Y-%m-%d')
-
-            else:
-                raise ValueError("Expecting integer but got {}.".format(type(days)))
-        # assign group based on 50/50 probability and assign values
-        group_type = lambda x: control_label if x == 0 else variation_label
-        row['group'] = group_type(group_bern.rvs())
-        if row['group'] == control_label:
-            # assign conversion based on provided parameters
-            row['CVR_converted'] = A_bern.rvs()
-            row['mCVR1_converted'] = A_bern.rvs()
-            row['mCVR2_converted'] = A_bern.rvs()
-            row['mCVR3_converted'] = A_bern.rvs()
-            row['mCVR4_converted'] = A_bern.rvs()
-        else:
-            row['CVR_converted'] = B_bern.rvs()
-            row['mCVR1_converted'] = B_bern.rvs()
-            row['mCVR2_converted'] = B_bern.rvs()
-            row['mCVR3_converted'] = B_bern.rvs()
-            row['mCVR4_converted'] = B_bern.rvs()
-
-        data.append(row)
-
-    # convert data into pandas dataframe and transform
-    df = pd.DataFrame(data)
-
+    keys = ['group', 'segment'] if days is None else ['group', 'segment', 'date']
+    if mode == 'raw':
+        sessions = generate_random_sessions(sample_size, p_control, p_variation, days=days, control_label=control_label,
+                                            variation_label=variation_label, seed=seed, visitor_ids=False)
+        grouped = sessions.groupby(keys, observed=True)
+        data = grouped[['{}_converted'.format(kpi) for kpi in KPIS]].sum()
+        sizes = grouped.size()
+        for kpi in KPIS:
+            data['{}_sample_size'.format(kpi)] = sizes
+        data = data.reset_index()
+        for key in keys:
+            data[key] = data[key].astype(object)
+        return data
+    if mode != 'aggregated':
+        raise ValueError("mode should be one of 'raw' or 'aggregated' : {}".format(mode))
+
+    rng = np.random.default_rng(seed)
+    day_sizes = _get_day_sizes(sample_size, days)
+    # every session is assigned with equal probability to one of the group x segment cells of its day
+    cell_sizes = np.stack([rng.multinomial(size, [0.25] * 4) for size in day_sizes], axis=-1).reshape(2, 2, -1)
+    probabilities = np.array([p_control, p_variation]).reshape(2, 1, 1)
+    groups, segments, dates = np.nonzero(cell_sizes)
+    data = {
+        'group': np.array([control_label, variation_label], dtype=object)[groups],
+        'segment': np.array(SEGMENTS, dtype=object)[segments]
+    }
     if days is not None:
-        data = df.pivot_table(index=['group', 'segment', 'date'], aggfunc=np.sum)
-        data = data.drop('visitid', 1)
-        data['CVR_sample_size'] = df.pivot_table(values='CVR_converted', index=['group', 'segment', 'date'], aggfunc=lambda x: len(x))
-        data['mCVR1_sample_size'] = df.pivot_table(values='mCVR1_converted', index=['group', 'segment', 'date'], aggfunc=lambda x: len(x))
-        data['mCVR2_sample_size'] = df.pivot_table(values='mCVR2_converted', index=['group', 'segment', 'date'], aggfunc=lambda x: len(x))
-        data['mCVR3_sample_size'] = df.pivot_table(values='mCVR3_converted', index=['group', 'segment', 'date'], aggfunc=lambda x: len(x))
-        data['mCVR4_sample_size'] = df.pivot_table(values='mCVR4_converted', index=['group', 'segment', 'date'], aggfunc=lambda x: len(x))
-    else:
-        data = df.pivot_table(index=['group', 'segment'], aggfunc=np.sum)
-        data = data.drop('visitid', 1)
-        data['CVR_sample_size'] = df.pivot_table(values='CVR_converted', index=['group', 'segment'], aggfunc=lambda x: len(x))
-        data['mCVR1_sample_size'] = df.pivot_table(values='mCVR1_converted', index=['group', 'segment'], aggfunc=lambda x: len(x))
-        data['mCVR2_sample_size'] = df.pivot_table(values='mCVR2_converted', index=['group', 'segment'], aggfunc=lambda x: len(x))
-        data['mCVR3_sample_size'] = df.pivot_table(values='mCVR3_converted', index=['group', 'segment'], aggfunc=lambda x: len(x))
-        data['mCVR4_sample_size'] = df.pivot_table(values='mCVR4_converted', index=['group', 'segment'], aggfunc=lambda x: len(x))
+        data['date'] = _get_date_labels(len(day_sizes))[dates]
+    sizes = cell_sizes[groups, segments, dates]
+    for kpi in KPIS:
+        data['{}_converted'.format(kpi)] = rng.binomial(sizes, probabilities[groups, 0, 0])
+    for kpi in KPIS:
+        data['{}_sample_size'.format(kpi)] = sizes
+    return pd.DataFrame(data).sort_values(keys).reset_index(drop=True)
+
+
+def generate_random_sessions(sample_size, p_control, p_variation, days=None, control_label='A',
+                             variation_label='B', seed=None, visitor_ids=True):
+    """This function generates fake session level data for an ab test, one row per visit
+    :param:   sample_size: the number of sessions
+    :type:    sample_size: int
+    :param    p_control: The conversion rate of the control group (probability to convert)
+    :type     p_control: float
+    :param    p_variation: The conversion rate of the variation   (probability to convert)
+    :type     p_variation: float
+    :param:   (optional) days: if provided, a 'date' column divides the data in chunks of time
+            Note: overflow data will be included in an extra day
+    :type:  days: integer
+    :param:   (optional) control_label: The label of the control group
+    :type:    control_label: str
+    :param:   (optional) variation_label: The label of the variation
+    :type:    variation_label: str
+    :param:   (optional) seed: the seed or the numpy Generator of the random numbers
+    :type:    seed: int or numpy.random.Generator
+    :param:   (optional) visitor_ids: False to skip the 'fullvisitorid' and 'visitid' columns
+    :type:    visitor_ids: bool
+    :returns: df :dataframe with a row per session, the group, segment and date columns are categoricals
+    :rtype: dataframe
+    """
+    rng = np.random.default_rng(seed)
+    data = {'segment': pd.Categorical.from_codes(rng.integers(0, 2, sample_size), SEGMENTS)}
+    if visitor_ids:
+        data['fullvisitorid'] = _random_visitor_ids(rng, sample_size)
+        data['visitid'] = rng.integers(1400000000, 1500000000, sample_size, endpoint=True)
+    if days is not None:
+        day_sizes = _get_day_sizes(sample_size, days)
+        data['date'] = pd.Categorical.from_codes(np.repeat(np.arange(len(day_sizes)), day_sizes), _get_date_labels(len(day_sizes)))
+    # assign group based on 50/50 probability and conversions based on the probability of the group
+    is_variation = rng.random(sample_size) < 0.5
+    data['group'] = pd.Categorical.from_codes(is_variation.astype(np.int8), [control_label, variation_label])
+    probability = np.where(is_variation, p_variation, p_control)
+    for kpi in KPIS:
+        data['{}_converted'.format(kpi)] = (rng.random(sample_size) < probability).astype(np.int64)
+    return pd.DataFrame(data)
+
 
-    return data.reset_index()
+def _get_day_sizes(sample_size, days):
+    if days is None:
+        return np.array([sample_size])
+    if type(days) != int:
+        raise ValueError("Expecting integer but got {}.".format(type(days)))
+    # sessions are split in chunks of sample_size // days, the overflow goes to an extra day
+    per_day = sample_size // days
+    full_days, overflow = divmod(sample_size, per_day)
+    return np.array([per_day] * full_days + ([overflow] if overflow else []))
+
+
+def _get_date_labels(n_days):
+    return np.array([(datetime(2018, 1, 1) + timedelta(days=day)).strftime('%Y-%m-%d') for day in range(n_days)], dtype=object)
+
+
+def _random_visitor_ids(rng, size):
+    # 20 random digits per row, viewed as fixed width byte strings
+    digits = rng.integers(ord('0'), ord('9'), (size, 20), dtype=np.uint8, endpoint=True)
+    return digits.view('S20').ravel().astype(str)
 
 
 def get_segments_sample_size(df, kpi, segment=None, segment_column='segment'):
@@ -124,6 +167,11 @@ def get_test_summary(df, kpi, segment=None, segment_column='segment', variations
     :return: dataframe with test_sammary
     """
 
+    if '{}_sample_size'.format(kpi) not in df.columns:
+        # session level data, one row per visit, are aggregated first
+        df = summary_cube.from_sessions(df, [kpi], variations_column=variations_column, segment_column=segment_column,
+                                        date_column=None).to_dataframe(variations_column=variations_column)
+
     if segment:
         df = df[df[segment_column] == segment]
 
@@ -149,11 +197,10 @@ def get_min_sample_size(baseline_cvr, expected_uplift, power=0.8, sig_level=0.05
     :return: min
     """
 
-    standard_norm = scs.norm(0, 1)
     # find Z_beta from desired power
-    Z_beta = standard_norm.ppf(power)
+    Z_beta = ndtri(power)
     # find Z_alpha
-    Z_alpha = standard_norm.ppf(1 - sig_level / 2)
+    Z_alpha = ndtri(1 - sig_level / 2)
     # average of probabilities from both groups
     pooled_prob = (baseline_cvr + baseline_cvr + expected_uplift) / 2
     min_sample_size = (2 * pooled_prob * (1 - pooled_prob) * (Z_beta + Z_alpha)**2 / expected_uplift**2)
@@ -184,14 +231,13 @@ def get_z_val(sig_level=0.05, two_tailed=True):
     :type    two_tailed: bool
     :return: z_val
     """
-    z_dist = scs.norm()
     if two_tailed:
         sig_level = sig_level / 2
         area = 1 - sig_level
     else:
         area = 1 - sig_level
 
-    return z_dist.ppf(area)
+    return ndtri(area)
 
 
 def get_standard_deviation(conversion_probability):
@@ -219,5 +265,5 @@ def get_confidence_interval_single_variation(sample_mean=0, sample_std=1, sample
     :return: confidence_interval as a tuple
     """
 
-    return (sample_mean - get_z_val(significance_level, two_tailed) * sample_std / np.sqrt(sample_size),
-            sample_mean + get_z_val(significance_level, two_tailed) * sample_std / np.sqrt(sample_size))
+    margin = get_z_val(significance_level, two_tailed) * sample_std / np.sqrt(sample_size)
+    return sample_mean - margin, sample_mean + margin
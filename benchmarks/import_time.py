@@ -0,0 +1,55 @@
+"""Benchmark of the time that `import ab_eval` adds to the start of the interpreter.
+
+The import runs in fresh interpreters (best of a few runs) and the start of an empty interpreter is subtracted.
+The script exits with a non zero status when the import takes longer than the target or loads one of the heavy
+modules (pandas, scipy, statsmodels, ...) that should only be imported on first use.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module ab_eval.core.experiment --target 2
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'statsmodels', 'simplejson', 'matplotlib']
+
+
+def start_time(code, repeats):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        timings.append(time.perf_counter() - start)
+    return min(timings), env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='ab_eval', help='the module to import')
+    parser.add_argument('--target', type=float, default=0.05, help='the allowed import time in seconds')
+    parser.add_argument('--repeats', type=int, default=10, help='interpreter starts per measurement, the best one is kept')
+    args = parser.parse_args()
+
+    empty, _ = start_time('pass', args.repeats)
+    total, env = start_time('import {}'.format(args.module), args.repeats)
+    import_time = max(total - empty, 0.0)
+
+    code = "import sys, {}; print(' '.join(m for m in {!r} if m in sys.modules))".format(args.module, HEAVY_MODULES)
+    heavy = subprocess.check_output([sys.executable, '-c', code], env=env).decode().split()
+
+    print('import {}: {:.4f}s (target {:.4f}s)'.format(args.module, import_time, args.target))
+    print('heavy modules loaded: {}'.format(', '.join(heavy) or 'none'))
+    if import_time > args.target:
+        print('The import is slower than the target.')
+        sys.exit(1)
+    if args.module == 'ab_eval' and heavy:
+        print('The import loads heavy modules eagerly.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Benchmarks of the hot paths of ab_eval on synthetic data.
+
+Every case is timed (best of a few repeats) and its peak memory is traced. The results are compared against
+benchmarks/baseline.json and the script exits with a non zero status when a case got slower or bigger than the
+baseline allows.
+
+Absolute timings only compare on the same machine, so the baseline is local (it is not committed) and is kept per
+environment: the platform, the cpu count and the versions of python, numpy, pandas and scipy. The first run in an
+environment has nothing to compare against and must store its baseline with --update-baseline.
+
+    python benchmarks/run_benchmarks.py                     # compare against the baseline
+    python benchmarks/run_benchmarks.py --update-baseline   # store the current results as the baseline
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import pandas as pd
+import scipy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ab_eval.core.experiment import experiment  # noqa: E402
+from ab_eval.core.experiment_components import evaluation_metrics  # noqa: E402
+from ab_eval.core.summary_cube import summary_cube  # noqa: E402
+from ab_eval.core.utils import KPIS, generate_random_cvr_data, generate_random_sessions, get_test_summary  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+GRID = {
+    'rows': [10000, 200000],
+    'dates': [7, 60],
+    'segments': [2, 10],
+    'kpis': [1, 5]
+}
+GENERATOR_SIZES = [100000, 1000000]
+
+
+def make_data(rows, dates, segments, kpis, seed=0):
+    """Aggregated experiment data with the given number of rows, dates, segments and kpis"""
+    rng = np.random.default_rng(seed)
+    data = {
+        'group': np.where(rng.random(rows) < 0.5, 'A', 'B').astype(object),
+        'segment': np.array(['segment_{}'.format(idx) for idx in range(segments)], dtype=object)[rng.integers(0, segments, rows)],
+        'date': np.array(['2018-{:02d}-{:02d}'.format(1 + idx // 28, 1 + idx % 28) for idx in range(dates)],
+                         dtype=object)[rng.integers(0, dates, rows)]
+    }
+    for kpi in kpi_names(kpis):
+        sample_size = rng.integers(1, 100, rows)
+        data['{}_sample_size'.format(kpi)] = sample_size
+        data['{}_converted'.format(kpi)] = rng.binomial(sample_size, 0.3)
+    return pd.DataFrame(data)
+
+
+def environment():
+    """The key of the baseline entries that were measured in an environment like the current one"""
+    return '{} {} cpus={} python={} numpy={} pandas={} scipy={}'.format(
+        platform.system(), platform.machine(), os.cpu_count(), platform.python_version(), np.__version__, pd.__version__,
+        scipy.__version__)
+
+
+def kpi_names(kpis):
+    return ['CVR'] + ['mCVR{}'.format(idx) for idx in range(1, kpis)]
+
+
+def get_cases():
+    cases = []
+    for rows, dates, segments, kpis in itertools.product(*GRID.values()):
+        name = 'rows={} dates={} segments={} kpis={}'.format(rows, dates, segments, kpis)
+        data = make_data(rows, dates, segments, kpis)
+        segment_labels = sorted(data['segment'].unique())
+
+        def new_experiment(data=data, kpis=kpis, segment_labels=segment_labels):
+            return experiment(data, kpis=evaluation_metrics(kpis=kpi_names(kpis)), segments=segment_labels)
+
+        cases.append(('experiment.analyze ' + name,
+                      lambda new_experiment=new_experiment: new_experiment().analyze(analyze_segments=True)))
+        cases.append(('experiment.analyze_historically ' + name,
+                      lambda new_experiment=new_experiment: new_experiment().analyze_historically(analyze_segments=True)))
+        cases.append(('utils.get_test_summary ' + name,
+                      lambda data=data, segment=segment_labels[0]: get_test_summary(data, 'CVR', segment=segment)))
+    for sample_size in GENERATOR_SIZES:
+        for mode in ['raw', 'aggregated']:
+            def generate(sample_size=sample_size, mode=mode):
+                return generate_random_cvr_data(sample_size, 0.3, 0.35, days=30, mode=mode, seed=0)
+
+            cases.append(('utils.generate_random_cvr_data sample_size={} mode={}'.format(sample_size, mode), generate))
+        sessions = generate_random_sessions(sample_size, 0.3, 0.35, days=30, seed=0, visitor_ids=False)
+        cases.append(('summary_cube.from_sessions sample_size={}'.format(sample_size),
+                      lambda sessions=sessions: summary_cube.from_sessions(sessions, KPIS)))
+    return cases
+
+
+def measure(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'time': min(timings), 'peak_memory': peak}
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance, time_slack):
+    failures = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            status = 'new'
+        elif result['time'] > reference['time'] * time_tolerance + time_slack:
+            status = 'SLOWER'
+        elif result['peak_memory'] > reference['peak_memory'] * memory_tolerance:
+            status = 'BIGGER'
+        else:
+            status = 'ok'
+        if status in ('SLOWER', 'BIGGER'):
+            failures.append(name)
+        print('{:<8} {:>10.4f}s {:>10.1f}MB  {}'.format(status, result['time'], result['peak_memory'] / 2 ** 20, name))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--repeats', type=int, default=3, help='timing repeats per case, the best one is kept')
+    parser.add_argument('--time-tolerance', type=float, default=2.0, help='allowed slowdown factor against the baseline')
+    parser.add_argument('--time-slack', type=float, default=0.005,
+                        help='allowed absolute slowdown in seconds, so that timer noise of tiny cases does not fail')
+    parser.add_argument('--memory-tolerance', type=float, default=1.5, help='allowed peak memory factor against the baseline')
+    parser.add_argument('--filter', default='', help='only run the cases that contain this string')
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baselines = json.load(f)
+    key = environment()
+    if key not in baselines and not args.update_baseline:
+        sys.exit('There is no baseline for this environment ({}) in {}, run with --update-baseline first'.format(
+            key, BASELINE))
+
+    logging.disable(logging.INFO)
+    warnings.simplefilter('ignore')
+    results = {}
+    for name, function in get_cases():
+        if args.filter in name:
+            results[name] = measure(function, args.repeats)
+
+    baseline = baselines.setdefault(key, {})
+    failures = compare(results, baseline, args.time_tolerance, args.memory_tolerance, args.time_slack)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print('Baseline of {} updated: {}'.format(key, BASELINE))
+    elif failures:
+        print('{} benchmark(s) regressed against the baseline:\n  {}'.format(len(failures), '\n  '.join(failures)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
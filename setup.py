@@ -22,6 +22,8 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=requirements,
+    # pandas 2.2, the first release built against numpy 2, needs python 3.9
+    python_requires='>=3.9',
     license="MIT",
     zip_safe=False,
     keywords='ab_eval',
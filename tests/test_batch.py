@@ -0,0 +1,38 @@
+import os
+import pandas as pd
+import pytest
+import ab_eval
+from ab_eval.core.batch import analyze_many
+from ab_eval.core.experiment import experiment
+from ab_eval.core.experiment_components import evaluation_metrics, variations
+
+DUMMY_DATA = os.path.join(os.path.dirname(ab_eval.__file__), 'data', 'dummy_data.json')
+
+
+def test_analyze_many_matches_single_experiments():
+    df = pd.read_json(DUMMY_DATA, lines=True)
+    kpis = evaluation_metrics(kpis=['CVR', 'mCVR1'])
+    variation = variations(column_name='variations', control_label='control', variation_label='variation')
+    results = list(analyze_many(df, kpis=kpis, variations=variation))
+    assert len(results) == df['experiments'].nunique()
+    for label, result in results[:5]:
+        exp = experiment(df[df['experiments'] == label].copy(), kpis=kpis, variations=variation)
+        assert result == exp.analyze()
+
+
+def test_analyze_many_historically_with_process_backend():
+    df = pd.read_json(DUMMY_DATA, lines=True)
+    variation = variations(column_name='variations', control_label='control', variation_label='variation')
+    serial = list(analyze_many(df, variations=variation, historically=True))
+    parallel = list(analyze_many(df, variations=variation, historically=True, backend='process', n_workers=2))
+    assert serial == parallel
+
+
+def test_analyze_many_checks_arguments_eagerly_and_streams_chunks():
+    df = pd.read_json(DUMMY_DATA, lines=True)
+    variation = variations(column_name='variations', control_label='control', variation_label='variation')
+    with pytest.raises(ValueError):
+        analyze_many(df, variations=variation, backend='threads')
+    results = analyze_many(df, variations=variation, chunk_size=3)
+    first = next(results)
+    assert [first] + list(results) == list(analyze_many(df, variations=variation))
@@ -0,0 +1,26 @@
+from ab_eval.core.cache import result_cache, fingerprint
+from ab_eval.core.experiment import experiment
+from ab_eval.core.utils import generate_random_cvr_data
+
+
+def test_lru_and_disk_store(tmpdir):
+    cache = result_cache(max_entries=2, path=str(tmpdir))
+    for key in ['a', 'b', 'c']:
+        cache.set((key,), key.upper())
+    assert len(cache) == 2 and ('a',) not in cache._entries
+    assert cache.get(('a',)) == 'A'
+    assert result_cache(path=str(tmpdir)).get(('c',)) == 'C'
+    assert cache.get(('d',), 'missing') == 'missing'
+
+
+def test_experiment_results_are_cached_by_data():
+    df = generate_random_cvr_data(2000, 0.3, 0.4, days=5, seed=7)
+    cache = result_cache()
+    results = experiment(df, cache=cache).analyze()
+    assert experiment(df.copy(), cache=cache).analyze() == results and cache.hits == 1
+
+    changed = df.copy()
+    changed.loc[0, 'CVR_converted'] += 1
+    assert fingerprint(changed) != fingerprint(df)
+    assert experiment(changed, cache=cache).get_p_val() == experiment(changed).get_p_val()
+    assert cache.hits == 1
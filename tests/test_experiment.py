@@ -1,6 +1,12 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats as scs
 from ab_eval.core.experiment_components import evaluation_metrics, variations
 from ab_eval.core.experiment import experiment
-from ab_eval.core.utils import generate_random_cvr_data
+from ab_eval.core.instrumentation import profiler
+from ab_eval.core.utils import generate_random_cvr_data, generate_random_sessions
 
 
 def test_primary_kpi_existance():
@@ -17,3 +23,171 @@ def test_get_p_value_on_random_data():
     df = generate_random_cvr_data(1000, 0.3, 0.4, days=10)
     exp = experiment(df, segments=['new', 'returning'])
     assert exp.get_p_val() is not None
+
+
+def test_experiment_does_not_modify_data():
+    df = generate_random_cvr_data(1000, 0.3, 0.4, days=10, seed=2)
+    dtypes = df.dtypes.copy()
+    exp = experiment(df, segments=['new', 'returning'])
+    exp.analyze_historically(start_date='2018-01-02', end_date='2018-01-08', window=3)
+    assert (df.dtypes == dtypes).all()
+    assert exp.get_p_val(start_date='2018-01-02', end_date='2018-01-04') == exp.get_p_val(date='2018-01-04', window=3)
+
+
+def test_unparseable_date():
+    df = generate_random_cvr_data(1000, 0.3, 0.4, days=10)
+    exp = experiment(df, segments=['new', 'returning'])
+    with pytest.raises(ValueError, match='foo'):
+        exp.get_p_val(date='foo')
+
+
+def test_experiment_from_sessions():
+    sessions = generate_random_sessions(5000, 0.3, 0.4, days=5, seed=4)
+    exp = experiment(sessions, segments=['new', 'returning'], sessions=True)
+    aggregated = experiment(exp.get_cube().to_dataframe(), segments=['new', 'returning'])
+    assert exp.analyze_historically(analyze_segments=True) == aggregated.analyze_historically(analyze_segments=True)
+    assert experiment(sessions, sessions=True).is_valid()
+
+
+def test_continuous_kpi_from_sessions_and_aggregates():
+    sessions = generate_random_sessions(5000, 0.3, 0.4, days=5, seed=5)
+    sessions['revenue'] = np.random.default_rng(5).gamma(2, 10, len(sessions.index))
+    kpis = evaluation_metrics(kpis=['CVR'], continuous_kpis=['revenue'])
+    exp = experiment(sessions, kpis=kpis, segments=['new', 'returning'], sessions=True)
+    aggregated = experiment(exp.get_cube().to_dataframe(), kpis=kpis, segments=['new', 'returning'])
+    assert exp.analyze_historically(analyze_segments=True) == aggregated.analyze_historically(analyze_segments=True)
+    reference = scs.ttest_ind(sessions['revenue'][sessions['group'] == 'B'], sessions['revenue'][sessions['group'] == 'A'], equal_var=False)
+    assert np.isclose(aggregated.get_p_val('revenue')['p-value'], reference.pvalue)
+
+
+def test_parallel_backends_match_serial():
+    df = generate_random_cvr_data(2000, 0.3, 0.4, days=5, seed=6)
+    kpis = evaluation_metrics(kpis=['CVR', 'mCVR1', 'mCVR2'])
+    serial = experiment(df, kpis=kpis, segments=['new', 'returning'])
+    for backend in ['thread', 'process']:
+        parallel = experiment(df, kpis=kpis, segments=['new', 'returning'], backend=backend, n_workers=2)
+        assert parallel.analyze(analyze_segments=True) == serial.analyze(analyze_segments=True)
+        assert parallel.analyze_historically(analyze_segments=True) == serial.analyze_historically(analyze_segments=True)
+    # the worker threads share the cube, that is aggregated once
+    prof = profiler()
+    experiment(df, kpis=kpis, segments=['new', 'returning'], backend='thread', n_workers=4, profiler=prof).analyze(analyze_segments=True)
+    assert prof.to_dict()['aggregation']['calls'] == 1
+
+
+def test_bayesian_analysis():
+    df = generate_random_cvr_data(4000, 0.3, 0.4, days=5, seed=16)
+    kpis = evaluation_metrics(kpis=['CVR', 'mCVR1'])
+    serial = experiment(df, kpis=kpis, segments=['new', 'returning'], bayesian=True)
+    results = json.loads(serial.analyze(analyze_segments=True))
+    for result in results:
+        bayesian = result['summary']['bayesian']
+        assert bayesian['probability_to_beat_control'] > 0.99 and bayesian['expected_loss']['variation'] < 1e-3
+        assert np.isclose(bayesian['expected_loss']['control'] - bayesian['expected_loss']['variation'],
+                          bayesian['posterior_mean']['variation'] - bayesian['posterior_mean']['control'])
+    assert 'bayesian' not in json.loads(experiment(df, kpis=kpis).analyze())[0]['summary']
+    parallel = experiment(df, kpis=kpis, segments=['new', 'returning'], bayesian=True, backend='process', n_workers=2)
+    assert parallel.analyze_historically(analyze_segments=True) == serial.analyze_historically(analyze_segments=True)
+
+
+def test_bootstrap_confidence_intervals():
+    sessions = generate_random_sessions(6000, 0.3, 0.4, days=7, seed=17)
+    sessions['revenue'] = np.random.default_rng(17).gamma(0.5, 40, len(sessions.index))
+    kpis = evaluation_metrics(kpis=['CVR', 'mCVR1'], continuous_kpis=['revenue'])
+    serial = experiment(sessions, kpis=kpis, segments=['new', 'returning'], sessions=True)
+    results = json.loads(serial.bootstrap_confidence_intervals(kpis=['CVR', 'mCVR1'], analyze_segments=True))
+    for result in results:
+        assert result['confidence_interval']['lower_limit'] < result['relative_uplift'] < result['confidence_interval']['upper_limit']
+    days = json.loads(serial.bootstrap_confidence_intervals(analyze_segments=True, method='days'))
+    assert [result['kpi'] for result in days] == ['CVR'] * 3 + ['mCVR1'] * 3 + ['revenue'] * 3
+    # the resampled days are shared by all the comparisons, so a single interval is the same as in the batch
+    assert serial.get_confidence_interval_of_test('revenue', segment='new', method='days') == days[7]['confidence_interval']
+    with pytest.raises(ValueError):
+        serial.bootstrap_confidence_intervals(kpis=['revenue'])
+    # a single day has nothing to resample
+    with pytest.raises(ValueError):
+        serial.bootstrap_confidence_intervals(method='days', window=1)
+    with pytest.raises(ValueError):
+        experiment(sessions.drop(columns='date'), kpis=kpis, sessions=True).get_confidence_interval_of_test('CVR', method='days')
+    threaded = experiment(sessions, kpis=kpis, segments=['new', 'returning'], sessions=True, backend='thread', n_workers=3)
+    assert threaded.bootstrap_confidence_intervals(analyze_segments=True, method='days', n_resamples=3000) == \
+        serial.bootstrap_confidence_intervals(analyze_segments=True, method='days', n_resamples=3000)
+
+
+def test_experiment_from_store(tmpdir):
+    df = generate_random_cvr_data(2000, 0.3, 0.4, days=5, seed=8)
+    kpis = evaluation_metrics(kpis=['CVR', 'mCVR1'])
+    exp = experiment(df, kpis=kpis, segments=['new', 'returning'])
+    exp.get_cube().save(str(tmpdir))
+    stored = experiment.from_store(str(tmpdir), kpis=kpis, segments=['new', 'returning'], backend='process', n_workers=2)
+    assert stored.analyze_historically(analyze_segments=True) == exp.analyze_historically(analyze_segments=True)
+
+
+def test_experiment_from_arrays():
+    df = generate_random_cvr_data(2000, 0.3, 0.4, days=5, seed=10)
+    columns = {column: df[column].values for column in df.columns}
+    records = df.to_records(index=False).astype([(column, 'U10' if df[column].dtype == object else df[column].dtype)
+                                                 for column in df.columns])
+    expected = experiment(df, segments=['new', 'returning']).analyze_historically(analyze_segments=True)
+    for data in (columns, records):
+        exp = experiment(data, segments=['new', 'returning'])
+        assert exp.analyze_historically(analyze_segments=True) == expected
+        assert experiment(data).is_valid() == experiment(df).is_valid()
+        usage = exp.memory_usage()
+        assert usage['cubes'] > 0 and usage['total'] == usage['data'] + usage['cubes']
+
+
+def test_sample_ratio_mismatch():
+    df = generate_random_cvr_data(20000, 0.3, 0.4, days=5, seed=11)
+    exp = experiment(df, segments=['new', 'returning'])
+    checks = exp.check_sample_ratio(end_date='2018-01-04')
+    assert [check['segment'] for check in checks] == ['all', 'new', 'returning']
+    assert not any(check['summary']['srm'] for check in checks) and exp.is_valid()
+    assert len(checks[0]['history']) == 4
+    assert checks[0]['history'][-1]['cumulative']['volumes'] == checks[0]['summary']['volumes']
+
+    skewed = df[~((df['group'] == 'B') & (df['segment'] == 'new') & (df['date'] == '2018-01-03'))]
+    checks = experiment(skewed, segments=['new', 'returning']).check_sample_ratio()
+    assert [check['summary']['srm'] for check in checks] == [True, True, False]
+    assert [day['daily']['srm'] for day in checks[1]['history']] == [False, False, True, False, False]
+    assert not experiment(skewed, segments=['new', 'returning']).is_valid()
+
+
+def test_analyze_arms():
+    df = generate_random_cvr_data(4000, 0.3, 0.4, days=5, seed=12)
+    other = generate_random_cvr_data(4000, 0.32, 0.3, days=5, seed=13)
+    other['group'] = other['group'].map({'A': 'C', 'B': 'D'})
+    data = pd.concat([df, other], ignore_index=True)
+    abn = experiment(data, variations=variations(variation_labels=['B', 'C', 'D']), segments=['new', 'returning'])
+    results = json.loads(abn.analyze_arms(analyze_segments=True, correction='bonferroni'))
+    assert [(comparison['control'], comparison['variation']) for comparison in results[0]['comparisons']] == \
+        [('A', 'B'), ('A', 'C'), ('A', 'D')]
+    for result in results:
+        segment = None if result['segment'] == 'all' else result['segment']
+        for comparison in result['comparisons']:
+            pair = experiment(data[data['group'].isin(['A', comparison['variation']])],
+                              variations=variations(variation_label=comparison['variation']))
+            p_value = pair.get_p_val(segment=segment)['p-value']
+            assert np.isclose(comparison['summary']['test']['p-value'], p_value)
+            assert np.isclose(comparison['adjusted_p-value'], min(3 * p_value, 1))
+    assert len(json.loads(abn.analyze_arms(all_pairs=True))[0]['comparisons']) == 6
+
+
+def test_analyze_cells_of_crossed_segments():
+    sessions = generate_random_sessions(20000, 0.3, 0.35, days=5, seed=14, visitor_ids=False)
+    rng = np.random.default_rng(15)
+    sessions['platform'] = np.array(['android', 'ios', 'web'], dtype=object)[rng.integers(0, 3, len(sessions.index))]
+    sessions['country'] = np.array(['de', 'gr'], dtype=object)[rng.integers(0, 2, len(sessions.index))]
+    kpis = evaluation_metrics(kpis=['CVR', 'mCVR1'])
+    columns = ['platform', 'country', 'segment']
+    exp = experiment(sessions, kpis=kpis, sessions=True)
+    results = json.loads(exp.analyze_cells(columns, min_sample_size=50))
+    assert len(results) == 2 * 12
+    for result in results[:12]:
+        subset = sessions[np.logical_and.reduce([sessions[column] == result['segment'][column] for column in columns])]
+        assert np.isclose(result['summary']['test']['p-value'],
+                          experiment(subset, kpis=kpis, sessions=True).get_p_val(result['kpi'])['p-value'])
+    assert json.loads(exp.analyze_cells(columns, min_sample_size=10 ** 6)) == []
+
+    crossed = experiment(sessions, kpis=kpis, sessions=True, segment_column=['platform', 'segment'], segments=[('ios', 'new')])
+    assert json.loads(crossed.analyze(analyze_segments=True))[1]['segment'] == ['ios', 'new']
+    assert crossed.get_cube(('platform', 'segment')).to_dataframe()['platform'].nunique() == 3
@@ -0,0 +1,35 @@
+from ab_eval.core.experiment import experiment
+from ab_eval.core.experiment_components import evaluation_metrics
+from ab_eval.core.experiment_state import experiment_state
+import numpy as np
+from ab_eval.core.utils import generate_random_cvr_data, generate_random_sessions
+
+
+def test_append_matches_full_recompute():
+    df = generate_random_cvr_data(2000, 0.3, 0.4, days=5, seed=3)
+    kpis = evaluation_metrics(kpis=['CVR', 'mCVR1'])
+    state = experiment_state(kpis=kpis, segments=['new', 'returning'])
+    for date in df['date'].unique():
+        state.append(df[df['date'] == date])
+    exp = experiment(df.copy(), kpis=kpis, segments=['new', 'returning'])
+    assert state.analyze_historically(analyze_segments=True) == exp.analyze_historically(analyze_segments=True)
+
+
+def test_state_round_trip(tmpdir):
+    df = generate_random_cvr_data(2000, 0.3, 0.4, days=5, seed=3)
+    state = experiment_state().append(df[df['date'] <= '2018-01-03'])
+    path = str(tmpdir.join('state.json'))
+    state.save(path)
+    loaded = experiment_state.load(path).append(df[df['date'] > '2018-01-03'])
+    assert loaded.analyze() == experiment(df.copy()).analyze()
+
+
+def test_crossed_segments_state_round_trip(tmpdir):
+    sessions = generate_random_sessions(4000, 0.3, 0.4, days=4, seed=9, visitor_ids=False)
+    sessions['platform'] = np.array(['android', 'ios'], dtype=object)[np.random.default_rng(10).integers(0, 2, len(sessions.index))]
+    state = experiment_state(segments=[('ios', 'new')], segment_column=['platform', 'segment'], sessions=True).append(sessions)
+    path = str(tmpdir.join('state.json'))
+    state.save(path)
+    loaded = experiment_state.load(path)
+    assert loaded.segments == [('ios', 'new')]
+    assert loaded.analyze(analyze_segments=True) == state.analyze(analyze_segments=True)
@@ -0,0 +1,17 @@
+import subprocess
+import sys
+
+
+def test_import_does_not_load_heavy_modules():
+    code = "import sys, ab_eval; print(' '.join(m for m in ('pandas', 'scipy', 'statsmodels', 'simplejson') if m in sys.modules))"
+    loaded = subprocess.check_output([sys.executable, '-c', code]).decode().strip()
+    assert loaded == ''
+
+
+def test_lazy_attributes():
+    import ab_eval
+    from ab_eval.core.experiment import experiment
+    from ab_eval.core.experiment_components import variations
+    assert ab_eval.experiment is experiment
+    assert ab_eval.variations is variations
+    assert ab_eval.core.variations is variations
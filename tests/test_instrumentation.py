@@ -0,0 +1,27 @@
+from ab_eval.core.experiment import experiment
+from ab_eval.core.instrumentation import profiler
+from ab_eval.core.utils import generate_random_cvr_data
+
+
+def test_instrument_records_stages():
+    df = generate_random_cvr_data(1000, 0.3, 0.4, days=5, seed=1)
+    exp = experiment(df, segments=['new', 'returning'])
+    with exp.instrument() as prof:
+        exp.analyze(analyze_segments=True)
+    stages = prof.to_dict()
+    assert stages['aggregation']['calls'] == 1
+    assert stages['filtering']['calls'] == 3
+    assert stages['serialization']['calls'] == 1
+    assert exp.profiler is None
+
+
+def test_profiler_callback_and_chrome_trace():
+    calls = []
+    prof = profiler(callback=lambda stage, tags, duration: calls.append(stage))
+    df = generate_random_cvr_data(1000, 0.3, 0.4, days=5, seed=1)
+    exp = experiment(df, profiler=prof)
+    exp.get_p_val()
+    assert calls == ['aggregation', 'filtering', 'statistics']
+    events = prof.to_chrome_trace()['traceEvents']
+    assert [event['name'] for event in events] == calls
+    assert all(event['ph'] == 'X' for event in events)
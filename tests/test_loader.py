@@ -0,0 +1,40 @@
+import os
+import pandas as pd
+import ab_eval
+from ab_eval.core.experiment import experiment
+from ab_eval.core.loader import read_experiment_cube, read_experiment_export
+from ab_eval.core.utils import generate_random_cvr_data
+
+DUMMY_DATA = os.path.join(os.path.dirname(ab_eval.__file__), 'data', 'dummy_data.json')
+
+
+def test_read_experiment_export_coerces_types():
+    df = read_experiment_export(DUMMY_DATA, chunksize=500)
+    raw = pd.read_json(DUMMY_DATA, lines=True)
+    assert len(df.index) == len(raw.index)
+    assert df['experiments'].dtype.name == 'category'
+    assert df['CVR_converted'].dtype.kind == 'i'
+    assert df['CVR_converted'].sum() == raw['CVR_converted'].sum()
+
+
+def test_read_experiment_export_aggregated_while_streaming():
+    df = read_experiment_export(DUMMY_DATA, chunksize=100, aggregate=True, key_columns=['experiments', 'variations'])
+    raw = pd.read_json(DUMMY_DATA, lines=True)
+    expected = raw.groupby(['experiments', 'variations'])['mCVR2_converted'].sum()
+    assert len(df.index) == len(expected)
+    assert df['mCVR2_converted'].sum() == expected.sum()
+
+
+def test_read_experiment_cube_folds_chunks(tmpdir):
+    df = generate_random_cvr_data(5000, 0.3, 0.4, days=10, seed=9)
+    path = str(tmpdir.join('export.csv'))
+    df.to_csv(path, index=False)
+    exp = experiment.from_export(path, chunksize=7, format='csv', segments=['new', 'returning'])
+    assert exp.data is None
+    reference = experiment(df, segments=['new', 'returning'])
+    assert exp.analyze_historically(analyze_segments=True) == reference.analyze_historically(analyze_segments=True)
+
+    cube = read_experiment_cube(DUMMY_DATA, kpis=['CVR'], variations_column='variations', chunksize=100,
+                                filters={'experiments': 'ios-search-by-last-address'})
+    raw = pd.read_json(DUMMY_DATA, lines=True)
+    assert cube.sample_size.sum() == raw[raw['experiments'] == 'ios-search-by-last-address']['CVR_sample_size'].sum()
@@ -0,0 +1,19 @@
+import numpy as np
+from ab_eval.core.planner import get_power, power_grid, sample_size_grid
+from ab_eval.core.utils import get_min_sample_size
+
+
+def test_sample_size_grid_matches_min_sample_size():
+    grid = sample_size_grid([0.1, 0.2, 0.3], [0.01, 0.02], power=[0.8, 0.9], split=[0.5, 0.3])
+    assert len(grid.index) == 24
+    equal = grid[grid['split'] == 0.5]
+    expected = get_min_sample_size(equal['baseline_cvr'].values, equal['expected_uplift'].values, power=equal['power'].values)
+    assert (equal['control_sample_size'].values == np.ceil(expected)).all()
+    assert (grid[grid['split'] == 0.3]['sample_size'].values > equal['sample_size'].values).all()
+    assert np.allclose(get_power(grid['baseline_cvr'].values, grid['expected_uplift'].values, grid['sample_size'].values,
+                                 split=grid['split'].values), grid['power'].values, atol=1e-3)
+
+
+def test_simulated_power_matches_analytic():
+    grid = power_grid(0.2, [0.01, 0.03], [2000, 8000], alternative='larger', simulations=4000, seed=1)
+    assert np.allclose(grid['simulated_power'], grid['power'], atol=0.03)
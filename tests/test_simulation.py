@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+from ab_eval.core.experiment import experiment
+from ab_eval.core.simulation import draw_experiments, simulate_experiments
+from ab_eval.core.statistics import proportions_test
+
+
+def test_aa_false_positive_rate():
+    report = simulate_experiments(20000, 10000, 0.3, 0.3, seed=1, chunk_size=7000)
+    assert abs(report['false_positive_rate'] - 0.05) < 0.01
+    assert simulate_experiments(2000, 10000, 0.3, 0.33, seed=2)['power'] > 0.9
+
+
+def test_draws_evaluate_like_experiment():
+    counts = draw_experiments(3, 5000, 0.3, 0.32, seed=3)
+    p_values = proportions_test(*counts)['p-value']
+    for idx, (conv_variation, n_variation, conv_control, n_control) in enumerate(zip(*counts)):
+        df = pd.DataFrame({'group': ['A', 'B'], 'CVR_converted': [conv_control, conv_variation],
+                           'CVR_sample_size': [n_control, n_variation]})
+        assert np.isclose(experiment(df).get_p_val()['p-value'], p_values[idx])
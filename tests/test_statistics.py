@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from scipy import stats as scs
+from ab_eval.core.statistics import (adjust_p_values, beta_binomial_test, bootstrap_days, bootstrap_proportions, proportions_test,
+                                     sample_ratio_test, welch_test)
+
+
+def test_proportions_test_matches_statsmodels():
+    sm = pytest.importorskip('statsmodels.api')
+    conv_variation, n_variation = np.array([30, 120, 7]), np.array([100, 400, 50])
+    conv_control, n_control = np.array([25, 100, 9]), np.array([90, 410, 45])
+    for alternative in ['two-sided', 'larger', 'smaller']:
+        stats = proportions_test(conv_variation, n_variation, conv_control, n_control, alternative=alternative)
+        for i in range(3):
+            zscore, pval = sm.stats.proportions_ztest([conv_variation[i], conv_control[i]], [n_variation[i], n_control[i]],
+                                                      alternative=alternative)
+            assert stats['z-score'][i] == zscore
+            assert stats['p-value'][i] == pval
+
+
+def test_proportions_test_confidence_interval_contains_uplift():
+    stats = proportions_test([30, 120], [100, 400], [25, 100], [90, 410])
+    assert (stats['lower_limit'] < stats['relative_conversion_uplift']).all()
+    assert (stats['relative_conversion_uplift'] < stats['upper_limit']).all()
+
+
+def test_welch_test_matches_scipy():
+    rng = np.random.default_rng(0)
+    variation, control = rng.gamma(2, 11, 400), rng.gamma(2, 10, 500)
+    for alternative, scipy_alternative in [('two-sided', 'two-sided'), ('larger', 'greater'), ('smaller', 'less')]:
+        stats = welch_test(variation.sum(), len(variation), (variation ** 2).sum(), control.sum(), len(control), (control ** 2).sum(),
+                           alternative=alternative)
+        reference = scs.ttest_ind(variation, control, equal_var=False)
+        assert np.isclose(stats['t-score'], reference.statistic)
+        assert np.isclose(stats['p-value'], scs.ttest_ind(variation, control, equal_var=False, alternative=scipy_alternative).pvalue)
+    assert stats['lower_limit'] < stats['relative_uplift'] < stats['upper_limit']
+
+
+def test_beta_binomial_test_matches_sampling():
+    rng = np.random.default_rng(0)
+    conv_variation, n_variation = np.array([30, 120, 7, 995, 1400]), np.array([100, 400, 50, 1000, 3000])
+    conv_control, n_control = np.array([25, 100, 9, 990, 1300]), np.array([90, 410, 45, 1000, 3000])
+    exact = beta_binomial_test(conv_variation, n_variation, conv_control, n_control)
+    sampled = beta_binomial_test(conv_variation[-2:], n_variation[-2:], conv_control[-2:], n_control[-2:], max_terms=0)
+    # the posterior of 5 non-conversions is too small for the sampling approximation and is integrated instead
+    assert exact['exact'].all() and list(sampled['exact']) == [True, False]
+    for i in range(5):
+        variation = rng.beta(conv_variation[i] + 1, n_variation[i] - conv_variation[i] + 1, 1000000)
+        control = rng.beta(conv_control[i] + 1, n_control[i] - conv_control[i] + 1, 1000000)
+        assert abs(exact['probability_to_beat_control'][i] - (variation > control).mean()) < 0.002
+        assert np.isclose(exact['expected_loss_variation'][i], np.maximum(control - variation, 0).mean(), rtol=0.01, atol=1e-5)
+        assert np.isclose(exact['expected_loss_control'][i], np.maximum(variation - control, 0).mean(), rtol=0.01, atol=1e-5)
+    assert np.allclose(sampled['probability_to_beat_control'], exact['probability_to_beat_control'][-2:], atol=0.005)
+    assert np.allclose(sampled['expected_loss_control'], exact['expected_loss_control'][-2:], rtol=0.02)
+    # the draws of a comparison do not depend on the others
+    alone = beta_binomial_test(conv_variation[-1:], n_variation[-1:], conv_control[-1:], n_control[-1:], max_terms=0)
+    assert alone['probability_to_beat_control'][0] == sampled['probability_to_beat_control'][1]
+
+
+def test_beta_binomial_test_with_jeffreys_prior_matches_integration():
+    integrate = pytest.importorskip('scipy.integrate')
+    conv_variation, n_variation = np.array([0, 1, 7, 350]), np.array([50, 20, 45, 4100])
+    conv_control, n_control = np.array([2, 0, 3, 300]), np.array([50, 20, 40, 4000])
+    stats = beta_binomial_test(conv_variation, n_variation, conv_control, n_control, prior=(0.5, 0.5))
+    assert stats['exact'].all()
+    for i in range(4):
+        variation = scs.beta(conv_variation[i] + 0.5, n_variation[i] - conv_variation[i] + 0.5)
+        control = scs.beta(conv_control[i] + 0.5, n_control[i] - conv_control[i] + 0.5)
+        points = [variation.mean(), control.mean()]
+        beats = integrate.quad(lambda x: control.pdf(x) * variation.sf(x), 0, 1, points=points, limit=500)[0]
+        loss_variation = integrate.quad(lambda x: variation.cdf(x) * control.sf(x), 0, 1, points=points, limit=500)[0]
+        loss_control = integrate.quad(lambda x: control.cdf(x) * variation.sf(x), 0, 1, points=points, limit=500)[0]
+        assert np.isclose(stats['probability_to_beat_control'][i], beats, atol=1e-6)
+        assert np.isclose(stats['expected_loss_variation'][i], loss_variation, rtol=1e-4, atol=1e-8)
+        assert np.isclose(stats['expected_loss_control'][i], loss_control, rtol=1e-4, atol=1e-8)
+
+
+def test_bootstrap_limits_match_numpy_quantiles():
+    conv_variation, n_variation = np.array([30, 120, 0]), np.array([100, 400, 50])
+    conv_control, n_control = np.array([25, 100, 0]), np.array([90, 410, 45])
+    stats = bootstrap_proportions(conv_variation, n_variation, conv_control, n_control, n_resamples=999, chunk_size=100)
+    parallel = bootstrap_proportions(conv_variation, n_variation, conv_control, n_control, n_resamples=999, chunk_size=100, n_workers=3)
+    assert np.array_equal(parallel['lower_limit'], stats['lower_limit'], equal_nan=True)
+    uplifts = []
+    for seed in np.random.SeedSequence(0).spawn(10):
+        rng = np.random.default_rng(seed)
+        size = 99 if len(uplifts) == 9 else 100
+        variation = rng.binomial(n_variation[:, None], (conv_variation / n_variation)[:, None], (3, size))
+        control = rng.binomial(n_control[:, None], (conv_control / n_control)[:, None], (3, size))
+        with np.errstate(invalid='ignore'):
+            uplifts.append((variation * n_control[:, None]) / (control * n_variation[:, None]) - 1.)
+    reference = np.quantile(np.concatenate(uplifts, axis=1)[:2], [0.025, 0.975], axis=1)
+    assert np.array_equal(np.stack([stats['lower_limit'][:2], stats['upper_limit'][:2]]), reference)
+    assert np.isnan(stats['lower_limit'][2]) and np.isnan(stats['upper_limit'][2])
+
+
+def test_bootstrap_days_does_not_depend_on_workers():
+    rng = np.random.default_rng(1)
+    conversions, sizes = rng.binomial(500, [[0.1], [0.12]], (2, 14)).astype(float), np.full(14, 500.)
+    stats = bootstrap_days(conversions[1], sizes, conversions[0], sizes, chunk_size=300)
+    assert stats['lower_limit'] < stats['relative_uplift'] < stats['upper_limit']
+    parallel = bootstrap_days(conversions[1], sizes, conversions[0], sizes, chunk_size=300, n_workers=4)
+    assert parallel['lower_limit'] == stats['lower_limit'] and parallel['upper_limit'] == stats['upper_limit']
+
+
+def test_sample_ratio_test_matches_scipy():
+    sizes = np.array([[[500, 520], [480, 610]], [[0, 0], [300, 900]]])
+    stats = sample_ratio_test(sizes, expected_ratios=[0.4, 0.6])
+    for index in [(0, 0), (0, 1), (1, 1)]:
+        reference = scs.chisquare(sizes[index], sizes[index].sum() * np.array([0.4, 0.6]))
+        assert np.isclose(stats['chi-square'][index], reference.statistic) and np.isclose(stats['p-value'][index], reference.pvalue)
+    assert np.isnan(stats['p-value'][1, 0])
+
+
+def test_adjust_p_values():
+    p_values = np.array([[0.01, 0.04, 0.03, np.nan], [0.2, 0.001, 0.5, 0.04]])
+    assert np.allclose(adjust_p_values(p_values, 'bonferroni')[0, :3], [0.03, 0.12, 0.09])
+    assert np.allclose(adjust_p_values(p_values, 'holm')[0, :3], [0.03, 0.06, 0.06])
+    assert np.allclose(adjust_p_values(p_values, 'fdr_bh')[1], [0.8 / 3, 0.004, 0.5, 0.08])
+    assert np.isnan(adjust_p_values(p_values, 'holm')[0, 3])
+    multitest = pytest.importorskip('statsmodels.stats.multitest')
+    for method in ['bonferroni', 'holm', 'fdr_bh']:
+        assert np.allclose(adjust_p_values(p_values[1], method), multitest.multipletests(p_values[1], method=method)[1])
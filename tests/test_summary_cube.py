@@ -0,0 +1,77 @@
+import os
+import pickle
+import numpy as np
+from ab_eval.core.summary_cube import summary_cube
+from ab_eval.core.utils import generate_random_cvr_data, generate_random_sessions, get_test_summary
+
+
+def test_cube_counts_match_test_summary():
+    df = generate_random_cvr_data(1000, 0.3, 0.5, days=10)
+    cube = summary_cube.from_dataframe(df, kpis=['CVR', 'mCVR1'])
+    df1 = get_test_summary(df, 'mCVR1', segment='new')
+    (conv_a, n_a), (conv_b, n_b) = cube.get_group_counts('mCVR1', ['A', 'B'], segment='new')
+    assert conv_a == df1['mCVR1'].A and n_a == df1['total'].A
+    assert conv_b == df1['mCVR1'].B and n_b == df1['total'].B
+
+
+def test_cube_counts_up_to_date():
+    df = generate_random_cvr_data(1000, 0.3, 0.5, days=10)
+    df['date'] = df['date'].astype(str)
+    cube = summary_cube.from_dataframe(df, kpis=['CVR'])
+    converted, sample_size = cube.get_counts('CVR', date='2018-01-03')
+    assert sample_size.sum() == df[df['date'] <= '2018-01-03']['CVR_sample_size'].sum()
+
+
+def test_cube_cumulative_counts():
+    df = generate_random_cvr_data(1000, 0.3, 0.5, days=10)
+    df['date'] = df['date'].astype(str)
+    cube = summary_cube.from_dataframe(df, kpis=['CVR'])
+    converted, sample_size = cube.get_cumulative_counts('CVR', segment='new')
+    for idx, date in enumerate(cube.get_dates()):
+        assert (converted[:, idx] == cube.get_counts('CVR', segment='new', date=date)[0]).all()
+    assert sample_size[:, -1].sum() == df[df['segment'] == 'new']['CVR_sample_size'].sum()
+
+
+def test_cube_date_windows():
+    df = generate_random_cvr_data(1000, 0.3, 0.5, days=10, seed=1)
+    df['date'] = df['date'].astype(str)
+    cube = summary_cube.from_dataframe(df, kpis=['CVR'])
+    _, sample_size = cube.get_counts('CVR', start_date='2018-01-03', date='2018-01-05')
+    assert sample_size.sum() == df[(df['date'] >= '2018-01-03') & (df['date'] <= '2018-01-05')]['CVR_sample_size'].sum()
+    assert (cube.get_counts('CVR', date='2018-01-05', window=3)[1] == sample_size).all()
+
+    positions = cube.get_history_positions()
+    _, daily = cube.get_history_counts('CVR', positions, cumulative=False)
+    _, rolling = cube.get_history_counts('CVR', positions, window=2)
+    for idx, date in enumerate(cube.get_dates()[positions]):
+        assert daily[:, idx].sum() == df[df['date'] == date]['CVR_sample_size'].sum()
+        assert (rolling[:, idx] == cube.get_counts('CVR', date=date, window=2)[1]).all()
+
+
+def test_cube_from_sessions():
+    sessions = generate_random_sessions(5000, 0.3, 0.5, days=5, seed=3)
+    cube = summary_cube.from_sessions(sessions, kpis=['CVR', 'mCVR1'])
+    aggregated = summary_cube.from_dataframe(cube.to_dataframe(), kpis=['CVR', 'mCVR1'])
+    (conv_a, n_a), _ = cube.get_group_counts('mCVR1', ['A', 'B'], segment='new', date='2018-01-03')
+    assert n_a == ((sessions['group'] == 'A') & (sessions['segment'] == 'new') & (sessions['date'].astype(str) <= '2018-01-03')).sum()
+    assert (aggregated.sample_size == cube.sample_size).all() and (aggregated.converted == cube.converted).all()
+    assert (get_test_summary(sessions, 'CVR') == get_test_summary(cube.to_dataframe(), 'CVR')).all().all()
+
+
+def test_cube_store_round_trip(tmpdir):
+    df = generate_random_cvr_data(1000, 0.3, 0.5, days=10, seed=2)
+    cube = summary_cube.from_dataframe(df, kpis=['CVR', 'mCVR1'])
+    cube.save(str(tmpdir))
+    stored = summary_cube.load(str(tmpdir))
+    assert isinstance(stored.sample_size, np.memmap) and stored.sample_size.dtype == np.int64
+    assert (stored.sample_size == cube.sample_size).all() and stored.kpis == cube.kpis
+    stored_counts = stored.get_counts('CVR', segment='new', start_date='2018-01-03', date='2018-01-05')[0]
+    assert (stored_counts == cube.get_counts('CVR', segment='new', start_date='2018-01-03', date='2018-01-05')[0]).all()
+    assert isinstance(pickle.loads(pickle.dumps(stored)).converted, np.memmap)
+
+    # an overwrite switches to a new set of arrays, the mapped previous version stays readable
+    other = summary_cube.from_dataframe(generate_random_cvr_data(3000, 0.3, 0.5, days=10, seed=3), kpis=['CVR', 'mCVR1'])
+    other.save(str(tmpdir))
+    assert (stored.sample_size == cube.sample_size).all()
+    assert (summary_cube.load(str(tmpdir)).sample_size == other.sample_size).all()
+    assert len([name for name in os.listdir(str(tmpdir)) if name.startswith('arrays-')]) == 1
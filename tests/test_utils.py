@@ -1,5 +1,5 @@
 from ab_eval.core.utils import generate_random_cvr_data, get_segments_sample_size, get_test_summary, get_z_val,\
-    get_confidence_interval_single_variation
+    get_confidence_interval_single_variation, generate_random_sessions
 
 
 def test_get_segments_sample_size_without_segment():
@@ -25,3 +25,21 @@ def test_z_val():
 
 def test_confidence_interval():
     assert get_confidence_interval_single_variation() == (-1.959963984540054, 1.959963984540054)
+
+
+def test_generate_random_cvr_data_is_seedable():
+    df1 = generate_random_cvr_data(1000, 0.3, 0.5, days=10, seed=42)
+    df2 = generate_random_cvr_data(1000, 0.3, 0.5, days=10, seed=42)
+    assert df1.equals(df2)
+
+
+def test_generate_random_cvr_data_aggregated_mode():
+    df = generate_random_cvr_data(1000, 0.3, 0.5, days=10, mode='aggregated', seed=1)
+    assert get_segments_sample_size(df, 'CVR') == 1000
+    assert (df['CVR_converted'] <= df['CVR_sample_size']).all()
+
+
+def test_generate_random_sessions():
+    df = generate_random_sessions(1000, 0.3, 0.5, days=10, seed=1)
+    assert len(df.index) == 1000
+    assert df['date'].nunique() == 10